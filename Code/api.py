@@ -1,23 +1,48 @@
 """
     This script:
-    1. loads the FAISS index from file.
-    2. Creates embedding of User Input ingredients.
+    1. loads the FAISS index from file (IndexHolder, index_store.py; new versions swap in without a restart).
+    2. Creates embedding of User Input ingredients (or asks embedding_service.py).
     3. The dense embedding vector is then matched with the FAISS Index.
     4. The top 5 vectors are finalized.
     5. DB lookup for this is returned based on the id.
     6. Ranking of results based on nearest match.
+    7. Falls back to an AI recipe (Ollama) when nothing matches well; /search/stream and
+       /surprise/stream stream it while it is written.
+    8. Serves /health, /ready, /metrics and the /admin endpoints.
 
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from collections import OrderedDict
+import contextvars
+from contextlib import ExitStack
+import copy
+import gc
 import os
+import threading
+import time
 from config_reader import fetch_config_dict
+from deadline import Deadline, DeadlineExceeded
 import psycopg2
-from sentence_transformers import SentenceTransformer
-import numpy as np
-import faiss
+from psycopg2.pool import ThreadedConnectionPool
 import re
-from cli_fetch_recipe_ai import generate_recipe, generate_recipe_from_theme
+from embedding_backend import MODEL_NAME, load_encoder
+from embedding_client import EmbeddingServiceClient
+from index_store import IndexHolder, UnknownVersion, check_version
+from llm_queue import LlmBusy, LlmQueue
+from metrics import (AI_FALLBACKS, DB_POOL_IN_USE, DB_POOL_SIZE, INDEX_VECTORS, SEARCH_SECONDS, cache_lookup,
+                     render_metrics, track_stage)
+from ranking import normalize_terms, rank_rows
+from retrieval import (INDEX_EXTENSIONS, RetrievalSettings, filter_mask, prepare_query, search_index,
+                       search_recipes)
+from recipe_metadata import RecipeFilter
+from request_profiler import RequestProfiler
+from singleflight import SingleFlight
+import tracing
+from tracing import span
+from cli_fetch_recipe_ai import (MODEL_TAG, OLLAMA_COMMAND, OUTPUT_FORMAT, generate_recipe, generate_recipe_from_theme, parse_recipe,
+                                 profile_from_config, stream_recipe, stream_recipe_from_theme)
+from recipe_stream import NDJSON, SSE, RecipeStreamParser, format_event
 import fetch_images
 
 # Initialize Flask app
@@ -26,35 +51,198 @@ app = Flask(__name__)
 # Load configuration
 config_dict = fetch_config_dict()
 
-# Initialize model to generate embeddings
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-# Load FAISS index and recipe IDs
+# Index location
 base_directory = config_dict.get('base_directory', '')
 index_folder = config_dict.get('index_directory', '')
 index_path = os.path.join(base_directory, index_folder)
 
-faiss_index = faiss.read_index(os.path.join(index_path, "recipe_index.faiss"))
-recipe_ids = np.load(os.path.join(index_path, "recipe_ids.npy"))
+startup_mode = config_dict.get("startup_mode", 'eager').strip().lower()
+index_watch_interval = float(config_dict.get("index_watch_interval", '0'))
 return_by_ai = bool(int(config_dict.get("return_by_ai", '0')))
+retrieval_settings = RetrievalSettings.from_config(config_dict)
+
+# Ollama CLI model, command line, constrained output format and generation profile ([LLM])
+llm_options = {"model": config_dict.get("model", MODEL_TAG),
+               "ollama_command": config_dict.get("ollama_command", OLLAMA_COMMAND),
+               "output_format": config_dict.get("llm_output_format", OUTPUT_FORMAT).strip().lower(),
+               "profile": profile_from_config(config_dict)}
+
+# Latency budget of /search (0 = none)
+search_budget_ms = float(config_dict.get("search_budget_ms", '0'))
+image_timeout = float(config_dict.get("image_timeout_ms", '1500')) / 1000.0
+fallback_image_url = config_dict.get("fallback_image_url", "").strip()
+ai_min_remaining = float(config_dict.get("ai_min_remaining_ms", '5000')) / 1000.0
+ai_cache_size = int(config_dict.get("ai_cache_size", '256'))
+
+# Concurrency limit and wait queue of Ollama runs in this worker ([LLM]): llm_concurrency runs at once,
+# identical prompts in flight share one run, and when llm_queue_size callers already wait /surprise
+# answers 503 with Retry-After and /search returns its non-AI matches with "ai_fallback" in "degraded".
+llm_queue = LlmQueue.from_config(config_dict)
+llm_retry_after = config_dict.get("llm_retry_after", '5')
+
+# AI recipes generated after their request ran out of budget, keyed by normalized ingredients
+ai_recipe_cache = OrderedDict()
+_ai_pending = set()
+_ai_lock = threading.Lock()
+
+# DB connections of this worker (created on first use, so forked workers never share them)
+db_pool_size = int(config_dict.get("db_pool_size", '10'))
+db_pool = None
+_db_pool_slots = threading.BoundedSemaphore(db_pool_size)
+_db_pool_lock = threading.Lock()
+DB_POOL_SIZE.set(db_pool_size)
+
+# /search runs in flight, keyed by search_key
+search_flights = SingleFlight("search")
+
+# Opt-in request profiling: stage timings and folded stacks of sampled and slow /search and
+# /surprise requests, served by /admin/profiles (request_profiler.py)
+profiler = RequestProfiler.from_config(config_dict)
+PROFILED_ENDPOINTS = ("search", "surprise")
+
+# Opt-in request tracing ([TRACING]): a span tree per sampled request (stages, DB, Ollama, Unsplash,
+# embedding service), trace id in X-Request-ID; an incoming sampled traceparent is always continued.
+tracing.configure(config_dict, "recipe-api")
+
+# Shared embedding + retrieval service (None = always in process); it owns the model and index for
+# all workers, and a worker loads its own copy only while the service is down.
+embedding_service = EmbeddingServiceClient.from_config(config_dict)
+
+# Set by warm_up() / load_local()
+model = None
+index_holder = None
+component_load_times = {}
+warmup_error = None
+warmed_up = threading.Event()
+local_loaded = threading.Event()
+_warmup_lock = threading.Lock()
+
+
+# Load the model and the index in this process
+def load_local():
+    """
+    Loads the embedding model (torch, torch_int8 or onnx, see embedding_backend.py) and the
+    FAISS index with its artifacts, recording each component's load time in seconds.
+    Only the first call loads; later calls return at once.
+    """
+    global model, index_holder, warmup_error
+    with _warmup_lock:
+        if local_loaded.is_set():
+            return
+        started = time.perf_counter()
+        try:
+            model = load_encoder(config_dict)
+            model.encode("warm up")  # first call pays for lazy initialisation, not the first user
+            component_load_times["embedding_model"] = time.perf_counter() - started
+
+            index_holder = IndexHolder(index_path,
+                                       model_name=MODEL_NAME,
+                                       verify=bool(int(config_dict.get("verify_index_checksums", '1'))),
+                                       extensions=INDEX_EXTENSIONS)
+            component_load_times.update(index_holder.get().load_times)
+            index_holder.start_watcher(index_watch_interval)
+        except Exception as e:
+            warmup_error = str(e)
+            raise
+
+        component_load_times["total"] = time.perf_counter() - started
+        INDEX_VECTORS.set(index_holder.get().faiss_index.ntotal)
+        local_loaded.set()
+        print(f"FAISS index version {index_holder.get().version} and recipe IDs loaded successfully.")
+        print("Load times (s):", {name: round(seconds, 3) for name, seconds in component_load_times.items()})
+
+# Get ready to serve
+def warm_up():
+    """
+    With a reachable embedding service nothing is loaded here (load_local runs on the first
+    fallback); otherwise loads the model and index in this process.
+    """
+    if embedding_service is not None and embedding_service.ready():
+        print(f"Using embedding service at {embedding_service.url}.")
+    else:
+        load_local()
+    warmed_up.set()
 
-print("FAISS index and recipe IDs loaded successfully.")
+# Warm up in the background
+def _warm_up_in_background():
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+# Restart the watcher thread in forked workers
+def _after_fork_in_child():
+    global db_pool
+    db_pool = None
+    if index_holder is not None:
+        index_holder.start_watcher(index_watch_interval)
+
+
+# Startup (startup_mode):
+# eager -> the embedding model (torch / onnxruntime are imported here) and the index load at import.
+#          With prefork = 1 this happens once in the parent, e.g.
+#          `gunicorn --preload -w 4 -b 0.0.0.0:5000 api:app`, and workers share it copy-on-write.
+# lazy  -> the app serves at once and warms up in a background thread; requests get 503
+#          until /ready answers 200. /health answers as soon as the process is up.
+if startup_mode == "lazy":
+    threading.Thread(target=_warm_up_in_background, name="warm-up", daemon=True).start()
+else:
+    warm_up()
+    if bool(int(config_dict.get("prefork", '0'))):
+        # Loaded objects go to the permanent GC generation, so collections in the workers
+        # do not touch (and copy) the pages shared with the parent.
+        gc.freeze()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
 
 
 # Connect to Database
-def create_connection():
+def acquire_connection(deadline=None):
     """
-    Creates a connection to the database and returns the connection object.
+    Takes a connection from this worker's pool, waiting (within the deadline) while all
+    db_pool_size connections are in use. Give it back with release_connection.
     """
-    conn = psycopg2.connect(
-        dbname=config_dict["dbname"],
-        user=config_dict["user"],
-        password=config_dict["password"],
-        host=config_dict["host"],
-        port=config_dict["port"]
-    )
+    global db_pool
+    with _db_pool_lock:
+        if db_pool is None:
+            db_pool = ThreadedConnectionPool(
+                0, db_pool_size,
+                dbname=config_dict["dbname"],
+                user=config_dict["user"],
+                password=config_dict["password"],
+                host=config_dict["host"],
+                port=config_dict["port"]
+            )
+
+    timeout = deadline.timeout() if deadline is not None else None
+    with span("db.acquire", pool_size=db_pool_size):
+        if not _db_pool_slots.acquire(timeout=-1 if timeout is None else timeout):
+            raise DeadlineExceeded("database")
+        try:
+            conn = db_pool.getconn()
+        except Exception:
+            _db_pool_slots.release()
+            raise
+    DB_POOL_IN_USE.inc()
     return conn
 
+# Return a connection to the pool
+def release_connection(conn):
+    """
+    Ends any open transaction and returns the connection; broken connections are closed.
+    """
+    try:
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        db_pool.putconn(conn, close=broken)
+    finally:
+        DB_POOL_IN_USE.dec()
+        _db_pool_slots.release()
+
 
 
 # Preprocess user input
@@ -70,12 +258,16 @@ def preprocess_ingredients(ingredients):
     return []
 
 # Generate embedding on user input
-def generate_embedding(ingredients):
+def generate_embedding(ingredients, deadline=None):
     """
     Generates a dense embedding for a list of ingredients.
     """
-    processed_ingredients = preprocess_ingredients(ingredients)
-    embedding = model.encode(" ".join(processed_ingredients))
+    if deadline is not None:
+        deadline.check("embedding")
+    with track_stage("preprocess"):
+        processed_ingredients = preprocess_ingredients(ingredients)
+    with track_stage("encode"):
+        embedding = model.encode(" ".join(processed_ingredients))
     return embedding
 
 # Query FAISS
@@ -83,16 +275,17 @@ def query_faiss(user_embedding, index, recipe_ids, top_k=15):
     """
     Queries the FAISS index to find the top-k closest matches.
     """
-    distances, indices = index.search(np.array([user_embedding]), k=top_k)
-    
+    positions, distances = search_index(user_embedding, index, top_k)
+
     # Map FAISS indices to recipe IDs
-    matching_recipe_ids = recipe_ids[indices.flatten()]
-    return matching_recipe_ids, distances.flatten()
+    matching_recipe_ids = recipe_ids[positions]
+    return matching_recipe_ids, distances
 
 # Fetch matching recipes from the database
-def fetch_matching_recipes(recipe_ids, conn):
+def fetch_matching_recipes(recipe_ids, conn, deadline=None):
     """
     Fetches detailed information for matching recipes from the database.
+    With a deadline the query gets the remaining budget as statement_timeout.
     """
     try:
         # Convert recipe IDs to integers
@@ -106,50 +299,26 @@ def fetch_matching_recipes(recipe_ids, conn):
         """
 
         # Execute the query
-        with conn.cursor() as cur:
+        with track_stage("db_fetch", requested=len(recipe_ids)) as stage_span, conn.cursor() as cur:
+            if deadline is not None and deadline.budget is not None:
+                deadline.check("database")
+                cur.execute("SET LOCAL statement_timeout = %s", (max(1, int(deadline.remaining() * 1000)),))
             cur.execute(query, (list(recipe_ids),))
             results = cur.fetchall()
+            stage_span.set("rows", len(results))
 
         return results
+    except psycopg2.errors.QueryCanceled:
+        conn.rollback()
+        raise DeadlineExceeded("database")
     except Exception as e:
         print(f"Error fetching matching recipes: {e}")
         raise
 
-# Rank results based on substring match
-def ranked_results(results, user_input):
-    """
-    Ranks the results based on how many user input ingredients appear as substrings in each recipe's ingredient list.
-    """
-    # Preprocess user input: Remove spaces, hyphens, and convert to lowercase
-    user_input = [ingredient.lower().replace(" ", "").replace("-", "") for ingredient in user_input]
-    ai_flag_list = []
-    # Initialize a dictionary to store match counts
-    ranked_idx = {}
-    for idx, result in enumerate(results):
-        # Extract and preprocess the ingredient list from the result
-        ingredient_list = result[-2]  # Assuming ingredients are in the second-to-last column
-        ingredient_string = "".join(ingredient_list).lower().replace(" ", "").replace("-", "")
-
-        # Count matches using substring search
-        match_counter = sum(1 for user_ingredient in user_input if user_ingredient in ingredient_string)
-        ranked_idx[idx] = match_counter
-        ai_flag_list.append(match_counter)
-    
-    if return_by_ai:
-        # If no exact match is found then we get data using AI
-        ai_flag_list_shortened = list(set(ai_flag_list))
-        if ai_flag_list_shortened == [0]:
-            return True # Return True for AI generated response.
-    # Sort the results by match count in descending order
-    sorted_indices = sorted(ranked_idx.keys(), key=lambda x: ranked_idx[x], reverse=True)
-
-    # Return the sorted results
-    sorted_results = [results[i] for i in sorted_indices]
-    return sorted_results
 # Write URL to DB
 def upload_url_to_db(primary_id, url, conn):
     try:
-        with conn.cursor() as cur:
+        with span("db.update_image_url", recipe_id=primary_id), conn.cursor() as cur:
             cur.execute(
                 """
                 UPDATE recipes
@@ -165,12 +334,33 @@ def upload_url_to_db(primary_id, url, conn):
         conn.rollback()                    # undo partial work
         raise                              
 
+# Fetch an image within the budget
+def image_within_budget(name, deadline, degraded):
+    """
+        Unsplash URL for name, or (None, fallback_image_url) when the budget is spent or the
+        lookup fails under a deadline; "images" is then added to degraded.
+        Returns (fetched url or None, url to show).
+    """
+    if deadline is None or deadline.budget is None:
+        url = fetch_images.main(name)
+        return url, url
+    if not deadline.expired():
+        try:
+            url = fetch_images.main(name, timeout=deadline.timeout(cap=image_timeout))
+            return url, url
+        except Exception as e:
+            print(f"Image lookup for {name!r} skipped: {e}")
+    if "images" not in degraded:
+        degraded.append("images")
+    return None, fallback_image_url
+
 # Clean FAISS response
-def clean_faiss_response(input_json, conn):
+def clean_faiss_response(input_json, conn, deadline=None, degraded=None):
     """
         Match keys. Add for cuisine and image url. 
     """
     results = input_json.get("results", [])
+    degraded = degraded if degraded is not None else []
 
     for each_result in results:
         
@@ -178,10 +368,11 @@ def clean_faiss_response(input_json, conn):
             pass
 
         elif each_result.get("image_url", "") in ["", None]:
-            each_result["image_url"] = fetch_images.main(each_result["name"])
+            fetched_url, each_result["image_url"] = image_within_budget(each_result["name"], deadline, degraded)
 
-            # Write to DB
-            upload_url_to_db(each_result['id'], each_result["image_url"], conn)
+            # Write to DB (fallback images are not stored)
+            if fetched_url is not None:
+                upload_url_to_db(each_result['id'], fetched_url, conn)
         each_result["cuisine"] = ""
 
         if isinstance(each_result.get("nutrition", []), list) and len(each_result.get("nutrition", [])) == 7:
@@ -199,7 +390,7 @@ def clean_faiss_response(input_json, conn):
     return input_json
 
 # Clean the AI response
-def clean_ai_response(input_json):
+def clean_ai_response(input_json, deadline=None, degraded=None):
     """
         1. Convert outer dict to list.
         2. Match key names.
@@ -225,11 +416,60 @@ def clean_ai_response(input_json):
     recipe_dict["ingredients"] = ingredients_list
     # recipe_dict["image_url"] = recipe_dict.get("image_url", "")
     if recipe_dict['image_url'].strip() == "":
-        recipe_dict["image_url"] = fetch_images.main(recipe_dict["name"])
+        _, recipe_dict["image_url"] = image_within_budget(recipe_dict["name"], deadline,
+                                                          degraded if degraded is not None else [])
 
     input_json["results"] = [recipe_dict]
     return input_json
 
+# Key of an AI recipe in the cache
+def _ai_cache_key(user_input):
+    return tuple(sorted(set(normalize_terms(user_input))))
+
+# Cached AI recipe
+def cached_ai_recipe(user_input):
+    """
+        A copy of the AI recipe generated in the background for these ingredients, or None.
+    """
+    key = _ai_cache_key(user_input)
+    with _ai_lock:
+        recipe = ai_recipe_cache.get(key)
+        cache_lookup("ai_recipes", recipe is not None)
+        if recipe is None:
+            return None
+        ai_recipe_cache.move_to_end(key)
+    return copy.deepcopy(recipe)
+
+# Generate an AI recipe after the request
+def generate_ai_recipe_in_background(user_input):
+    """
+        Generates the AI recipe for these ingredients in a thread and caches it.
+        At most one generation runs per ingredient set.
+    """
+    key = _ai_cache_key(user_input)
+    with _ai_lock:
+        if key in _ai_pending or key in ai_recipe_cache:
+            return
+        _ai_pending.add(key)
+
+    def run():
+        try:
+            with span("ai_fallback.background"):
+                recipe = llm_queue.run(("recipe", key), generate_recipe, ingredients=list(user_input), **llm_options)
+            with _ai_lock:
+                ai_recipe_cache[key] = recipe
+                while len(ai_recipe_cache) > ai_cache_size:
+                    ai_recipe_cache.popitem(last=False)
+        except Exception as e:
+            print(f"Background AI recipe for {list(key)} failed: {e}")
+        finally:
+            with _ai_lock:
+                _ai_pending.discard(key)
+
+    # The generation stays in the request's trace (as a span ending after the request).
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), name="ai-recipe", daemon=True).start()
+
 # Define the surprise endpoint
 @app.route('/surprise', methods=['GET'])
 def surprise():
@@ -244,10 +484,14 @@ def surprise():
         print("Received user input:", user_input)
 
 
-        ai_recipe = generate_recipe_from_theme(theme = user_input)
+        # Identical themes in flight share one generation.
+        ai_recipe = llm_queue.run(("theme", user_input.strip().lower()), generate_recipe_from_theme,
+                                  theme = user_input, **llm_options)
             
         return jsonify(clean_ai_response({"results": ai_recipe})), 200 # return list to handle.
 
+    except LlmBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": llm_retry_after}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -255,31 +499,160 @@ def surprise():
 # Define the search endpoint
 @app.route('/search', methods=['GET'])
 def search():
+    started = time.perf_counter()
+    # Identical searches in flight at once share one run (and its answer).
+    (body, status), shared = search_flights.do(search_key(request.args), run_search, request.args)
+    if shared:
+        tracing.current_span().set("singleflight.shared", True)
+    SEARCH_SECONDS.labels(str(status)).observe(time.perf_counter() - started)
+    return jsonify(body), status
+
+# Key of identical searches
+def search_key(args):
+    """
+        Query parameters by name, ingredients case- and whitespace-insensitive (order kept:
+        it changes the embedding).
+    """
+    return tuple((name, tuple(value.strip().lower() if name == "ingredients" else value
+                              for value in args.getlist(name)))
+                 for name in sorted(args))
+
+# Answer one /search
+def run_search(args, stream_ai=False):
+    """
+        (JSON body, HTTP status) of a /search with these query parameters.
+        With search_budget_ms set it answers within that budget (deadline.py): a late DB fetch
+        gives 504, late images get fallback_image_url and an AI recipe that does not fit is
+        generated in the background and served from cache on the next identical search.
+        Skipped stages are listed in the response's "degraded" field.
+        With stream_ai, an AI recipe that is not cached is left to the caller: the body is then
+        {"ai_stream": True, "results": [weak matches], "search_stages": [...]}, the matches
+        formatted but without images, for when the caller cannot stream (LLM queue full).
+    """
+    # Budget of this request, started before any work
+    deadline = Deadline(search_budget_ms)
+    degraded = []
+    conn = None
     try:
         # Get user input ingredients from query parameters
-        user_input = request.args.getlist('ingredients')
+        user_input = args.getlist('ingredients')
         if not user_input:
-            return jsonify({"error": "No ingredients provided"}), 400
-
-        print("Received user input:", user_input)
+            return {"error": "No ingredients provided"}, 400
 
-        # Generate embedding for user input
-        user_embedding = generate_embedding(user_input)
+        # Optional filters: max_time, tags, min_/max_<nutrient>
+        try:
+            recipe_filter = RecipeFilter.from_args(args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-        # Query FAISS
-        matching_recipe_ids, _ = query_faiss(user_embedding, faiss_index, recipe_ids, top_k=25)
+        print("Received user input:", user_input)
 
-        # Fetch results from DB
-        conn = create_connection()
-        results = fetch_matching_recipes(matching_recipe_ids, conn)
-        
+        # Dense (+ BM25 in hybrid mode) and exact ingredient matches, ranked on precomputed tokens and
+        # widened stage by stage while matches are weak: in the embedding service when it is up.
+        found = embedding_service.retrieve(args) if embedding_service is not None else None
+        tracing.current_span().set("retrieval", "in_process" if found is None else "embedding_service")
+        if found is not None and "error" in found:
+            return {"error": found["error"]}, 400
+
+        legacy_positions = None
+        if found is None:
+            # In process (the snapshot stays valid for this request even if a reload swaps it)
+            load_local()
+            snapshot = index_holder.get()
+
+            # Filters become a mask over FAISS positions applied inside retrieval.
+            try:
+                mask = filter_mask(snapshot, recipe_filter)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+
+            if mask is not None and not mask.any():
+                found = {"filtered_out": True}
+            else:
+                # Generate embedding for user input (normalized for cosine indexes)
+                user_embedding = prepare_query(snapshot.faiss_index, generate_embedding(user_input, deadline))
+                if snapshot.extras.get("ranking") is not None:
+                    result = search_recipes(snapshot, user_embedding, user_input, retrieval_settings, mask)
+                    found = {"recipe_ids": result.recipe_ids, "weak": result.weak, "search_stages": result.stages}
+                else:
+                    # Index without ingredient tokens: rank the DB rows of the FAISS top_k.
+                    positions, _ = search_index(user_embedding, snapshot.faiss_index, retrieval_settings.top_k, mask)
+                    legacy_positions = snapshot.recipe_ids[positions]
+
+        if found is not None and found.get("filtered_out"):
+            # No recipe passes the filters; an AI recipe would not honour them either.
+            return {"results": []}, 200
+
+        # Weak filtered matches are returned as they are: the AI prompt does not know the filters.
+        filtered = not recipe_filter.is_empty()
+
+        search_stages = []
+        ranked_results_list = None
+
+        if found is not None:
+            search_stages = found["search_stages"]
+            print("Search stages:", search_stages)
+            use_ai = return_by_ai and not filtered and found["weak"]
+        else:
+            # Fetch results from DB and rank them on substring matches
+            conn = acquire_connection(deadline)
+            results = fetch_matching_recipes(legacy_positions, conn, deadline)
+            ranked_results_list, match_counts = rank_rows(results, user_input)
+            use_ai = return_by_ai and not filtered and not any(match_counts)
+
+        saturated = False
+        ai_stream = False
+        if use_ai:
+            # AI generated response: from the background cache, inline when it fits the budget,
+            # otherwise generated after this request while the weak matches are returned.
+            # No pooled connection is held while the LLM runs.
+            if conn is not None:
+                release_connection(conn)
+                conn = None
+            ai_recipe = cached_ai_recipe(user_input)
+            if ai_recipe is not None:
+                AI_FALLBACKS.labels("cached").inc()
+                tracing.current_span().set("ai_fallback", "cached")
+            elif stream_ai:
+                ai_stream = True
+            elif deadline.allows(ai_min_remaining):
+                ai_options = {}
+                if deadline.budget is not None:
+                    ai_options = {"timeout_sec": deadline.timeout(), "max_retries": 1}
+                try:
+                    # Waits for an LLM slot (or an identical generation in flight) within the budget.
+                    with track_stage("ai_fallback"):
+                        ai_recipe = llm_queue.run(("recipe", _ai_cache_key(user_input)), generate_recipe,
+                                                  timeout=deadline.timeout(),
+                                                  ingredients = user_input, **llm_options, **ai_options)
+                except LlmBusy:
+                    saturated = True
+                else:
+                    AI_FALLBACKS.labels("inline").inc()
+                    tracing.current_span().set("ai_fallback", "inline")
+            if ai_recipe is not None:
+                with track_stage("images", error_detail=False):
+                    response = clean_ai_response({"results": ai_recipe}, deadline, degraded)
+                response["degraded"] = degraded
+                return response, 200 # return list to handle.
+            if saturated:
+                # No background generation either: the queue is full.
+                AI_FALLBACKS.labels("saturated").inc()
+                tracing.current_span().set("ai_fallback", "saturated")
+            elif not ai_stream:
+                AI_FALLBACKS.labels("deferred").inc()
+                tracing.current_span().set("ai_fallback", "deferred")
+                generate_ai_recipe_in_background(user_input)
+            degraded.append("ai_fallback")
+
+        if conn is None:
+            conn = acquire_connection(deadline)
+        if ranked_results_list is None:
+            # Only the top 5 rows are fetched.
+            top_ids = found["recipe_ids"][:5]
+            rows_by_id = {row[0]: row for row in fetch_matching_recipes(top_ids, conn, deadline)}
+            ranked_results_list = [rows_by_id[recipe_id] for recipe_id in top_ids if recipe_id in rows_by_id]
 
-        # Rank results
-        ranked_results_list = ranked_results(results, user_input)
-        if ranked_results_list == True:
-            ai_recipe = generate_recipe(ingredients = user_input)
-            
-            return jsonify(clean_ai_response({"results": ai_recipe})), 200 # return list to handle.
         # Format the response
         formatted_results = []
         for result in ranked_results_list[:5]:  # Return top 5 results
@@ -297,10 +670,288 @@ def search():
                 "source": result[-1]
             })
 
-        return jsonify(clean_faiss_response({"results": formatted_results}, conn)), 200
+        if ai_stream:
+            return {"ai_stream": True, "results": formatted_results, "search_stages": search_stages}, 200
 
+        with track_stage("images", error_detail=False):
+            response = clean_faiss_response({"results": formatted_results, "search_stages": search_stages},
+                                            conn, deadline, degraded)
+        response["degraded"] = degraded
+        if "ai_fallback" in degraded and not saturated:
+            response["ai_pending"] = True
+        tracing.current_span().set("results", len(formatted_results)).set("degraded", ",".join(degraded))
+        return response, 200
+
+    except DeadlineExceeded as e:
+        return {"error": str(e), "degraded": degraded + [e.stage]}, 504
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+# Streamed response
+def stream_events(events):
+    """
+        NDJSON response of events (Server-Sent Events with ?format=sse), see recipe_stream.py.
+        Fields and list items of the AI recipe arrive as they complete; the last event
+        ("results") is the usual response body.
+    """
+    sse = request.args.get("format") == "sse"
+    mimetype = SSE if sse else NDJSON
+    return Response((format_event(event, sse) for event in events), mimetype=mimetype,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Events of a streamed AI recipe
+def ai_recipe_events(chunks, finish):
+    """
+        "field" / "item" events while the model writes, then "results" with finish(recipe)
+        (the response body), or "error".
+    """
+    parser = RecipeStreamParser()
+    try:
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+        yield {"event": "results", **finish(parse_recipe(parser.text))}
+    except Exception as e:
+        yield {"event": "error", "error": str(e)}
+
+# Stream an AI recipe within the LLM concurrency limit
+def stream_ai_recipe(chunks, finish):
+    """
+        Holds an LLM slot until the response is closed (also when the client goes away).
+        Raises LlmBusy when the LLM queue is full.
+    """
+    slot = ExitStack()
+    try:
+        slot.enter_context(llm_queue.slot())
+    except LlmBusy:
+        chunks.close()
+        raise
+    response = stream_events(ai_recipe_events(chunks, finish))
+    # Stops the CLI first, then frees the slot.
+    response.call_on_close(chunks.close)
+    response.call_on_close(slot.close)
+    return response
+
+# Streamed surprise recipe
+@app.route('/surprise/stream', methods=['GET'])
+def surprise_stream():
+    user_input = " ".join(request.args.getlist('ingredients')) or "Random Recipe please"
+    print("Received user input:", user_input)
+    try:
+        return stream_ai_recipe(stream_recipe_from_theme(theme = user_input, **llm_options),
+                                lambda recipe: clean_ai_response({"results": recipe}))
+    except LlmBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": llm_retry_after}
+
+# Non-AI answer of a streamed search whose AI recipe cannot be generated
+def weak_matches_response(body):
+    """
+        Completes the weak matches of run_search(..., stream_ai=True) like /search does.
+    """
+    degraded = ["ai_fallback"]
+    conn = acquire_connection()
+    try:
+        with track_stage("images", error_detail=False):
+            response = clean_faiss_response(body, conn, Deadline(search_budget_ms), degraded)
+    finally:
+        release_connection(conn)
+    response["degraded"] = degraded
+    return response
+
+# Streamed search
+@app.route('/search/stream', methods=['GET'])
+def search_stream():
+    """
+        /search whose AI fallback is streamed. Answers without AI (also when the LLM queue is
+        full) are one "results" event; errors are plain JSON with their status.
+    """
+    body, status = run_search(request.args, stream_ai=True)
+    if body.pop("ai_stream", False):
+        user_input = request.args.getlist('ingredients')
+        def finish(recipe):
+            response = clean_ai_response({"results": recipe})
+            response["degraded"] = []
+            return response
+        try:
+            response = stream_ai_recipe(stream_recipe(ingredients = user_input, **llm_options), finish)
+        except LlmBusy:
+            # The weak matches run_search already found, instead of a second search.
+            AI_FALLBACKS.labels("saturated").inc()
+            tracing.current_span().set("ai_fallback", "saturated")
+            body = weak_matches_response(body)
+        else:
+            AI_FALLBACKS.labels("streamed").inc()
+            tracing.current_span().set("ai_fallback", "streamed")
+            return response
+    if status != 200:
+        return jsonify(body), status
+    return stream_events([{"event": "results", **body}])
+
+# Refuse work until warmed up
+@app.before_request
+def require_warm_up():
+    if not warmed_up.is_set() and request.endpoint not in ("health", "ready", "metrics"):
+        return jsonify({"error": "Service is warming up, retry shortly", "ready": False}), 503
+
+# Profile sampled and slow requests
+@app.before_request
+def start_profile():
+    if request.endpoint in PROFILED_ENDPOINTS:
+        g.profile = profiler.start(request.method, request.path, request.query_string.decode("utf-8", "replace"))
+
+@app.after_request
+def finish_profile(response):
+    profiler.finish(g.pop("profile", None), response.status_code)
+    return response
+
+# Trace sampled requests (and continue sampled incoming traces)
+@app.before_request
+def start_request_trace():
+    if request.endpoint in PROFILED_ENDPOINTS:
+        g.trace = tracing.start_trace(f"{request.method} {request.path}",
+                                      traceparent=request.headers.get("traceparent"),
+                                      endpoint=request.endpoint,
+                                      query=request.query_string.decode("utf-8", "replace"))
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop("trace", None)
+    if trace is not None and trace.recording:
+        trace.set("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            trace.set_error(RuntimeError(f"HTTP {response.status_code}"))
+        response.headers["X-Request-ID"] = trace.trace_id
+        trace.end()
+    return response
+
+# Liveness
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok"}), 200
+
+# Readiness
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+        200 with per-component load times once warmed up, 503 before.
+    """
+    body = {
+        "ready": warmed_up.is_set(),
+        "startup_mode": startup_mode,
+        "embedding_service": embedding_service.url if embedding_service is not None else None,
+        "local_index_loaded": local_loaded.is_set(),
+        "load_times": {name: round(seconds, 4) for name, seconds in component_load_times.items()},
+        "llm_queue": llm_queue.stats(),
+    }
+    if not warmed_up.is_set():
+        body["error"] = warmup_error
+        return jsonify(body), 503
+    if index_holder is not None:
+        body["index_version"] = index_holder.get().version
+    return jsonify(body), 200
+
+# Prometheus metrics: per-stage /search latency, AI fallbacks, Unsplash calls, cache hits,
+# index size and DB pool use (metrics.py)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if index_holder is not None:
+        INDEX_VECTORS.set(index_holder.get().faiss_index.ntotal)
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+# Check admin access
+def _admin_authorized():
+    """
+        Admin endpoints need the configured X-Admin-Token, or a local caller when no token is set.
+    """
+    admin_token = config_dict.get("admin_token", "").strip()
+    if admin_token:
+        return request.headers.get("X-Admin-Token", "") == admin_token
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+# Captured profiles
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """
+        Summaries (duration, status, stage timings) of the profiles in the ring buffers, newest
+        first; ?kind=slow or ?kind=sampled for one buffer.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    kind = request.args.get("kind")
+    if kind not in (None, "slow", "sampled"):
+        return jsonify({"error": "kind must be slow or sampled"}), 400
+    return jsonify({
+        "enabled": profiler.enabled(),
+        "sample_rate": profiler.sample_rate,
+        "slow_ms": profiler.slow_after * 1000 if profiler.slow_after is not None else None,
+        "profiles": profiler.profiles(kind)
+    }), 200
+
+# Stacks of all captured profiles
+@app.route('/admin/profiles/folded', methods=['GET'])
+def folded_profiles():
+    """
+        Merged folded stacks of the buffered profiles (?kind=slow|sampled), for flamegraph.pl or speedscope.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    profiles = [profiler.get(summary["id"]) for summary in profiler.profiles(request.args.get("kind"))]
+    return Response(profiler.folded(profile for profile in profiles if profile is not None), content_type="text/plain")
+
+# One captured profile
+@app.route('/admin/profiles/<int:profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+        Summary with folded stacks; ?format=folded returns only the stacks as text.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    profile = profiler.get(profile_id)
+    if profile is None:
+        return jsonify({"error": f"No profile {profile_id} in the buffer"}), 404
+    if request.args.get("format") == "folded":
+        return Response(profiler.folded([profile]), content_type="text/plain")
+    return jsonify({**profile.summary(), "stacks": dict(profile.stacks.most_common())}), 200
+
+# Reload the index
+@app.route('/admin/reload-index', methods=['POST'])
+def reload_index():
+    """
+        Loads the version in Index/CURRENT (or ?version=...) next to the live one and swaps it in.
+        In-flight searches finish on the snapshot they started with.
+        The embedding service reloads too; without a local index only its answer is returned.
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    version = request.args.get("version")
+    if version is not None:
+        try:
+            check_version(index_path, version)
+        except UnknownVersion as e:
+            return jsonify({"error": str(e)}), 400
+    service_reload = None
+    if embedding_service is not None:
+        service_reload = embedding_service.reload_index(version)
+    if index_holder is None:
+        if service_reload is None:
+            return jsonify({"error": "Embedding service unavailable and no local index loaded"}), 503
+        status, body = service_reload
+        return jsonify(body), status
+    try:
+        version, swapped = index_holder.reload(version)
+        snapshot = index_holder.get()
+        return jsonify({
+            "version": version,
+            "swapped": swapped,
+            "row_count": int(snapshot.faiss_index.ntotal),
+            "manifest": snapshot.manifest,
+            "embedding_service": service_reload[1] if service_reload is not None else None
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e), "version": index_holder.get().version}), 500
 
 # Run the Flask app
 if __name__ == "__main__":
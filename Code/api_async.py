@@ -0,0 +1,528 @@
+"""
+    Async (ASGI) variant of api.py with the same /search and /surprise contracts.
+
+    1. Slow I/O never holds a thread: Postgres through an asyncpg pool, Ollama through its
+       HTTP API and Unsplash through httpx, all awaited on the event loop.
+    2. CPU-bound work (encode, FAISS, ranking) runs in a bounded thread pool (cpu_workers).
+    3. Image lookups for the returned recipes run concurrently instead of one after another.
+    4. With embedding_service_url set, retrieval is asked of embedding_service.py first.
+    5. GET /search/stream and /surprise/stream stream the AI recipe from Ollama's streamed
+       /api/generate, like api.py (recipe_stream.py).
+    6. Sampled /search and /surprise requests are traced like in api.py (tracing.py); spans follow
+       the request into the thread pool and the concurrent image lookups.
+
+    The model and index load in the background after startup; requests get 503 until
+    /ready answers 200. /health answers as soon as the server is up. The asyncpg pool is
+    created on first use, so the server also starts while Postgres is down and requests that
+    need it get 503, like api.py's lazily created pool.
+
+    Run:
+        uvicorn api_async:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncpg
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from config_reader import fetch_config_dict
+from embedding_backend import MODEL_NAME, load_encoder
+from index_store import IndexHolder
+from ranking import rank_rows
+from retrieval import (INDEX_EXTENSIONS, RetrievalSettings, filter_mask, prepare_query, search_index,
+                       search_recipes)
+from recipe_metadata import RecipeFilter
+from cli_fetch_recipe_ai import (MODEL_TAG, OLLAMA_URL, OUTPUT_FORMAT, generate_recipe_async, generate_recipe_from_theme_async,
+                                 parse_recipe, profile_from_config, stream_recipe_async, stream_recipe_from_theme_async)
+from recipe_stream import NDJSON, SSE, RecipeStreamParser, format_event
+import fetch_images
+import tracing
+from tracing import span, trace_headers
+
+# Load configuration
+config_dict = fetch_config_dict()
+
+base_directory = config_dict.get('base_directory', '')
+index_folder = config_dict.get('index_directory', '')
+index_path = os.path.join(base_directory, index_folder)
+
+return_by_ai = bool(int(config_dict.get("return_by_ai", '0')))
+retrieval_settings = RetrievalSettings.from_config(config_dict)
+llm_model = config_dict.get("model", MODEL_TAG)
+ollama_url = config_dict.get("ollama_url", OLLAMA_URL)
+llm_output_format = config_dict.get("llm_output_format", OUTPUT_FORMAT).strip().lower()
+llm_profile = profile_from_config(config_dict)
+fallback_image_url = config_dict.get("fallback_image_url", "").strip()
+embedding_service_url = config_dict.get("embedding_service_url", "").strip().rstrip("/")
+embedding_service_timeout = float(config_dict.get("embedding_service_timeout", '2'))
+tracing.configure(config_dict, "recipe-api-async")
+
+# Encode / FAISS / ranking run here, never on the event loop.
+cpu_executor = ThreadPoolExecutor(max_workers=int(config_dict.get("cpu_workers", '4')), thread_name_prefix="cpu")
+
+# Set in lifespan() / warm_up()
+model = None
+index_holder = None
+db_pool = None
+http_client = None
+component_load_times = {}
+warmup_error = None
+warmed_up = asyncio.Event()
+_db_pool_lock = asyncio.Lock()
+
+# Lost or refused connections (not query errors): the request gets 503.
+DB_CONNECTION_ERRORS = (OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError)
+
+
+class DatabaseUnavailable(Exception):
+    """
+        Postgres cannot be reached; the request answers 503.
+    """
+
+
+# Run CPU-bound work in the thread pool
+async def run_cpu(function, *args):
+    # In the caller's context, so stage spans join the request's trace.
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor, context.run, function, *args)
+
+
+# Load the model and the index
+def load_components():
+    """
+    Loads the embedding model and the FAISS index with its artifacts (runs in the thread pool).
+    """
+    global model, index_holder
+    started = time.perf_counter()
+    model = load_encoder(config_dict)
+    model.encode("warm up")
+    component_load_times["embedding_model"] = time.perf_counter() - started
+
+    index_holder = IndexHolder(index_path,
+                               model_name=MODEL_NAME,
+                               verify=bool(int(config_dict.get("verify_index_checksums", '1'))),
+                               extensions=INDEX_EXTENSIONS)
+    component_load_times.update(index_holder.get().load_times)
+    index_holder.start_watcher(float(config_dict.get("index_watch_interval", '0')))
+    component_load_times["total"] = time.perf_counter() - started
+
+# Warm up in the background
+async def warm_up():
+    global warmup_error
+    try:
+        await run_cpu(load_components)
+        warmed_up.set()
+        print(f"FAISS index version {index_holder.get().version} and recipe IDs loaded successfully.")
+    except Exception as e:
+        warmup_error = str(e)
+        print(f"Warm-up failed: {e}")
+
+
+# The DB pool, created on first use
+async def get_db_pool():
+    """
+    Raises DatabaseUnavailable when the pool cannot be created; the next request tries again.
+    """
+    global db_pool
+    if db_pool is None:
+        async with _db_pool_lock:
+            if db_pool is None:
+                try:
+                    db_pool = await asyncpg.create_pool(database=config_dict["dbname"],
+                                                        user=config_dict["user"],
+                                                        password=config_dict["password"],
+                                                        host=config_dict["host"],
+                                                        port=int(config_dict["port"]),
+                                                        min_size=1,
+                                                        max_size=int(config_dict.get("db_pool_size", '10')))
+                except (asyncpg.PostgresError, *DB_CONNECTION_ERRORS) as e:
+                    raise DatabaseUnavailable(f"Database unavailable: {e}") from e
+    return db_pool
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global http_client
+    http_client = httpx.AsyncClient(timeout=30)
+    warm_up_task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        await http_client.aclose()
+        if db_pool is not None:
+            await db_pool.close()
+
+
+# Preprocess user input
+def preprocess_ingredients(ingredients):
+    """
+    Preprocesses a list of ingredients by lowercasing, removing punctuation, and stripping whitespace.
+    """
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+
+    if isinstance(ingredients, list):
+        return [re.sub(r'[^\w\s]', '', ingredient.lower()).strip() for ingredient in ingredients if ingredient.strip()]
+    return []
+
+# Retrieve in process
+def local_search(user_input, recipe_filter):
+    """
+    Ranked recipe ids in the shape embedding_service.py's /retrieve answers with.
+    Indexes without ingredient tokens return {"legacy_ids": FAISS top_k} to rank on DB rows.
+    Raises ValueError for filters the index cannot apply.
+    """
+    snapshot = index_holder.get()
+    mask = filter_mask(snapshot, recipe_filter)
+    if mask is not None and not mask.any():
+        return {"filtered_out": True}
+
+    text = " ".join(preprocess_ingredients(user_input))
+    user_embedding = prepare_query(snapshot.faiss_index, model.encode(text))
+    if snapshot.extras.get("ranking") is None:
+        positions, _ = search_index(user_embedding, snapshot.faiss_index, retrieval_settings.top_k, mask)
+        return {"legacy_ids": [int(recipe_id) for recipe_id in snapshot.recipe_ids[positions]]}
+
+    result = search_recipes(snapshot, user_embedding, user_input, retrieval_settings, mask)
+    return {"recipe_ids": result.recipe_ids, "weak": result.weak, "search_stages": result.stages}
+
+# Retrieve in the embedding service
+async def remote_search(query_params):
+    """
+    The service's /retrieve answer for 200 / 400, None when it is off or fails.
+    """
+    if not embedding_service_url:
+        return None
+    try:
+        with span("embedding_service GET /retrieve") as call:
+            response = await http_client.get(embedding_service_url + "/retrieve",
+                                             params=list(query_params.multi_items()),
+                                             headers=trace_headers(),
+                                             timeout=embedding_service_timeout)
+            call.set("status_code", response.status_code)
+    except httpx.HTTPError as e:
+        print(f"Embedding service unavailable ({e}); retrieving in process.")
+        return None
+    if response.status_code not in (200, 400):
+        return None
+    return response.json()
+
+# Fetch matching recipes from the database
+async def fetch_matching_recipes(recipe_ids):
+    """
+    Rows for recipe_ids as tuples (same column order as api.py's cursor rows).
+    """
+    pool = await get_db_pool()
+    with span("db_fetch", requested=len(recipe_ids)) as call:
+        try:
+            rows = await pool.fetch("SELECT * FROM recipes WHERE id = ANY($1::int[]);", [int(s) for s in recipe_ids])
+        except DB_CONNECTION_ERRORS as e:
+            raise DatabaseUnavailable(f"Database unavailable: {e}") from e
+        call.set("rows", len(rows))
+    return [tuple(row) for row in rows]
+
+# Image lookup
+async def fetch_image(name):
+    """
+    Unsplash URL for name, or None when the lookup fails (like api.py's image_within_budget,
+    a failed image never fails the request).
+    """
+    try:
+        return await fetch_images.main_async(http_client, name)
+    except Exception as e:
+        print(f"Image lookup for {name!r} skipped: {e}")
+        return None
+
+# Image for one recipe
+async def attach_image(each_result):
+    if each_result.get("image_url", "") in ["", None]:
+        image_url = await fetch_image(each_result["name"])
+        if image_url is None:
+            each_result["image_url"] = fallback_image_url
+            return
+        each_result["image_url"] = image_url
+        with span("db.update_image_url", recipe_id=each_result["id"]):
+            try:
+                await db_pool.execute("UPDATE recipes SET image_url = $1 WHERE id = $2;", image_url, each_result["id"])
+            except (asyncpg.PostgresError, *DB_CONNECTION_ERRORS) as e:
+                print(f"Image URL of recipe {each_result['id']} not saved: {e}")
+
+# Clean FAISS response
+async def clean_faiss_response(input_json):
+    """
+        Match keys. Add for cuisine and image url (missing images are fetched concurrently).
+    """
+    results = input_json.get("results", [])
+    await asyncio.gather(*(attach_image(each_result) for each_result in results))
+
+    for each_result in results:
+        each_result["cuisine"] = ""
+        if isinstance(each_result.get("nutrition", []), list) and len(each_result.get("nutrition", [])) == 7:
+            each_result["nutrition"] = {
+                "calories": each_result["nutrition"][0],
+                "protein": each_result["nutrition"][1],
+                "saturated_fat": each_result["nutrition"][2],
+                "sodium": each_result["nutrition"][3],
+                "sugar": each_result["nutrition"][4],
+                "total_fat": each_result["nutrition"][5],
+            }
+    return input_json
+
+# Clean the AI response
+async def clean_ai_response(input_json):
+    """
+        1. Convert outer dict to list.
+        2. Match key names.
+    """
+    recipe_dict = input_json.get("results", {})
+
+    recipe_dict["id"] = -1
+    recipe_dict["name"] = recipe_dict.get("generic_name", "")
+    recipe_dict["source"] = "AI Generated"
+    recipe_dict["image_url"] = recipe_dict.get("image_url", "")
+    ingredients_list = recipe_dict.get("ingredients") or recipe_dict.get("ingredient") or []
+
+    recipe_dict["ingredients_tokenized"] = ingredients_list
+    recipe_dict["ingredients"] = ingredients_list
+    if recipe_dict['image_url'].strip() == "":
+        recipe_dict["image_url"] = await fetch_image(recipe_dict["name"]) or fallback_image_url
+
+    input_json["results"] = [recipe_dict]
+    return input_json
+
+# Format a DB row
+def format_row(result):
+    return {
+        "id": result[0],
+        "name": result[1],
+        "description": result[2],
+        "steps": result[3],
+        "ingredients": result[4],
+        "tags": result[5],
+        "nutrition": result[6],
+        "prep_time": result[7],
+        "image_url": result[8],
+        "ingredients_tokenized": result[-2],
+        "source": result[-1]
+    }
+
+
+def not_ready():
+    return JSONResponse({"error": "Service is warming up, retry shortly", "ready": False}, status_code=503)
+
+
+# Trace an endpoint
+def traced(handler):
+    """
+        Runs the handler under a root span (sampled, or continuing an incoming traceparent);
+        traced responses carry the trace id in X-Request-ID.
+    """
+    @functools.wraps(handler)
+    async def wrapper(request):
+        trace = tracing.start_trace(f"{request.method} {request.url.path}",
+                                    traceparent=request.headers.get("traceparent"),
+                                    endpoint=handler.__name__, query=request.url.query)
+        try:
+            response = await handler(request)
+        except BaseException as e:
+            trace.set_error(e)
+            trace.end()
+            raise
+        if trace.recording:
+            trace.set("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                trace.set_error(RuntimeError(f"HTTP {response.status_code}"))
+            response.headers["X-Request-ID"] = trace.trace_id
+        trace.end()
+        return response
+    return wrapper
+
+
+# Search endpoint
+@traced
+async def search(request):
+    if not warmed_up.is_set():
+        return not_ready()
+    body, status = await run_search(request.query_params)
+    return JSONResponse(body, status_code=status)
+
+# Answer one /search
+async def run_search(query_params, stream_ai=False):
+    """
+        (JSON body, HTTP status) of a /search. With stream_ai the AI recipe is left to the
+        caller: the body is then {"ai_stream": True}.
+    """
+    try:
+        user_input = query_params.getlist('ingredients')
+        if not user_input:
+            return {"error": "No ingredients provided"}, 400
+
+        # Optional filters: max_time, tags, min_/max_<nutrient>
+        try:
+            recipe_filter = RecipeFilter.from_args(query_params)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        print("Received user input:", user_input)
+
+        found = await remote_search(query_params)
+        if found is not None and "error" in found:
+            return {"error": found["error"]}, 400
+        if found is None:
+            try:
+                found = await run_cpu(local_search, user_input, recipe_filter)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+
+        if found.get("filtered_out"):
+            # No recipe passes the filters; an AI recipe would not honour them either.
+            return {"results": []}, 200
+
+        # Weak filtered matches are returned as they are: the AI prompt does not know the filters.
+        filtered = not recipe_filter.is_empty()
+
+        search_stages = found.get("search_stages", [])
+        if "legacy_ids" in found:
+            rows, match_counts = rank_rows(await fetch_matching_recipes(found["legacy_ids"]), user_input)
+            use_ai = return_by_ai and not filtered and not any(match_counts)
+        else:
+            use_ai = return_by_ai and not filtered and found["weak"]
+            top_ids = found["recipe_ids"][:5]
+            rows_by_id = {row[0]: row for row in await fetch_matching_recipes(top_ids)}
+            rows = [rows_by_id[recipe_id] for recipe_id in top_ids if recipe_id in rows_by_id]
+
+        if use_ai:
+            if stream_ai:
+                return {"ai_stream": True}, 200
+            ai_recipe = await generate_recipe_async(http_client, ingredients=user_input,
+                                                    model=llm_model, ollama_url=ollama_url,
+                                                    output_format=llm_output_format, profile=llm_profile)
+            return await clean_ai_response({"results": ai_recipe}), 200
+
+        formatted_results = [format_row(result) for result in rows[:5]]
+        return await clean_faiss_response({"results": formatted_results, "search_stages": search_stages}), 200
+
+    except DatabaseUnavailable as e:
+        return {"error": str(e)}, 503
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+# Surprise endpoint
+@traced
+async def surprise(request):
+    try:
+        user_input = request.query_params.getlist('ingredients')
+        user_input = " ".join(user_input) if user_input else "Random Recipe please"
+
+        print("Received user input:", user_input)
+
+        ai_recipe = await generate_recipe_from_theme_async(http_client, theme=user_input,
+                                                           model=llm_model, ollama_url=ollama_url,
+                                                           output_format=llm_output_format, profile=llm_profile)
+        return JSONResponse(await clean_ai_response({"results": ai_recipe}))
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# Streamed response
+def stream_events(request, events):
+    """
+        NDJSON response of an async iterable of events (Server-Sent Events with ?format=sse).
+    """
+    sse = request.query_params.get("format") == "sse"
+
+    async def body():
+        async for event in events:
+            yield format_event(event, sse)
+    return StreamingResponse(body(), media_type=SSE if sse else NDJSON,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Events of a streamed AI recipe
+async def ai_recipe_events(chunks, finish):
+    """
+        "field" / "item" events while the model writes, then "results" with await finish(recipe)
+        (the response body), or "error".
+    """
+    parser = RecipeStreamParser()
+    try:
+        async for chunk in chunks:
+            for event in parser.feed(chunk):
+                yield event
+        yield {"event": "results", **(await finish(parse_recipe(parser.text)))}
+    except Exception as e:
+        yield {"event": "error", "error": str(e)}
+
+async def _one_event(event):
+    yield event
+
+# Streamed surprise recipe
+async def surprise_stream(request):
+    user_input = " ".join(request.query_params.getlist('ingredients')) or "Random Recipe please"
+    print("Received user input:", user_input)
+    chunks = stream_recipe_from_theme_async(http_client, theme=user_input, model=llm_model, ollama_url=ollama_url,
+                                            output_format=llm_output_format, profile=llm_profile)
+    return stream_events(request, ai_recipe_events(chunks, lambda recipe: clean_ai_response({"results": recipe})))
+
+# Streamed search
+async def search_stream(request):
+    """
+        /search whose AI fallback is streamed. Answers without AI are one "results" event;
+        errors are plain JSON with their status.
+    """
+    if not warmed_up.is_set():
+        return not_ready()
+    body, status = await run_search(request.query_params, stream_ai=True)
+    if status != 200:
+        return JSONResponse(body, status_code=status)
+    if not body.get("ai_stream"):
+        return stream_events(request, _one_event({"event": "results", **body}))
+
+    async def finish(recipe):
+        response = await clean_ai_response({"results": recipe})
+        response["degraded"] = []
+        return response
+    chunks = stream_recipe_async(http_client, ingredients=request.query_params.getlist('ingredients'),
+                                 model=llm_model, ollama_url=ollama_url, output_format=llm_output_format,
+                                 profile=llm_profile)
+    return stream_events(request, ai_recipe_events(chunks, finish))
+
+# Liveness
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+# Readiness
+async def ready(request):
+    body = {
+        "ready": warmed_up.is_set(),
+        "load_times": {name: round(seconds, 4) for name, seconds in component_load_times.items()},
+    }
+    if not warmed_up.is_set():
+        body["error"] = warmup_error
+        return JSONResponse(body, status_code=503)
+    body["index_version"] = index_holder.get().version
+    return JSONResponse(body)
+
+
+app = Starlette(routes=[
+    Route('/search', search, methods=['GET']),
+    Route('/search/stream', search_stream, methods=['GET']),
+    Route('/surprise', surprise, methods=['GET']),
+    Route('/surprise/stream', surprise_stream, methods=['GET']),
+    Route('/health', health, methods=['GET']),
+    Route('/ready', ready, methods=['GET']),
+], lifespan=lifespan)
+
+
+# Run with uvicorn
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
@@ -0,0 +1,99 @@
+"""
+This script:
+1. Loads every available embedding backend (torch, torch_int8, onnx; see embedding_backend.py).
+2. Builds query texts the way /search does, from raw ingredients of the indexed recipes
+   (recipe_samples.py; a built-in sample when there is no index or its recipes cannot be read).
+3. Reports, per backend:
+   single-query latency (p50/p95), batch throughput (texts/s) and
+   parity with the torch backend (max abs diff, min / mean cosine).
+
+Usage:
+    python benchmark_embeddings.py [num_texts] [batch_size]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+from config_reader import fetch_config_dict
+from embedding_backend import BACKENDS, SAMPLE_TEXTS, load_encoder, embedding_parity
+from index_store import load_index_version
+from recipe_samples import query_text, sample_recipes
+
+
+# Query texts
+def sample_texts(config_dict, index_path, num_texts, seed=7):
+    """
+        Query texts of 2-6 raw ingredients of random indexed recipes, preprocessed as /search does.
+    """
+    try:
+        recipes = sample_recipes(config_dict, load_index_version(index_path, verify=False), num_texts, 1, seed)
+    except Exception as e:
+        print(f"Using the built-in sample texts: {e}")
+        return [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(num_texts)]
+
+    rng = random.Random(seed)
+    texts = []
+    for i in range(num_texts):
+        ingredients = recipes[i % len(recipes)][1]
+        texts.append(query_text(rng.sample(ingredients, min(len(ingredients), rng.randint(2, 6)))))
+    return texts
+
+
+# Time one backend
+def run_backend(encoder, texts, batch_size, single_queries=200):
+    """
+        Returns latency and throughput stats for one encoder.
+    """
+    encoder.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+
+    latencies = []
+    for text in texts[:single_queries]:
+        started = time.perf_counter()
+        encoder.encode(text)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    encoder.encode(texts, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "single_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "single_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        "batch_texts_per_sec": round(len(texts) / elapsed, 1),
+    }
+
+
+def main(num_texts=1000, batch_size=64):
+    config_dict = fetch_config_dict()
+    index_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('index_directory', ''))
+    texts = sample_texts(config_dict, index_path, num_texts)
+
+    encoders = {}
+    for backend in BACKENDS:
+        started = time.perf_counter()
+        try:
+            encoders[backend] = load_encoder(config_dict, backend=backend)
+        except Exception as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        print(f"Loaded {backend} in {time.perf_counter() - started:.2f}s")
+
+    reference = encoders.get("torch")
+    report = []
+    for backend, encoder in encoders.items():
+        stats = {"backend": backend, **run_backend(encoder, texts, batch_size)}
+        if reference is not None and encoder is not reference:
+            parity = embedding_parity(reference, encoder, texts[:256], batch_size)
+            stats.update({name: round(value, 6) for name, value in parity.items()})
+        report.append(stats)
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
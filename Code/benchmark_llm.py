@@ -0,0 +1,158 @@
+"""
+This script:
+1. Sends the same recipe prompts (ingredient lists as /search falls back with, themes as /surprise
+   sends) to Ollama's streamed /api/generate under each generation profile (PROFILES of
+   cli_fetch_recipe_ai.py with the config.ini overrides), after one warm-up call that loads the model.
+2. Reports per profile:
+   tokens generated (Ollama's eval_count), time to first token and total latency (p50/p95/mean),
+   generation speed (tokens/s), description length in words, and the share of answers that
+   parse into a recipe (parse_recipe).
+3. Writes the report as JSON to benchmark_directory/results/; compare two runs with
+   `python benchmark_pipeline.py compare <old.json> <new.json>`.
+
+Uses the HTTP API (ollama_url in config.ini): `ollama run` neither takes the generation options
+nor reports token counts.
+
+Usage:
+    python benchmark_llm.py [runs_per_prompt] [profile ...]
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import requests
+from config_reader import fetch_config_dict
+from cli_fetch_recipe_ai import (MODEL_TAG, OLLAMA_URL, OUTPUT_FORMAT, PROFILES, parse_recipe, profile_from_config,
+                                 recipe_request)
+
+# (kind, value): recipe requests of the benchmark
+PROMPTS = (
+    ("ingredients", ["chicken breast", "garlic", "lemon", "rice"]),
+    ("ingredients", ["tomaeto", "basil", "mozarella"]),
+    ("ingredients", ["chickpeas", "coconut milk", "spinach", "cumin", "ginger"]),
+    ("theme", "I feel like the pyramids of Giza"),
+    ("theme", "a rainy Sunday afternoon"),
+)
+
+
+# Percentiles in ms
+def latency_summary(seconds):
+    values = np.asarray(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(values, 50)), 1),
+            "p95_ms": round(float(np.percentile(values, 95)), 1),
+            "mean_ms": round(float(values.mean()), 1)}
+
+
+# One streamed generation
+def generate(ollama_url, body, timeout):
+    """
+        Returns (text, time to first token, total seconds, Ollama's final stats).
+    """
+    started = time.perf_counter()
+    first_token = None
+    pieces = []
+    stats = {}
+    with requests.post(f"{ollama_url.rstrip('/')}/api/generate", json=body, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line.strip():
+                continue
+            part = json.loads(line)
+            if part.get("error"):
+                raise RuntimeError(f"Ollama: {part['error']}")
+            if part.get("response"):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                pieces.append(part["response"])
+            if part.get("done"):
+                stats = part
+                break
+    total = time.perf_counter() - started
+    # A server that does not report eval_count: one streamed piece is about one token.
+    stats.setdefault("eval_count", len(pieces))
+    return "".join(pieces), first_token if first_token is not None else total, total, stats
+
+
+# All prompts under one profile
+def run_profile(ollama_url, model, output_format, profile, runs, timeout):
+    ttft, totals, tokens, speeds, words = [], [], [], [], []
+    parsed = errors = 0
+    for _ in range(runs):
+        for kind, value in PROMPTS:
+            body = recipe_request(model=model, output_format=output_format, profile=profile, **{kind: value})
+            try:
+                text, first_token, total, stats = generate(ollama_url, body, timeout)
+            except Exception as e:
+                print(f"⚠️  {profile['name']}: {str(e)[:120]!r}")
+                errors += 1
+                continue
+            ttft.append(first_token)
+            totals.append(total)
+            tokens.append(stats["eval_count"])
+            if stats.get("eval_duration"):
+                speeds.append(stats["eval_count"] / (stats["eval_duration"] / 1e9))
+            try:
+                recipe = parse_recipe(text)
+            except ValueError:
+                continue
+            parsed += 1
+            words.append(len(str(recipe.get("description", "")).split()))
+
+    requests_made = runs * len(PROMPTS)
+    report = {"settings": {key: value for key, value in profile.items() if key != "name"},
+              "requests": requests_made, "errors": errors,
+              "parsed_share": round(parsed / requests_made, 3) if requests_made else 0.0}
+    if totals:
+        report.update({"tokens_generated": {"p50": float(np.percentile(tokens, 50)),
+                                            "mean": round(float(np.mean(tokens)), 1),
+                                            "max": int(np.max(tokens))},
+                       "time_to_first_token": latency_summary(ttft),
+                       "total_latency": latency_summary(totals)})
+    if speeds:
+        report["tokens_per_sec"] = round(float(np.mean(speeds)), 1)
+    if words:
+        report["description_words_mean"] = round(float(np.mean(words)), 1)
+    return report
+
+
+def main(runs=3, profiles=None):
+    config_dict = fetch_config_dict()
+    ollama_url = config_dict.get("ollama_url", OLLAMA_URL)
+    model = config_dict.get("model", MODEL_TAG)
+    output_format = config_dict.get("llm_output_format", OUTPUT_FORMAT).strip().lower()
+    timeout = float(config_dict.get("benchmark_llm_timeout", '300'))
+    profiles = [profile_from_config(config_dict, name) for name in (profiles or PROFILES)]
+
+    # Warm-up: the first call loads the model, which would land in the first profile's numbers.
+    print(f"Loading {model} from {ollama_url} ...")
+    generate(ollama_url, recipe_request(ingredients=["salt"], model=model, output_format=output_format,
+                                        profile=profiles[0]), timeout)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "model": model,
+        "output_format": output_format,
+        "runs_per_prompt": runs,
+        "profiles": {},
+    }
+    for profile in profiles:
+        print(f"Profile {profile['name']}: {runs * len(PROMPTS)} generations ...")
+        report["profiles"][profile["name"]] = run_profile(ollama_url, model, output_format, profile, runs, timeout)
+
+    bench_root = os.path.join(config_dict.get('base_directory', ''), config_dict.get('benchmark_directory', 'Benchmarks'))
+    results_path = os.path.join(bench_root, "results")
+    os.makedirs(results_path, exist_ok=True)
+    output = os.path.join(results_path, f"{datetime.now():%Y%m%d-%H%M%S}_llm.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"Saved to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3, sys.argv[2:] or None)
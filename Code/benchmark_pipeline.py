@@ -0,0 +1,462 @@
+"""
+This script:
+1. Generates a synthetic recipe corpus of num_recipes recipes (10k - 1M) with skewed
+   ingredient frequencies, and stores it in a recipes table: SQLite (default) or a scratch
+   schema in the configured Postgres (benchmark_db in config.ini).
+2. Builds an index version from it with create_faiss_index's chunk pipeline and artifacts.
+   Corpus and index are kept in benchmark_directory and reused by later runs of the same size.
+3. Replays a query mix through the /search pipeline:
+   api    -> generate_embedding -> adaptive retrieval + ranking (retrieval.py) -> DB fetch of the top 5
+   legacy -> generate_embedding -> FAISS top_k (query_faiss.query_faiss) -> DB fetch -> rank_rows (ranked_results)
+4. Reports per pipeline: p50/p95/p99 latency per stage and end to end, QPS, and recall:
+   known_item@5 -> the recipe a query was taken from is in the top 5 (known_item queries),
+   all_match@5  -> share of top 5 results holding every query ingredient.
+   Plus build time, index load times, index size on disk and peak memory (RSS).
+5. Writes the report as JSON to benchmark_directory/results/, so runs can be compared.
+
+Query mix (QUERY_MIX): 2-5 ingredients of a corpus recipe, one common ingredient, or
+ingredients with one unknown to the corpus (weak matches, the deepest retrieval stages).
+
+Usage:
+    python benchmark_pipeline.py [num_recipes] [num_queries]
+    python benchmark_pipeline.py compare <old.json> <new.json>
+"""
+
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from config_reader import fetch_config_dict
+import create_faiss_index
+from embedding_backend import MODEL_NAME
+from index_store import IndexHolder, begin_version, publish_version, read_current
+from ranking import RankingTokenWriter, count_matches, ingredient_line, normalize_terms, rank_rows
+from ingredient_index import InvertedIndexWriter
+from sparse_index import BM25Writer
+from recipe_metadata import MetadataWriter
+from retrieval import INDEX_EXTENSIONS, RetrievalSettings, prepare_query, search_index, search_recipes
+
+BASE_INGREDIENTS = [
+    "salt", "pepper", "olive oil", "butter", "garlic", "onion", "sugar", "flour", "egg", "milk",
+    "water", "chicken breast", "tomato", "lemon", "parmesan cheese", "rice", "potato", "carrot",
+    "celery", "basil", "parsley", "oregano", "cumin", "paprika", "cinnamon", "ginger", "soy sauce",
+    "honey", "vinegar", "cream", "beef", "pork", "bacon", "shrimp", "salmon", "mushroom",
+    "spinach", "bell pepper", "zucchini", "broccoli", "corn", "black beans", "chickpeas", "lentils",
+    "coconut milk", "yogurt", "cheddar cheese", "mozzarella", "pasta", "bread crumbs", "vanilla",
+    "baking powder", "chocolate", "walnuts", "almonds", "apple", "banana", "lime", "cilantro",
+    "thyme", "rosemary", "chili powder",
+]
+MODIFIERS = ["", "fresh ", "chopped ", "ground ", "dried ", "minced ", "frozen ", "sliced "]
+CUISINES = ["italian", "mexican", "indian", "thai", "french", "greek", "american", "japanese"]
+DISHES = ["stew", "salad", "soup", "bake", "stir fry", "pie", "curry", "pasta", "tacos", "casserole"]
+TAGS = ["easy", "dinner", "vegetarian", "30-minutes-or-less", "breakfast", "dessert", "healthy",
+        "low-carb", "main-dish", "side-dishes"]
+UNKNOWN_INGREDIENTS = ["dragon fruit", "yuzu kosho", "black garlic", "sumac", "saffron threads"]
+
+# (query kind, share of queries)
+QUERY_MIX = (("known_item", 0.6), ("single", 0.25), ("unknown", 0.15))
+
+STAGE_NAMES = ("encode", "retrieve_rank", "faiss", "db_fetch", "rank")
+
+RECIPE_COLUMNS = ("id", "name", "description", "steps", "ingredients", "tags", "nutrition",
+                  "total_time", "image_url", "ingredients_tokenized", "source")
+LIST_COLUMNS = ("steps", "ingredients", "tags", "nutrition", "ingredients_tokenized")
+
+
+# Synthetic corpus
+def generate_recipes(num_recipes, seed=7, chunk_size=10000):
+    """
+        Yields lists of recipe rows (RECIPE_COLUMNS order). Ingredient popularity follows a
+        Zipf-like curve, so a few ingredients (salt, oil...) appear in most recipes.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = [modifier + ingredient for ingredient in BASE_INGREDIENTS for modifier in MODIFIERS]
+    weights = rng.permutation(1.0 / np.arange(1, len(vocab) + 1) ** 0.9)
+    weights /= weights.sum()
+
+    for start in range(1, num_recipes + 1, chunk_size):
+        rows = []
+        for recipe_id in range(start, min(start + chunk_size, num_recipes + 1)):
+            picks = rng.choice(len(vocab), size=int(rng.integers(4, 13)), replace=False, p=weights)
+            ingredients = [vocab[i] for i in picks]
+            name = f"{CUISINES[int(rng.integers(len(CUISINES)))]} {ingredients[0]} {DISHES[int(rng.integers(len(DISHES)))]}"
+            rows.append((
+                recipe_id,
+                name,
+                f"A {name} with {', '.join(ingredients[1:4])}.",
+                [f"Step {i + 1}." for i in range(int(rng.integers(3, 9)))],
+                ingredients,
+                [TAGS[i] for i in rng.choice(len(TAGS), size=3, replace=False)],
+                [round(float(value), 1) for value in rng.gamma(2.0, 20.0, size=7)],
+                int(rng.integers(5, 180)),
+                "",
+                ingredients,
+                "synthetic",
+            ))
+        yield rows
+
+
+class SqliteRecipeStore:
+    """
+        recipes table in a SQLite file; list columns are stored as JSON.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)  # the index build reads it from a prefetch thread
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS recipes ({', '.join(RECIPE_COLUMNS)}, PRIMARY KEY (id))")
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM recipes").fetchone()[0]
+
+    def reset(self):
+        self.conn.execute("DELETE FROM recipes")
+
+    def insert(self, rows):
+        list_positions = [RECIPE_COLUMNS.index(column) for column in LIST_COLUMNS]
+        encoded = [tuple(json.dumps(value) if i in list_positions else value for i, value in enumerate(row))
+                   for row in rows]
+        self.conn.executemany(f"INSERT INTO recipes VALUES ({', '.join('?' * len(RECIPE_COLUMNS))})", encoded)
+        self.conn.commit()
+
+    def _decode(self, row):
+        return tuple(json.loads(value) if RECIPE_COLUMNS[i] in LIST_COLUMNS else value for i, value in enumerate(row))
+
+    def fetch(self, recipe_ids):
+        """
+            Same rows as api.fetch_matching_recipes (SELECT * ... WHERE id = ANY(ids)).
+        """
+        recipe_ids = [int(recipe_id) for recipe_id in recipe_ids]
+        query = f"SELECT * FROM recipes WHERE id IN ({', '.join('?' * len(recipe_ids))})"
+        return [self._decode(row) for row in self.conn.execute(query, recipe_ids)]
+
+    def iter_chunks(self, chunk_size):
+        """
+            Chunks shaped like create_faiss_index.fetch_data_from_db.
+        """
+        cursor = self.conn.execute("SELECT id, ingredients_tokenized, name, total_time, nutrition, tags "
+                                   "FROM recipes ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield {
+                'id': [row[0] for row in rows],
+                'ingredients_tokenized': [json.loads(row[1]) for row in rows],
+                'name': [row[2] for row in rows],
+                'total_time': [row[3] for row in rows],
+                'nutrition': [json.loads(row[4]) for row in rows],
+                'tags': [json.loads(row[5]) for row in rows]
+            }
+
+
+class PostgresRecipeStore:
+    """
+        recipes table in a scratch schema of the configured Postgres database. The schema is
+        first on the search_path, so the API's own queries (FROM recipes) read the synthetic rows.
+    """
+
+    def __init__(self, config_dict, schema):
+        self.params = dict(dbname=config_dict["dbname"], user=config_dict["user"], password=config_dict["password"],
+                           host=config_dict["host"], port=config_dict["port"],
+                           options=f"-c search_path={schema}")
+        self.conn = psycopg2.connect(**self.params)
+        with self.conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS recipes (
+                id integer PRIMARY KEY, name text, description text, steps text[], ingredients text[],
+                tags text[], nutrition double precision[], total_time integer, image_url text,
+                ingredients_tokenized text[], source text
+            )""")
+        self.conn.commit()
+
+    def count(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM recipes")
+            return cur.fetchone()[0]
+
+    def reset(self):
+        with self.conn.cursor() as cur:
+            cur.execute("TRUNCATE recipes")
+        self.conn.commit()
+
+    def insert(self, rows):
+        with self.conn.cursor() as cur:
+            execute_values(cur, "INSERT INTO recipes VALUES %s", rows)
+        self.conn.commit()
+
+    def fetch(self, recipe_ids):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT * FROM recipes WHERE id = ANY(%s);", ([int(s) for s in recipe_ids],))
+            return cur.fetchall()
+
+    def iter_chunks(self, chunk_size):
+        # fetch_data_from_db closes its connection when done.
+        return create_faiss_index.fetch_data_from_db(psycopg2.connect(**self.params), chunk_size)
+
+
+# Open the corpus
+def open_store(config_dict, work_path, num_recipes, seed):
+    if config_dict.get("benchmark_db", 'sqlite').strip().lower() == "postgres":
+        return PostgresRecipeStore(config_dict, f"benchmark_{num_recipes}_{seed}")
+    return SqliteRecipeStore(os.path.join(work_path, "recipes.sqlite"))
+
+
+# Make sure corpus and index exist
+def prepare_corpus(store, index_path, num_recipes, seed, config_dict):
+    """
+        Generates the corpus and builds its index unless a previous run left them.
+        Returns build stats ({} when reused).
+    """
+    build = {}
+    if store.count() != num_recipes:
+        started = time.perf_counter()
+        store.reset()
+        for rows in generate_recipes(num_recipes, seed):
+            store.insert(rows)
+        build["corpus_seconds"] = round(time.perf_counter() - started, 2)
+        print(f"Generated {num_recipes} recipes in {build['corpus_seconds']}s")
+        # An index of an older corpus does not match the new rows.
+        if os.path.exists(os.path.join(index_path, "CURRENT")):
+            os.remove(os.path.join(index_path, "CURRENT"))
+
+    if read_current(index_path) is None:
+        metric = config_dict.get('index_metric', 'l2').strip().lower()
+        storage = config_dict.get('vector_storage', 'float32').strip().lower()
+        chunks = create_faiss_index.prefetch_chunks(store.iter_chunks(int(config_dict.get('chunk_size', '4096'))))
+        writers = [RankingTokenWriter(), InvertedIndexWriter(), BM25Writer(), MetadataWriter()]
+
+        started = time.perf_counter()
+        faiss_index, recipe_ids = create_faiss_index.build_faiss_index_from_chunks(
+            chunks, int(config_dict.get('encode_batch_size', '64')), writers, metric, storage)
+        version, version_path = begin_version(index_path)
+        create_faiss_index.save_faiss_index(faiss_index, recipe_ids, version_path)
+        for writer in writers:
+            writer.save(version_path)
+        publish_version(index_path, version, version_path,
+                        model_name=MODEL_NAME, dim=faiss_index.d, row_count=faiss_index.ntotal,
+                        keep_versions=1, index_source="benchmark", metric=metric, vector_storage=storage,
+                        embedding_backend=config_dict.get('embedding_backend', 'torch').strip().lower())
+        build["index_seconds"] = round(time.perf_counter() - started, 2)
+        build["recipes_per_sec"] = round(num_recipes / build["index_seconds"], 1)
+    return build
+
+
+# Query mix
+def sample_queries(store, num_recipes, num_queries, seed=11):
+    """
+        Returns [(kind, source recipe id or None, [ingredients])] following QUERY_MIX.
+    """
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(len(QUERY_MIX), size=num_queries, p=[share for _, share in QUERY_MIX])
+    source_ids = rng.integers(1, num_recipes + 1, size=num_queries)
+    ingredients_by_id = {row[0]: row[-2] for row in store.fetch(np.unique(source_ids))}
+
+    queries = []
+    for kind_id, source_id in zip(kinds, source_ids):
+        kind = QUERY_MIX[kind_id][0]
+        ingredients = list(ingredients_by_id[int(source_id)])
+        if kind == "known_item":
+            picks = rng.choice(len(ingredients), size=min(len(ingredients), int(rng.integers(2, 6))), replace=False)
+            queries.append((kind, int(source_id), [ingredients[i] for i in picks]))
+        elif kind == "single":
+            queries.append((kind, None, [ingredients[0]]))
+        else:
+            unknown = UNKNOWN_INGREDIENTS[int(rng.integers(len(UNKNOWN_INGREDIENTS)))]
+            queries.append((kind, None, [ingredients[0], unknown]))
+    return queries
+
+
+# Percentiles in ms
+def latency_summary(seconds):
+    values = np.asarray(seconds) * 1000
+    return {"p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3),
+            "p99_ms": round(float(np.percentile(values, 99)), 3),
+            "mean_ms": round(float(values.mean()), 3)}
+
+
+# One query through a pipeline
+def run_query(pipeline, snapshot, store, settings, ingredients, stages):
+    """
+        Runs one query, appending each stage's seconds to stages. Returns the top 5 rows.
+    """
+    started = time.perf_counter()
+    embedding = prepare_query(snapshot.faiss_index, create_faiss_index.generate_embedding(ingredients))
+    stages["encode"].append(time.perf_counter() - started)
+
+    if pipeline == "api":
+        started = time.perf_counter()
+        result = search_recipes(snapshot, embedding, ingredients, settings)
+        stages["retrieve_rank"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        rows_by_id = {row[0]: row for row in store.fetch(result.recipe_ids)}
+        stages["db_fetch"].append(time.perf_counter() - started)
+        return [rows_by_id[recipe_id] for recipe_id in result.recipe_ids if recipe_id in rows_by_id]
+
+    started = time.perf_counter()
+    positions, _ = search_index(embedding, snapshot.faiss_index, settings.top_k)
+    stages["faiss"].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    rows = store.fetch(snapshot.recipe_ids[positions])
+    stages["db_fetch"].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    ranked, _ = rank_rows(rows, ingredients)
+    stages["rank"].append(time.perf_counter() - started)
+    return ranked[:5]
+
+
+# Replay the query mix
+def run_pipeline(pipeline, snapshot, store, settings, queries, warm_up=20):
+    """
+        Returns latency, QPS and recall stats of one pipeline over the queries.
+    """
+    for _, _, ingredients in queries[:warm_up]:
+        run_query(pipeline, snapshot, store, settings, ingredients, {name: [] for name in STAGE_NAMES})
+
+    stages = {name: [] for name in STAGE_NAMES}
+    end_to_end = []
+    by_kind = {kind: [] for kind, _ in QUERY_MIX}
+    known_item_hits = []
+    all_match_share = []
+
+    run_started = time.perf_counter()
+    for kind, source_id, ingredients in queries:
+        started = time.perf_counter()
+        rows = run_query(pipeline, snapshot, store, settings, ingredients, stages)
+        elapsed = time.perf_counter() - started
+        end_to_end.append(elapsed)
+        by_kind[kind].append(elapsed)
+
+        if source_id is not None:
+            known_item_hits.append(any(row[0] == source_id for row in rows))
+        terms = set(normalize_terms(ingredients))
+        full_matches = sum(1 for row in rows if count_matches(ingredient_line(row[-2]), terms)[0] == len(terms))
+        all_match_share.append(full_matches / max(len(rows), 1))
+    wall = time.perf_counter() - run_started
+
+    return {
+        "queries": len(queries),
+        "qps": round(len(queries) / wall, 2),
+        "latency": {"end_to_end": latency_summary(end_to_end),
+                    **{name: latency_summary(values) for name, values in stages.items() if values},
+                    **{f"kind_{kind}": latency_summary(values) for kind, values in by_kind.items() if values}},
+        "recall": {"known_item@5": round(float(np.mean(known_item_hits)), 4) if known_item_hits else None,
+                   "all_match@5": round(float(np.mean(all_match_share)), 4)},
+    }
+
+
+# Disk size of the loaded version
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+               if os.path.isfile(os.path.join(path, name)))
+
+
+# Resident memory now (Linux), else the peak so far
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(num_recipes=10000, num_queries=500, seed=7):
+    config_dict = fetch_config_dict()
+    bench_root = os.path.join(config_dict.get('base_directory', ''), config_dict.get('benchmark_directory', 'Benchmarks'))
+    work_path = os.path.join(bench_root, f"corpus_{num_recipes}_{seed}")
+    index_path = os.path.join(work_path, "Index")
+    os.makedirs(index_path, exist_ok=True)
+
+    store = open_store(config_dict, work_path, num_recipes, seed)
+    build = prepare_corpus(store, index_path, num_recipes, seed, config_dict)
+
+    rss_before_load = rss_mb()
+    holder = IndexHolder(index_path, model_name=MODEL_NAME, verify=False, extensions=INDEX_EXTENSIONS)
+    snapshot = holder.get()
+    rss_after_load = rss_mb()
+
+    settings = RetrievalSettings.from_config(config_dict)
+    queries = sample_queries(store, num_recipes, num_queries)
+    print(f"Index version {snapshot.version}: {snapshot.faiss_index.ntotal} recipes, {len(queries)} queries.")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "corpus": {"recipes": num_recipes, "seed": seed, "db": type(store).__name__},
+        "settings": {"embedding_backend": config_dict.get('embedding_backend', 'torch'),
+                     "index_metric": snapshot.manifest.get("metric", "l2"),
+                     "vector_storage": snapshot.manifest.get("vector_storage", "float32"),
+                     "retrieval_mode": settings.mode, "top_k": settings.top_k,
+                     "top_k_stages": list(settings.top_k_stages)},
+        "build": build,
+        "load_times": {name: round(seconds, 4) for name, seconds in snapshot.load_times.items()},
+        "memory": {"index_bytes": directory_bytes(snapshot.path),
+                   "index_load_rss_mb": round(rss_after_load - rss_before_load, 1)},
+        "pipelines": {},
+    }
+    for pipeline in ("api", "legacy"):
+        report["pipelines"][pipeline] = run_pipeline(pipeline, snapshot, store, settings, queries)
+    report["memory"]["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    results_path = os.path.join(bench_root, "results")
+    os.makedirs(results_path, exist_ok=True)
+    output = os.path.join(results_path, f"{datetime.now():%Y%m%d-%H%M%S}_{num_recipes}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    print(f"Saved to {output}")
+    return report
+
+
+# Flatten a report to {dotted.key: number}
+def numeric_leaves(report, prefix=""):
+    leaves = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            leaves.update(numeric_leaves(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            leaves[name] = value
+    return leaves
+
+
+def compare(old_path, new_path):
+    """
+        Prints every numeric result of two reports with the relative change.
+    """
+    with open(old_path) as f:
+        old = numeric_leaves(json.load(f))
+    with open(new_path) as f:
+        new = numeric_leaves(json.load(f))
+
+    for name in sorted(old.keys() & new.keys()):
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else "n/a"
+        print(f"{name:<60} {old[name]:>12g} {new[name]:>12g} {change:>9}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["compare"]:
+        compare(*sys.argv[2:4])
+    else:
+        args = [int(arg) for arg in sys.argv[1:3]]
+        main(*args)
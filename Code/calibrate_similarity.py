@@ -0,0 +1,101 @@
+"""
+This script:
+1. Loads the current index version, which must be a cosine index (index_metric = cosine).
+2. Runs two query sets of raw ingredients (as users send them, see recipe_samples.py)
+   through retrieval and ranking:
+   recipe queries -> a few ingredients of one indexed recipe (retrieval should succeed),
+   mixed queries  -> one ingredient from each of several random recipes (often no good match).
+3. Records the best cosine similarity of the top 5 results and whether one of them
+   contains every query ingredient.
+4. Suggests similarity_threshold for config.ini: the given percentile of the similarity
+   of successful queries, and reports how many failed queries it would send to the AI.
+
+Usage:
+    python calibrate_similarity.py [num_queries] [ingredients_per_query] [percentile]
+"""
+
+import json
+import os
+import random
+import sys
+import numpy as np
+from config_reader import fetch_config_dict
+from embedding_backend import load_encoder
+from ranking import count_matches, normalize_ingredient, normalize_terms
+from retrieval import RetrievalSettings, retrieve, rank, prepare_query, top_similarity, uses_inner_product
+from compare_retrieval import load_snapshot, sample_queries
+from recipe_samples import query_text, sample_recipes
+
+
+# Queries unlikely to have a full match
+def sample_mixed_queries(config_dict, snapshot, num_queries, ingredients_per_query, seed=11):
+    """
+        Returns up to num_queries [[ingredients]], each ingredient taken from a different random recipe.
+        Recipes are sampled once (two per needed ingredient); groups that repeat an ingredient are dropped.
+    """
+    rng = random.Random(seed)
+    recipes = sample_recipes(config_dict, snapshot, 2 * num_queries * ingredients_per_query, 1, seed)
+    queries = []
+    for start in range(0, len(recipes) - ingredients_per_query + 1, ingredients_per_query):
+        ingredients = [rng.choice(ingredients) for _, ingredients in recipes[start:start + ingredients_per_query]]
+        if len({normalize_ingredient(ingredient) for ingredient in ingredients}) == ingredients_per_query:
+            queries.append(ingredients)
+            if len(queries) == num_queries:
+                break
+    return queries
+
+
+# Score one query
+def score_query(snapshot, model, ingredients, settings):
+    """
+        Returns (top-5 similarity, True if a top-5 result contains every ingredient).
+    """
+    lines = snapshot.extras["ranking"].lines
+    terms = normalize_terms(ingredients)
+    embedding = prepare_query(snapshot.faiss_index, model.encode(query_text(ingredients)))
+    ranked = rank(snapshot, retrieve(snapshot, embedding, ingredients, settings), ingredients)[:5]
+    success = any(count_matches(lines[candidate.position], terms)[0] == len(terms) for candidate in ranked)
+    return top_similarity(snapshot, ranked, embedding), success
+
+
+def main(num_queries=200, ingredients_per_query=3, percentile=5):
+    config_dict = fetch_config_dict()
+    index_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('index_directory', ''))
+
+    snapshot = load_snapshot(index_path)
+    if not uses_inner_product(snapshot.faiss_index):
+        raise ValueError(f"Index version {snapshot.version} is not a cosine index; rebuild with index_metric = cosine.")
+
+    model = load_encoder(config_dict)
+    settings = RetrievalSettings.from_config(config_dict)
+
+    queries = [ingredients for _, ingredients in sample_queries(config_dict, snapshot, num_queries, ingredients_per_query)]
+    queries += sample_mixed_queries(config_dict, snapshot, num_queries, ingredients_per_query)
+    scored = [score_query(snapshot, model, ingredients, settings) for ingredients in queries]
+
+    good = np.array([similarity for similarity, success in scored if success])
+    bad = np.array([similarity for similarity, success in scored if not success])
+    if len(good) == 0:
+        raise ValueError("No query found a full match; check the index before calibrating.")
+
+    threshold = float(np.percentile(good, percentile))
+    report = {
+        "index_version": snapshot.version,
+        "queries": len(scored),
+        "successful": len(good),
+        "failed": len(bad),
+        "good_similarity_p50": round(float(np.median(good)), 4),
+        "failed_similarity_p50": round(float(np.median(bad)), 4) if len(bad) else None,
+        "similarity_threshold": round(threshold, 4),
+        "successful_kept": round(float(np.mean(good >= threshold)), 4),
+        "failed_rejected": round(float(np.mean(bad < threshold)), 4) if len(bad) else None,
+    }
+
+    print(json.dumps(report, indent=2))
+    print(f"\nconfig.ini [SEARCH]: similarity_threshold = {report['similarity_threshold']}")
+    return report
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main(*args)
@@ -16,17 +16,86 @@ print(recipe["generic_name"])
 """
 
 from __future__ import annotations
-import json, re, subprocess, textwrap, time
+import asyncio, codecs, json, os, shlex, subprocess, textwrap, threading, time
 from typing import Dict, List
-import ast
+import llm_json
+from tracing import span, trace_headers, traceparent
 
 # ─── Configuration (override when calling generate_recipe) ───────────────────
 MODEL_TAG   = "gemma3:1b"       # must exist in `ollama list`
 TIMEOUT_SEC = 120
 MAX_RETRIES = 3
+OLLAMA_URL  = "http://localhost:11434"   # Ollama HTTP API, used by the async variants
+OLLAMA_COMMAND = "ollama"                 # CLI command line (e.g. a shim for load tests)
+OUTPUT_FORMAT = "json"                    # constrained output: "json", "schema" (HTTP API only) or "none"
+PROFILE = "rich"                          # generation profile (PROFILES)
+
+# ─── Generation profiles ─────────────────────────────────────────────────────
+# description_words goes into the prompt; the rest are Ollama options (None = the model's default).
+# The HTTP API takes the options per request; `ollama run` has no flags for them, so the CLI
+# only gets the shorter prompt (bake the options into a model with a Modelfile for the rest).
+GENERATION_OPTIONS = ("num_predict", "num_ctx", "temperature")
+PROFILES = {
+    # Short description, output capped at num_predict tokens (a cut-off object is still parsed,
+    # see llm_json.py) and a context just big enough for prompt + answer.
+    "fast": {"description_words": 40, "num_predict": 512, "num_ctx": 1024, "temperature": 0.3},
+    # The original behaviour
+    "rich": {"description_words": 300, "num_predict": None, "num_ctx": None, "temperature": None},
+}
+
+# JSON schema of a recipe, for Ollama's structured outputs (output_format="schema")
+_TEXT_LIST = {"type": "array", "items": {"type": "string"}}
+RECIPE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "generic_name": {"type": "string"},
+        "description": {"type": "string"},
+        "tags": _TEXT_LIST,
+        "nutrition": {
+            "type": "object",
+            "properties": {k: {"type": "string"} for k in
+                           ["calories", "total_fat", "sugar", "sodium", "protein", "saturated_fat"]},
+        },
+        "ingredient": _TEXT_LIST,
+        "steps": _TEXT_LIST,
+        "cuisine": {"type": "string"},
+        "prep_time": {"type": "string"},
+    },
+    "required": ["generic_name", "description", "tags", "nutrition",
+                 "ingredient", "steps", "cuisine", "prep_time"],
+}
+
+def get_profile(profile: str | Dict = PROFILE) -> Dict:
+    """Settings of a generation profile: a PROFILES name, or a dict of settings (see profile_from_config)."""
+    if isinstance(profile, dict):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown generation profile {profile!r}, expected one of: {', '.join(PROFILES)}")
+    return PROFILES[profile]
+
+def profile_from_config(config_dict: Dict, name: str | None = None) -> Dict:
+    """
+    Profile `name` (default: llm_profile) with the <name>_<setting> keys of config.ini applied,
+    e.g. fast_num_predict = 384. An empty option value means the model's default.
+    """
+    name = (name or config_dict.get("llm_profile", PROFILE)).strip().lower()
+    settings = dict(get_profile(name), name=name)
+    for key in ("description_words",) + GENERATION_OPTIONS:
+        value = config_dict.get(f"{name}_{key}")
+        if value is None:
+            continue
+        value = value.strip()
+        if key == "temperature":
+            settings[key] = float(value) if value else None
+        else:
+            settings[key] = int(value) if value else None
+    return settings
+
+def _ollama_options(settings: Dict) -> Dict:
+    return {key: settings[key] for key in GENERATION_OPTIONS if settings.get(key) is not None}
 
 # ─── Helpers ─────────────────────────────────────────────────────────────────
-def _build_prompt(ingredients: List[str]) -> str:
+def _build_prompt(ingredients: List[str], description_words: int = 300) -> str:
     ing = ", ".join(ingredients)
     return f"""You are a professional chef-bot.
 
@@ -36,7 +105,7 @@ def _build_prompt(ingredients: List[str]) -> str:
 
     {{
     "generic_name": "concise dish name",
-    "description": "≤300 words",
+    "description": "≤{description_words} words",
     "tags": ["tag1","tag2","tag3","tag4","tag5"],
     "nutrition": {{
         "calories": "",
@@ -52,23 +121,49 @@ def _build_prompt(ingredients: List[str]) -> str:
     "prep_time": "e.g. 20 min"
     }}"""
 
+def _ollama_cmd(prompt: str, model: str, ollama_command: str, output_format: str) -> List[str]:
+    """CLI command line; `ollama run` only knows --format json, so "schema" means json here."""
+    cmd = shlex.split(ollama_command) + ["run"]
+    if output_format not in ("", "none"):
+        cmd += ["--format", "json"]
+    return cmd + [model, prompt]
+
+def _generate_body(prompt: str, model: str, stream: bool, output_format: str, options: Dict | None = None) -> Dict:
+    """/api/generate request body; "format" constrains the output to JSON (or to RECIPE_SCHEMA)."""
+    body = {"model": model, "prompt": prompt, "stream": stream}
+    if output_format == "schema":
+        body["format"] = RECIPE_SCHEMA
+    elif output_format not in ("", "none"):
+        body["format"] = "json"
+    if options:
+        body["options"] = options
+    return body
+
 def _run_ollama(prompt: str,
                 model: str,
                 timeout_sec: int,
-                max_retries: int) -> str:
+                max_retries: int,
+                ollama_command: str = OLLAMA_COMMAND,
+                output_format: str = OUTPUT_FORMAT) -> str:
     """Launch the Ollama CLI and return UTF-8 decoded stdout."""
-    cmd = ["ollama", "run", model, prompt]
+    cmd = _ollama_cmd(prompt, model, ollama_command, output_format)
     backoff = 2
 
     for attempt in range(1, max_retries + 1):
         try:
-            completed = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,     # capture bytes
-                stderr=subprocess.PIPE,
-                check=True,
-                timeout=timeout_sec
-            )
+            with span("ollama.cli", model=model, attempt=attempt, prompt_chars=len(prompt)) as call:
+                # The trace continues in the CLI process through TRACEPARENT.
+                parent = traceparent()
+                env = dict(os.environ, TRACEPARENT=parent) if parent else None
+                completed = subprocess.run(
+                    cmd,
+                    stdout=subprocess.PIPE,     # capture bytes
+                    stderr=subprocess.PIPE,
+                    check=True,
+                    timeout=timeout_sec,
+                    env=env
+                )
+                call.set("output_bytes", len(completed.stdout))
             # Decode explicitly; never let Python pick the console code page
             return completed.stdout.decode("utf-8", errors="replace")
 
@@ -84,36 +179,110 @@ def _run_ollama(prompt: str,
         backoff *= 2
 
 
-def _fix_json(blob: str) -> str:
-    """
-    Repair the most common Gemma/Ollama mistakes so `json.loads` succeeds.
-    1. nutrition list-of-pairs  → dict
-    2. trailing comma before } or ]
-    3. smart quotes → straight quotes
-    """
+async def _run_ollama_http(client,
+                           prompt: str,
+                           model: str,
+                           ollama_url: str,
+                           timeout_sec: int,
+                           max_retries: int,
+                           output_format: str = OUTPUT_FORMAT,
+                           options: Dict | None = None) -> str:
+    """POST to Ollama's /api/generate with an async HTTP client (httpx) and return the text."""
+    backoff = 2
 
-    # smart quotes
-    blob = (blob
-            .replace("“", '"').replace("”", '"')
-            .replace("’", "'"))
+    for attempt in range(1, max_retries + 1):
+        try:
+            with span("ollama.http", model=model, attempt=attempt, prompt_chars=len(prompt)) as call:
+                response = await client.post(
+                    f"{ollama_url.rstrip('/')}/api/generate",
+                    json=_generate_body(prompt, model, False, output_format, options),
+                    headers=trace_headers(),
+                    timeout=timeout_sec
+                )
+                call.set("status_code", response.status_code)
+                response.raise_for_status()
+            return response.json()["response"]
+
+        except Exception as e:
+            print(f"⚠️  Ollama HTTP call failed (attempt {attempt}): {str(e)[:120]!r}")
 
-    # nutrition: ["k":"v", ...]  →  {"k":"v", ...}
-    def nutr_repl(m):
-        inner = m.group(1)
-        # grab "key": "value" pairs
-        pairs = re.findall(r'"([^"]+)"\s*:\s*"([^"]+)"', inner)
-        dict_str = ", ".join(f'"{k}":"{v}"' for k, v in pairs)
-        return f'"nutrition": {{{dict_str}}}'
+        if attempt == max_retries:
+            raise RuntimeError("Ollama HTTP API failed after several retries.")
+        await asyncio.sleep(backoff)
+        backoff *= 2
 
-    blob = re.sub(r'"nutrition"\s*:\s*\[(.*?)\]', nutr_repl, blob, flags=re.S)
 
-    # trailing commas  ,}
-    blob = re.sub(r',(\s*[}\]])', r'\1', blob)
+def _stream_ollama(prompt: str,
+                   model: str,
+                   timeout_sec: int,
+                   ollama_command: str = OLLAMA_COMMAND,
+                   output_format: str = OUTPUT_FORMAT):
+    """
+    Launch the Ollama CLI and yield its stdout as UTF-8 text while the model writes it.
+    No retries: the caller has already forwarded what was yielded.
+    """
+    cmd = _ollama_cmd(prompt, model, ollama_command, output_format)
+    parent = traceparent()
+    process = subprocess.Popen(cmd,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL,
+                               env=dict(os.environ, TRACEPARENT=parent) if parent else None)
+    # Portable timeout (select() does not work on Windows pipes): kill the CLI when it is up.
+    killer = threading.Timer(timeout_sec, process.kill)
+    killer.start()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        while True:
+            chunk = process.stdout.read1(4096)
+            if not chunk:
+                break
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+        if process.wait() != 0:
+            if not killer.is_alive():
+                raise subprocess.TimeoutExpired(cmd, timeout_sec)
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+    finally:
+        killer.cancel()
+        if process.poll() is None:
+            # The consumer stopped early (e.g. the client went away).
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+async def _stream_ollama_http(client,
+                              prompt: str,
+                              model: str,
+                              ollama_url: str,
+                              timeout_sec: int,
+                              output_format: str = OUTPUT_FORMAT,
+                              options: Dict | None = None):
+    """Stream /api/generate (NDJSON) with an httpx.AsyncClient and yield the text pieces."""
+    async with client.stream("POST",
+                             f"{ollama_url.rstrip('/')}/api/generate",
+                             json=_generate_body(prompt, model, True, output_format, options),
+                             headers=trace_headers(),
+                             timeout=timeout_sec) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.strip():
+                continue
+            part = json.loads(line)
+            if part.get("error"):
+                raise RuntimeError(f"Ollama: {part['error']}")
+            if part.get("response"):
+                yield part["response"]
+            if part.get("done"):
+                break
 
-    return blob
 
 # ─── New helper to build a theme-driven prompt ───────────────────────────────
-def _build_prompt_from_theme(theme: str) -> str:
+def _build_prompt_from_theme(theme: str, description_words: int = 300) -> str:
     return f"""You are a professional chef-bot.
 
 The user says: "{theme}"
@@ -125,7 +294,7 @@ Return ONLY valid JSON – no markdown fences, no commentary, exactly these keys
 
 {{
 "generic_name": "concise dish name",
-"description": "≤300 words",
+"description": "≤{description_words} words",
 "tags": ["tag1","tag2","tag3","tag4","tag5"],
 "nutrition": {{
     "calories": "",
@@ -147,7 +316,10 @@ def generate_recipe_from_theme(
         theme: str,
         model: str = MODEL_TAG,
         timeout_sec: int = TIMEOUT_SEC,
-        max_retries: int = MAX_RETRIES) -> Dict:
+        max_retries: int = MAX_RETRIES,
+        ollama_command: str = OLLAMA_COMMAND,
+        output_format: str = OUTPUT_FORMAT,
+        profile: str | Dict = PROFILE) -> Dict:
     """
     Return a recipe whose concept matches an imaginative theme or 'vibe'.
 
@@ -157,26 +329,21 @@ def generate_recipe_from_theme(
     >>> print(r["generic_name"])
     'Sun-Baked Sandstone Falafel'
     """
-    prompt = _build_prompt_from_theme(theme)
-    raw    = _run_ollama(prompt, model, timeout_sec, max_retries)
+    prompt = _build_prompt_from_theme(theme, get_profile(profile)["description_words"])
+    raw    = _run_ollama(prompt, model, timeout_sec, max_retries, ollama_command, output_format)
     recipe = _extract_json(raw)
     _normalise_nutrition(recipe)
     return recipe
 
 def _extract_json(text: str) -> dict:
-    clean = re.sub(r"```(?:json)?|```", "", text, flags=re.I).strip()
-    match = re.search(r"\{.*\}", clean, re.S)
-    if not match:
+    """
+    The recipe object in the model output, in one pass (llm_json.py): markdown fences, smart
+    quotes, trailing commas, list-of-pairs nutrition and truncated output are tolerated.
+    """
+    recipe = llm_json.loads(text)
+    if not isinstance(recipe, dict):
         raise ValueError("No JSON object found in model output.")
-
-    blob = _fix_json(match.group(0))
-
-    # 1st try strict JSON
-    try:
-        return json.loads(blob)
-    except json.JSONDecodeError:
-        # fallback: Python literal
-        return ast.literal_eval(blob)
+    return recipe
 
 def _normalise_nutrition(recipe: Dict) -> None:
     KEYS = ["calories", "total_fat", "sugar",
@@ -196,7 +363,10 @@ def generate_recipe(*,
                     ingredients: List[str],
                     model: str = MODEL_TAG,
                     timeout_sec: int = TIMEOUT_SEC,
-                    max_retries: int = MAX_RETRIES) -> Dict:
+                    max_retries: int = MAX_RETRIES,
+                    ollama_command: str = OLLAMA_COMMAND,
+                    output_format: str = OUTPUT_FORMAT,
+                    profile: str | Dict = PROFILE) -> Dict:
     """
     Return a Python dict with the recipe JSON.
 
@@ -204,11 +374,136 @@ def generate_recipe(*,
     ----------
     ingredients : list[str]
         Raw user ingredients.
-    model, timeout_sec, max_retries : optional
+    model, timeout_sec, max_retries, ollama_command : optional
         Override defaults at call-site.
+    output_format : optional
+        "json" (default) has Ollama constrain the output to JSON, "schema" to
+        RECIPE_SCHEMA (HTTP API; the CLI falls back to json), "none" leaves it free.
+    profile : optional
+        Generation profile, a PROFILES name ("fast", "rich") or settings from
+        profile_from_config; the CLI applies only its description length.
+    """
+    prompt = _build_prompt(ingredients, get_profile(profile)["description_words"])
+    raw    = _run_ollama(prompt, model, timeout_sec, max_retries, ollama_command, output_format)
+    recipe = _extract_json(raw)
+    _normalise_nutrition(recipe)
+    return recipe
+
+def parse_recipe(raw: str) -> Dict:
+    """Recipe dict of a complete model output (what generate_recipe returns)."""
+    recipe = _extract_json(raw)
+    _normalise_nutrition(recipe)
+    return recipe
+
+# ─── Streaming API (text chunks as the model writes; see recipe_stream.py) ───
+def stream_recipe(*,
+                  ingredients: List[str],
+                  model: str = MODEL_TAG,
+                  timeout_sec: int = TIMEOUT_SEC,
+                  ollama_command: str = OLLAMA_COMMAND,
+                  output_format: str = OUTPUT_FORMAT,
+                  profile: str | Dict = PROFILE):
+    """
+    Yield the raw model output of generate_recipe piece by piece.
+    Join the pieces and pass them to parse_recipe for the final dict.
+    """
+    prompt = _build_prompt(ingredients, get_profile(profile)["description_words"])
+    yield from _stream_ollama(prompt, model, timeout_sec, ollama_command, output_format)
+
+def stream_recipe_from_theme(*,
+                             theme: str,
+                             model: str = MODEL_TAG,
+                             timeout_sec: int = TIMEOUT_SEC,
+                             ollama_command: str = OLLAMA_COMMAND,
+                             output_format: str = OUTPUT_FORMAT,
+                             profile: str | Dict = PROFILE):
+    """Streaming variant of generate_recipe_from_theme (see stream_recipe)."""
+    prompt = _build_prompt_from_theme(theme, get_profile(profile)["description_words"])
+    yield from _stream_ollama(prompt, model, timeout_sec, ollama_command, output_format)
+
+async def stream_recipe_async(client,
+                              *,
+                              ingredients: List[str],
+                              model: str = MODEL_TAG,
+                              ollama_url: str = OLLAMA_URL,
+                              timeout_sec: int = TIMEOUT_SEC,
+                              output_format: str = OUTPUT_FORMAT,
+                              profile: str | Dict = PROFILE):
+    """Streaming variant of generate_recipe_async over the Ollama HTTP API."""
+    settings = get_profile(profile)
+    prompt = _build_prompt(ingredients, settings["description_words"])
+    async for piece in _stream_ollama_http(client, prompt, model, ollama_url, timeout_sec, output_format,
+                                           _ollama_options(settings)):
+        yield piece
+
+async def stream_recipe_from_theme_async(client,
+                                         *,
+                                         theme: str,
+                                         model: str = MODEL_TAG,
+                                         ollama_url: str = OLLAMA_URL,
+                                         timeout_sec: int = TIMEOUT_SEC,
+                                         output_format: str = OUTPUT_FORMAT,
+                                         profile: str | Dict = PROFILE):
+    """Streaming variant of generate_recipe_from_theme_async."""
+    settings = get_profile(profile)
+    prompt = _build_prompt_from_theme(theme, settings["description_words"])
+    async for piece in _stream_ollama_http(client, prompt, model, ollama_url, timeout_sec, output_format,
+                                           _ollama_options(settings)):
+        yield piece
+
+def recipe_request(*,
+                   ingredients: List[str] | None = None,
+                   theme: str | None = None,
+                   model: str = MODEL_TAG,
+                   stream: bool = True,
+                   output_format: str = OUTPUT_FORMAT,
+                   profile: str | Dict = PROFILE) -> Dict:
+    """/api/generate body of a recipe for ingredients, or for a theme (e.g. for benchmarks)."""
+    settings = get_profile(profile)
+    if theme is not None:
+        prompt = _build_prompt_from_theme(theme, settings["description_words"])
+    else:
+        prompt = _build_prompt(ingredients or [], settings["description_words"])
+    return _generate_body(prompt, model, stream, output_format, _ollama_options(settings))
+
+# ─── Async API (Ollama HTTP API, for api_async.py) ───────────────────────────
+async def generate_recipe_async(client,
+                                *,
+                                ingredients: List[str],
+                                model: str = MODEL_TAG,
+                                ollama_url: str = OLLAMA_URL,
+                                timeout_sec: int = TIMEOUT_SEC,
+                                max_retries: int = MAX_RETRIES,
+                                output_format: str = OUTPUT_FORMAT,
+                                profile: str | Dict = PROFILE) -> Dict:
+    """
+    Same as generate_recipe, over HTTP without blocking the event loop.
+    `client` is an httpx.AsyncClient.
+    """
+    settings = get_profile(profile)
+    prompt = _build_prompt(ingredients, settings["description_words"])
+    raw    = await _run_ollama_http(client, prompt, model, ollama_url, timeout_sec, max_retries, output_format,
+                                    _ollama_options(settings))
+    recipe = _extract_json(raw)
+    _normalise_nutrition(recipe)
+    return recipe
+
+async def generate_recipe_from_theme_async(client,
+                                           *,
+                                           theme: str,
+                                           model: str = MODEL_TAG,
+                                           ollama_url: str = OLLAMA_URL,
+                                           timeout_sec: int = TIMEOUT_SEC,
+                                           max_retries: int = MAX_RETRIES,
+                                           output_format: str = OUTPUT_FORMAT,
+                                           profile: str | Dict = PROFILE) -> Dict:
+    """
+    Same as generate_recipe_from_theme, over HTTP without blocking the event loop.
     """
-    prompt = _build_prompt(ingredients)
-    raw    = _run_ollama(prompt, model, timeout_sec, max_retries)
+    settings = get_profile(profile)
+    prompt = _build_prompt_from_theme(theme, settings["description_words"])
+    raw    = await _run_ollama_http(client, prompt, model, ollama_url, timeout_sec, max_retries, output_format,
+                                    _ollama_options(settings))
     recipe = _extract_json(raw)
     _normalise_nutrition(recipe)
     return recipe
@@ -0,0 +1,163 @@
+"""
+This script:
+1. Reads the preprocessed CSV files.
+2. Parses the stringified list columns once (ast.literal_eval).
+3. Writes them to Parquet with native list<string> columns.
+
+Parquet files are read back through pyarrow with column projection and
+memory mapping, so db_push and index builds never re-parse list strings.
+
+Usage:
+    python columnar_store.py                 -> converts every CSV in data_dir
+    python columnar_store.py path/to/file.csv
+"""
+
+import ast
+import os
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config_reader import fetch_config_dict
+
+
+# Files in the order db_push inserts them (ids are assigned in this order).
+DATA_FILES = ['small_csv', 'big_csv']
+
+# CSV columns holding stringified python lists, per file.
+LIST_COLUMNS = {
+    'big_csv': ['steps', 'ingredients', 'tags', 'nutrition'],
+    'small_csv': ['split_steps', 'Cleaned_Ingredients', 'Ingredients_tokenized'],
+}
+
+
+# Parse a stringified list
+def parse_list_value(value):
+    """
+        Converts a CSV cell into a python list of strings.
+        "['a', 'b']" -> ['a', 'b'], "a, b" -> ['a', 'b'], NaN or any other non-list value -> []
+    """
+    if hasattr(value, 'tolist'):
+        value = value.tolist()
+
+    if isinstance(value, list):
+        return [str(v) for v in value if v is not None]
+
+    if isinstance(value, str):
+        try:
+            parsed = ast.literal_eval(value)
+            if not isinstance(parsed, list):
+                parsed = [parsed]
+            return [str(v) for v in parsed if v is not None]
+        except Exception:
+            return [v.strip() for v in value.split(',') if v.strip()]
+
+    return []
+
+
+# Locate data file
+def find_data_file(data_path, stem):
+    """
+        Returns the path for a data file stem, preferring Parquet over CSV.
+        Returns None if neither exists.
+    """
+    for extension in ('.parquet', '.csv'):
+        path = os.path.join(data_path, stem + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# Convert CSV to Parquet
+def convert_csv_to_parquet(csv_path, parquet_path=None):
+    """
+        Converts one preprocessed CSV to Parquet.
+        List columns are stored as list<string>; all other columns keep pandas types.
+    """
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    if parquet_path is None:
+        parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+
+    df = pd.read_csv(csv_path)
+    list_columns = [col for col in LIST_COLUMNS.get(stem, []) if col in df.columns]
+
+    for col in list_columns:
+        df[col] = df[col].apply(parse_list_value)
+
+    schema_overrides = {col: pa.list_(pa.string()) for col in list_columns}
+    fields = []
+    for col in df.columns:
+        if col in schema_overrides:
+            fields.append(pa.field(col, schema_overrides[col]))
+        else:
+            fields.append(pa.Schema.from_pandas(df[[col]], preserve_index=False).field(col))
+
+    table = pa.Table.from_pandas(df, schema=pa.schema(fields), preserve_index=False)
+    pq.write_table(table, parquet_path)
+    print(f"Wrote {parquet_path} ({table.num_rows} rows, list columns: {list_columns})")
+    return parquet_path
+
+
+# Read data file
+def read_data_file(path, columns=None):
+    """
+        Reads a CSV or Parquet data file into a DataFrame.
+        Parquet is memory mapped and only the requested columns are loaded.
+        List columns come back as numpy arrays (see parse_list_value).
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(columns))
+
+    if path.endswith('.parquet'):
+        if columns is not None:
+            available = pq.read_schema(path).names
+            columns = [col for col in columns if col in available]
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    if columns is not None:
+        return pd.read_csv(path, usecols=lambda col: col in columns)
+    return pd.read_csv(path)
+
+
+# Iterate data file in chunks
+def iter_data_file(path, columns, chunk_size=4096):
+    """
+        Yields {column: [values]} chunks of a CSV or Parquet file.
+        List columns are returned as python lists in both formats.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    list_columns = set(LIST_COLUMNS.get(stem, []))
+    columns = list(dict.fromkeys(columns))
+
+    if path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        columns = [col for col in columns if col in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pydict()
+        return
+
+    for df in pd.read_csv(path, usecols=lambda col: col in columns, chunksize=chunk_size):
+        chunk = {}
+        for col in df.columns:
+            if col in list_columns:
+                chunk[col] = [parse_list_value(value) for value in df[col]]
+            else:
+                chunk[col] = df[col].tolist()
+        yield chunk
+
+
+def main(paths=None):
+    """
+        Converts the given CSV files, or every CSV in data_dir.
+    """
+    if not paths:
+        config_dict = fetch_config_dict()
+        data_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('data_dir', ''))
+        paths = [os.path.join(data_path, name) for name in sorted(os.listdir(data_path)) if name.endswith('.csv')]
+
+    for path in paths:
+        convert_csv_to_parquet(path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,116 @@
+"""
+This script:
+1. Loads the current index version with its ranking, inverted and BM25 artifacts.
+2. Builds queries from the indexed recipes themselves (a few raw ingredients of a random recipe,
+   read from the DB or the data files, see recipe_samples.py).
+3. Runs every query through the previous FAISS-only pipeline, dense (+ exact matches)
+   and hybrid retrieval, each followed by ranking.
+4. Reports latency (p50/p95) and recall for each mode.
+
+Recall:
+    known_item@5  -> the recipe the query was taken from is in the top 5.
+    all_match@5   -> share of top 5 results that contain every query ingredient.
+
+Usage:
+    python compare_retrieval.py [num_queries] [ingredients_per_query]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+from config_reader import fetch_config_dict
+from embedding_backend import load_encoder
+from index_store import load_index_version
+from ranking import load_ranking_engine, count_matches, normalize_terms
+from ingredient_index import load_inverted_index
+from sparse_index import load_bm25_index
+from retrieval import RetrievalSettings, retrieve, rank, prepare_query
+from recipe_samples import query_text, sample_recipes
+
+# Load snapshot with artifacts
+def load_snapshot(index_path):
+    snapshot = load_index_version(index_path, verify=False)
+    snapshot.extras["ranking"] = load_ranking_engine(snapshot.path)
+    snapshot.extras["inverted"] = load_inverted_index(snapshot.path)
+    snapshot.extras["bm25"] = load_bm25_index(snapshot.path)
+    if snapshot.extras["ranking"] is None:
+        raise ValueError(f"Index version {snapshot.version} has no ingredient token file; rebuild it.")
+    return snapshot
+
+
+# Sample queries from the corpus
+def sample_queries(config_dict, snapshot, num_queries, ingredients_per_query, seed=7):
+    """
+        Returns [(source position, [ingredients])] taken from indexed recipes, up to num_queries.
+    """
+    rng = random.Random(seed)
+    return [(position, rng.sample(ingredients, ingredients_per_query))
+            for position, ingredients in sample_recipes(config_dict, snapshot, num_queries, ingredients_per_query, seed)]
+
+
+# Percentile helper
+def percentile_ms(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3)
+
+
+# Run one mode
+def run_mode(snapshot, model, queries, settings, label):
+    """
+        Returns latency and recall stats for one retrieval mode.
+    """
+    latencies = []
+    known_item_hits = 0
+    all_match_share = []
+    lines = snapshot.extras["ranking"].lines
+
+    for position, ingredients in queries:
+        terms = normalize_terms(ingredients)
+        embedding = prepare_query(snapshot.faiss_index, model.encode(query_text(ingredients)))
+
+        started = time.perf_counter()
+        candidates = retrieve(snapshot, embedding, ingredients, settings)
+        ranked = rank(snapshot, candidates, ingredients)[:5]
+        latencies.append(time.perf_counter() - started)
+
+        top_positions = [candidate.position for candidate in ranked]
+        known_item_hits += position in top_positions
+        full_matches = sum(1 for p in top_positions if count_matches(lines[p], terms)[0] == len(terms))
+        all_match_share.append(full_matches / max(len(top_positions), 1))
+
+    return {
+        "mode": label,
+        "queries": len(queries),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "known_item@5": round(known_item_hits / len(queries), 4),
+        "all_match@5": round(float(np.mean(all_match_share)), 4),
+    }
+
+
+def main(num_queries=200, ingredients_per_query=3):
+    config_dict = fetch_config_dict()
+    index_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('index_directory', ''))
+
+    snapshot = load_snapshot(index_path)
+    model = load_encoder(config_dict)
+    queries = sample_queries(config_dict, snapshot, num_queries, ingredients_per_query)
+    print(f"Index version {snapshot.version}: {snapshot.faiss_index.ntotal} recipes, {len(queries)} queries.")
+
+    report = []
+    for label, mode, exact_matches in (("faiss_only", "dense", False), ("dense", "dense", True), ("hybrid", "hybrid", True)):
+        settings = RetrievalSettings.from_config(config_dict)
+        settings.mode = mode
+        if not exact_matches:
+            settings.exact_match_candidates = 0
+        report.append(run_mode(snapshot, model, queries, settings, label))
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
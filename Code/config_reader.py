@@ -6,6 +6,9 @@ import os
 BASE_PATH = os.path.expanduser("~/Desktop")
 CONFIG_FILE_PATH = os.path.join(BASE_PATH, "COMP 680", "Recipe_Generator", "config.ini") 
 
+# RECIPE_CONFIG=<path> points every script at another config file (e.g. load_test.py's).
+CONFIG_FILE_PATH = os.environ.get("RECIPE_CONFIG", CONFIG_FILE_PATH)
+
 
 #Function to read a config INI file.
 def fetch_config_dict(file_path = CONFIG_FILE_PATH, section=None):
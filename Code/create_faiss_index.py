@@ -1,23 +1,50 @@
 """
 This script:
 
-1. Loads data from DB.
+1. Loads data from DB, or straight from the preprocessed files (index_source = files).
 2. Creates index on tokenized ingredients and saves it to file.
 3. Saves id (primary key) into the index folder.
+4. Publishes the build as a new version (see index_store.py) so a running API can hot-swap it.
+
+Data is consumed in chunks and each chunk is embedded as a batch, so a
+files build needs no database and scales with CPU.
+
+index_metric = cosine L2-normalizes the embeddings and searches by inner product;
+vector_storage = float16 / int8 stores them scalar-quantized (1/2 or 1/4 of float32).
+Both are recorded in the version manifest. int8 needs per-dimension value ranges: a first
+pass over the source reservoir-samples training_sample_size recipes from the whole corpus
+and the quantizer is trained on their embeddings before any vector is added.
  
 """
 
 import os
 from config_reader import fetch_config_dict
+from embedding_backend import MODEL_NAME, load_encoder
+from db_push import stream_data_from_files
+from index_store import begin_version, publish_version
+from ranking import RankingTokenWriter
+from ingredient_index import InvertedIndexWriter
+from sparse_index import BM25Writer
+from recipe_metadata import MetadataWriter
 import psycopg2
-import pandas as pd
+import itertools
+import queue
+import random
 import re
-from sentence_transformers import SentenceTransformer
+import threading
 import numpy as np
 import faiss
 
-# Initialize model to generate embeddings
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Initialize model to generate embeddings (torch, torch_int8 or onnx, see embedding_backend.py)
+model = load_encoder(fetch_config_dict())
+
+# vector_storage -> FAISS scalar quantizer (float32 keeps a flat, exact index)
+SCALAR_QUANTIZERS = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+# vector_storage values whose quantizer must be trained before vectors are added
+TRAINED_STORAGES = {"int8"}
 
 # Connect to Database
 def create_connection(config_dict):
@@ -38,20 +65,89 @@ def create_connection(config_dict):
     return conn
 
 # Fetch data from DB
-def fetch_data_from_db(conn):
+def fetch_data_from_db(conn, chunk_size=4096, itersize=2000):
+    """
+        Yields {'id', 'ingredients_tokenized', 'name', 'total_time', 'nutrition', 'tags'} chunks
+        (column -> list of values) from the recipes table.
+        Uses a named (server-side) cursor that is iterated, so rows are pulled itersize
+        at a time (one FETCH per round trip) instead of buffering the whole table in client
+        memory; chunk_size only sets how many rows go into one yielded chunk.
+    """
     # Query to fetch required columns
     query = """
-    SELECT id, ingredients_tokenized
-    FROM recipes;
+    SELECT id, ingredients_tokenized, name, total_time, nutrition, tags
+    FROM recipes
+    ORDER BY id;
     """
-    
-    # Load data into a Pandas DataFrame
-    df = pd.read_sql(query, conn)
-    
-    # Close the connection
-    conn.close()
-    
-    return df
+
+    try:
+        with conn.cursor(name="recipe_index_stream") as cur:
+            cur.itersize = itersize
+            cur.execute(query)
+            while True:
+                # Iterating (not fetchmany) is what makes psycopg2 honour itersize.
+                rows = list(itertools.islice(cur, chunk_size))
+                if not rows:
+                    break
+                yield {
+                    'id': [row[0] for row in rows],
+                    'ingredients_tokenized': [row[1] for row in rows],
+                    'name': [row[2] for row in rows],
+                    'total_time': [row[3] for row in rows],
+                    'nutrition': [row[4] for row in rows],
+                    'tags': [row[5] for row in rows]
+                }
+    finally:
+        # Close the connection
+        conn.close()
+
+# Prefetch chunks in a background thread
+def prefetch_chunks(chunks, depth=2):
+    """
+        Pulls chunks from the source generator in a background thread while the
+        caller encodes the previous ones. At most `depth` chunks are buffered.
+        Closing this generator (e.g. when the caller fails) stops the thread and closes
+        the source generator.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Bounded waits, so a consumer that went away cannot block the thread forever.
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            put(done)
+
+    threading.Thread(target=producer, daemon=True).start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
 
 #Clean DB data after fetching
 def preprocess_ingredients(ingredients):
@@ -71,6 +167,13 @@ def generate_embedding(ingredients):
     embedding = model.encode(" ".join(processed_ingredients))
     return embedding
 
+def generate_embeddings(ingredient_lists, batch_size=64):
+    """
+    Generates dense embeddings for many ingredient lists in one batched encode call.
+    """
+    texts = [" ".join(preprocess_ingredients(ingredients)) for ingredients in ingredient_lists]
+    return model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
 def build_faiss_index(embeddings):
     """
     Builds a FAISS index for fast similarity search.
@@ -80,6 +183,82 @@ def build_faiss_index(embeddings):
     index.add(np.vstack(embeddings))  # Add embeddings to the index
     return index
 
+def new_faiss_index(dimension, metric="l2", storage="float32"):
+    """
+    Creates an empty FAISS index.
+    metric: l2 (squared L2 distance) or cosine (inner product on normalized vectors).
+    storage: float32, float16 or int8 (int8 must be trained before adding vectors).
+    """
+    if metric not in ("l2", "cosine"):
+        raise ValueError(f"Unknown index_metric {metric!r}, use l2 or cosine")
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+    if storage == "float32":
+        return faiss.IndexFlatIP(dimension) if metric == "cosine" else faiss.IndexFlatL2(dimension)
+    if storage not in SCALAR_QUANTIZERS:
+        raise ValueError(f"Unknown vector_storage {storage!r}, use float32, float16 or int8")
+    return faiss.IndexScalarQuantizer(dimension, SCALAR_QUANTIZERS[storage], faiss_metric)
+
+def build_faiss_index_from_chunks(chunks, batch_size=64, writers=(), metric="l2", storage="float32",
+                                  training_sample=None):
+    """
+    Embeds each chunk as it arrives and adds it to the FAISS index.
+    Every writer also sees each chunk (writer.add) to build its artifact in index order.
+    Quantizers that need training (int8) are trained on training_sample (ingredient lists
+    drawn across the corpus, see sample_training_ingredients), or on the first chunk without one.
+    Returns the index and the recipe ids in index order.
+    """
+    index = None
+    id_chunks = []
+    row_count = 0
+    for chunk in chunks:
+        if not chunk['id']:
+            continue
+        embeddings = np.ascontiguousarray(generate_embeddings(chunk['ingredients_tokenized'], batch_size), dtype='float32')
+        if metric == "cosine":
+            faiss.normalize_L2(embeddings)
+        if index is None:
+            index = new_faiss_index(embeddings.shape[1], metric, storage)
+            if not index.is_trained:
+                index.train(embed_training_sample(training_sample, batch_size, metric) if training_sample else embeddings)
+        index.add(embeddings)
+        for writer in writers:
+            writer.add(chunk)
+        id_chunks.append(np.asarray(chunk['id']))
+        row_count += len(chunk['id'])
+        print(f"Embedded {row_count} recipes")
+
+    if index is None:
+        raise ValueError("No recipes found to index.")
+    return index, np.concatenate(id_chunks)
+
+# Reservoir-sample ingredient lists over the whole source
+def sample_training_ingredients(chunks, size, seed=13):
+    """
+    One pass over the chunks keeping a uniform random sample of `size` ingredient lists,
+    so the sample covers every data file, not just the first rows.
+    """
+    rng = random.Random(seed)
+    sample = []
+    seen = 0
+    for chunk in chunks:
+        for ingredients in chunk['ingredients_tokenized']:
+            if len(sample) < size:
+                sample.append(ingredients)
+            else:
+                slot = rng.randrange(seen + 1)
+                if slot < size:
+                    sample[slot] = ingredients
+            seen += 1
+    print(f"Sampled {len(sample)} of {seen} recipes to train the quantizer.")
+    return sample
+
+def embed_training_sample(training_sample, batch_size=64, metric="l2"):
+    embeddings = np.ascontiguousarray(generate_embeddings(training_sample, batch_size), dtype='float32')
+    if metric == "cosine":
+        faiss.normalize_L2(embeddings)
+    return embeddings
+
 def save_faiss_index(faiss_index, recipe_ids, index_path):
     # Save the FAISS index
     faiss.write_index(faiss_index, os.path.join(index_path, "recipe_index.faiss"))
@@ -102,27 +281,56 @@ def main_create_embeddings():
         os.mkdir(index_path)
         print("Created directory to store index.")
     
-    # Load data from DB.
-    conn = create_connection(config_dict)
-    df = fetch_data_from_db(conn)
-    print("Loaded data from DB.")
+    # Pick the data source: db (default) or the preprocessed files.
+    index_source = config_dict.get('index_source', 'db').strip().lower()
+    chunk_size = int(config_dict.get('chunk_size', '4096'))
+    batch_size = int(config_dict.get('encode_batch_size', '64'))
+    metric = config_dict.get('index_metric', 'l2').strip().lower()
+    storage = config_dict.get('vector_storage', 'float32').strip().lower()
 
-    # Apply embedding generation to the DataFrame
-    df["embedding"] = df["ingredients_tokenized"].apply(generate_embedding)
-    print("Embeddings Generated")
+    def open_chunks():
+        if index_source == 'files':
+            data_path = os.path.join(base_directory, config_dict.get('data_dir', ''))
+            return stream_data_from_files(data_path, chunk_size, int(config_dict.get('start_id', '1')))
+        return fetch_data_from_db(create_connection(config_dict), chunk_size, int(config_dict.get('itersize', '2000')))
 
-    # Build the FAISS index
-    embeddings = df["embedding"].tolist()
-    faiss_index = build_faiss_index(embeddings)
-    print("FAISS Index Generated")
+    # Quantizers that need training get a sample of the whole corpus (first pass), not its first chunk.
+    training_sample = None
+    if storage in TRAINED_STORAGES:
+        training_sample = sample_training_ingredients(open_chunks(), int(config_dict.get('training_sample_size', '20000')))
 
-    # Map recipe IDs to FAISS indices
-    recipe_ids = df["id"].values
+    chunks = open_chunks()
+    print("Building index from preprocessed files." if index_source == 'files' else "Streaming index data from DB.")
 
-    # Save FAISS Index to file.
-    save_faiss_index(faiss_index, recipe_ids, index_path)
+    # Fetch the next chunk while the current one is encoded.
+    chunks = prefetch_chunks(chunks, int(config_dict.get('prefetch_chunks', '2')))
+
+    # Artifacts saved alongside the index, aligned with FAISS positions.
+    writers = [RankingTokenWriter(), InvertedIndexWriter(), BM25Writer(), MetadataWriter()]
+
+    # Embed chunk by chunk and build the FAISS index; recipe IDs map to FAISS positions.
+    try:
+        faiss_index, recipe_ids = build_faiss_index_from_chunks(chunks, batch_size, writers, metric, storage,
+                                                                training_sample)
+    finally:
+        chunks.close()
+    print(f"FAISS Index Generated ({metric}, {storage})")
+
+    # Save FAISS Index into a new version folder and point CURRENT at it.
+    version, version_path = begin_version(index_path)
+    save_faiss_index(faiss_index, recipe_ids, version_path)
+    for writer in writers:
+        writer.save(version_path)
+    publish_version(index_path, version, version_path,
+                    model_name=MODEL_NAME,
+                    dim=faiss_index.d,
+                    row_count=faiss_index.ntotal,
+                    keep_versions=int(config_dict.get('keep_versions', '3')),
+                    index_source=index_source,
+                    embedding_backend=config_dict.get('embedding_backend', 'torch').strip().lower(),
+                    metric=metric,
+                    vector_storage=storage)
 
-    
 
 if __name__ == '__main__':
     main_create_embeddings()
\ No newline at end of file
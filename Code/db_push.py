@@ -3,9 +3,13 @@ This script is use to batch insert data in the database. Credentials to be picke
 Functionality:
     1. Read Config Dict
     2. Connect to DB.
-    3. Read the CSV files
+    3. Read the CSV (or Parquet) files
     4. Validate the csv rows
     5. Push batch to DB.
+    6. Record the first id and the skipped (failed) rows in data_dir/db_push_record.json, so an
+       index built from the files (index_source = files) assigns the same ids as the DB.
+    7. Stream the files as recipe rows with those ids (stream_data_from_files), for builds and
+       tools that read the files instead of the DB.
 
 DB Create script -->
 CREATE TABLE recipes (
@@ -26,9 +30,10 @@ CREATE TABLE recipes (
 
 
 import psycopg2
-import ast
 from config_reader import fetch_config_dict
+from columnar_store import DATA_FILES, find_data_file, iter_data_file, parse_list_value, read_data_file
 import os
+import json
 import pandas as pd
 
 
@@ -40,6 +45,8 @@ db_columns = [
 
 ARRAY_COLUMNS = {'instructions', 'main_ingredients', 'tags', 'nutrition', 'ingredients_tokenized'}
 
+PUSH_RECORD_FILE = "db_push_record.json"
+
 
 # Connect to Database
 def create_connection(config_dict):
@@ -60,11 +67,12 @@ def create_connection(config_dict):
     return conn
 
 # Read CSV file
-def read_csv_file(csv_path, csv_to_fetch):
+def read_csv_file(csv_path, csv_to_fetch, columns=None):
     """
-        Read the csv file based on the input argument.
+        Read the csv (or parquet) file based on the input argument.
+        Parquet files are memory mapped and only `columns` are loaded.
     """
-    df = pd.read_csv(os.path.join(csv_path, csv_to_fetch))
+    df = read_data_file(os.path.join(csv_path, csv_to_fetch), columns=columns)
     return df
 
 # Get Column Mapping for each CSV file
@@ -72,7 +80,9 @@ def get_column_mapping(key):
     """
         This fxn returns the column mapping for each of the files.
         DB COlumn : CSV Column
+        Parquet copies share the mapping of their CSV (big_csv.parquet -> big_csv.csv).
     """
+    key = os.path.splitext(key)[0] + '.csv'
 
     # Column mapping from DB to CSV
     COLUMN_MAP = {
@@ -120,22 +130,15 @@ def validate_and_transform_row(row, column_map):
         csv_col = column_map.get(db_col)
         value = row.get(csv_col, None)
 
+        # Convert list-type columns to Python lists (Parquet lists arrive as arrays)
+        if db_col in ARRAY_COLUMNS:
+            transformed_row.append(parse_list_value(value))
+            continue
+
         # Normalize NaN to None
         if pd.isna(value):
             value = None
 
-        # Convert list-type columns to Python lists
-        if db_col in ARRAY_COLUMNS:
-            if isinstance(value, str):
-                try:
-                    value = ast.literal_eval(value)
-                    if not isinstance(value, list):
-                        value = [value]
-                except Exception:
-                    value = [v.strip() for v in value.split(',') if v.strip()]
-            else:
-                value = value if isinstance(value, list) else []
-
         transformed_row.append(value)
 
     return transformed_row  # Ensure no critical fields are missing
@@ -164,20 +167,25 @@ def generate_ids(rows, max_id, filename):
 
 # Start the CSV Processing.
 def process_csv(df, conn, column_map, filename, batch_size=100):
+    """
+        Inserts the valid rows of df; returns the positions (0-based, file order) of the rows skipped.
+    """
     valid_rows = []
     failed_rows = []
+    skipped_positions = []
 
     # Get the current maximum ID
     with conn.cursor() as cur:
         max_id = get_max_id(cur)
 
-    for _, row in df.iterrows():
+    for position, (_, row) in enumerate(df.iterrows()):
         try:
             transformed_row = validate_and_transform_row(row, column_map)
             valid_rows.append(transformed_row)
         except Exception as e:
             print(f"Error processing row: {row}, Error: {e}")
             failed_rows.append(row)
+            skipped_positions.append(position)
 
         # Batch insert
         if len(valid_rows) >= batch_size:
@@ -199,6 +207,72 @@ def process_csv(df, conn, column_map, filename, batch_size=100):
         fail_filename = f"failed_{os.path.basename(filename)}"
         failed_df.to_csv(fail_filename, index=False)
         print(f"⚠️ Saved failed records to {fail_filename}")
+    return skipped_positions
+
+
+# Write the push record
+def save_push_record(data_path, start_id, skipped):
+    """
+        start_id: first id of this push; skipped: {file stem: [skipped row positions]}.
+    """
+    with open(os.path.join(data_path, PUSH_RECORD_FILE), "w") as f:
+        json.dump({"start_id": start_id, "skipped": skipped}, f)
+
+
+# Read the push record
+def load_push_record(data_path):
+    """
+        The record of the last db_push run from data_path, None if there is none.
+    """
+    try:
+        with open(os.path.join(data_path, PUSH_RECORD_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+# Stream data from preprocessed files
+def stream_data_from_files(data_path, chunk_size=4096, start_id=1):
+    """
+        Yields the same chunks as create_faiss_index.fetch_data_from_db straight from the
+        preprocessed Parquet/CSV files, without a database.
+        Ids are assigned the way main() assigns them: sequentially from start_id
+        across DATA_FILES in insert order, leaving out the rows that were skipped.
+        Both come from the push record (db_push_record.json) when data_path has one;
+        without it start_id is used and every row is assumed inserted.
+    """
+    record = load_push_record(data_path)
+    if record is not None:
+        start_id = record["start_id"]
+        print(f"Ids from {data_path}'s db_push record: start_id {start_id}, "
+              f"{sum(len(rows) for rows in record['skipped'].values())} skipped rows left out")
+    else:
+        print(f"No db_push record in {data_path}: assuming every row was inserted from id {start_id}")
+    next_id = start_id
+    for stem in DATA_FILES:
+        data_file = find_data_file(data_path, stem)
+        if data_file is None:
+            print(f"Skipping {stem}: no .parquet or .csv found in {data_path}")
+            continue
+
+        # DB column -> file column, for the columns the index artifacts need.
+        column_map = get_column_mapping(os.path.basename(data_file))
+        wanted = {db_col: column_map[db_col] for db_col in ('ingredients_tokenized', 'name', 'total_time', 'nutrition', 'tags')
+                  if column_map.get(db_col)}
+        skipped = set(record["skipped"].get(stem, [])) if record is not None else set()
+        print(f"Streaming {data_file}")
+        position = 0
+        for chunk in iter_data_file(data_file, list(wanted.values()), chunk_size):
+            size = len(chunk[wanted['ingredients_tokenized']])
+            # Rows of this chunk that made it into the DB
+            kept = [i for i in range(size) if position + i not in skipped]
+            position += size
+            out = {'id': list(range(next_id, next_id + len(kept)))}
+            for db_col, file_col in wanted.items():
+                values = chunk.get(file_col, [None] * size)
+                out[db_col] = values if len(kept) == size else [values[i] for i in kept]
+            if kept:
+                yield out
+            next_id += len(kept)
 
 # MAIN
 def main():
@@ -209,26 +283,33 @@ def main():
 
     config_dict = fetch_config_dict()
     
-    # CSV file names
+    # Data file names ([small_csv, big_csv]); Parquet is used when present.
     csv_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('data_dir', ''))
-    small_csv_name, big_csv_name = os.listdir(csv_path) # [small.csv, big_csv]
-
 
     # Connect to DB
     conn = create_connection(config_dict)
     print("Connected to DB")
 
-    # Read the small csv file.
-    small_csv = read_csv_file(csv_path, small_csv_name)
-    print(f"Processing: {small_csv_name}")
-    column_map = get_column_mapping(small_csv_name)
-    process_csv(small_csv, conn, column_map, small_csv_name, batch_size=100)
-
-    # Read the small csv file.
-    big_csv = read_csv_file(csv_path, big_csv_name)
-    print(f"Processing: {big_csv_name}")
-    column_map = get_column_mapping(big_csv_name)
-    process_csv(big_csv, conn, column_map, big_csv_name, batch_size=100)
+    with conn.cursor() as cur:
+        start_id = get_max_id(cur) + 1
+    skipped = {}
+
+    for stem in DATA_FILES:
+        data_file = find_data_file(csv_path, stem)
+        if data_file is None:
+            print(f"Skipping {stem}: no .parquet or .csv found in {csv_path}")
+            continue
+
+        file_name = os.path.basename(data_file)
+        column_map = get_column_mapping(file_name)
+
+        # Only the mapped columns are loaded.
+        df = read_csv_file(csv_path, file_name, columns=[col for col in column_map.values() if col])
+        print(f"Processing: {file_name}")
+        # Data source stays the csv name so rows look the same whatever the input format.
+        skipped[stem] = process_csv(df, conn, column_map, stem + '.csv', batch_size=100)
+
+    save_push_record(csv_path, start_id, skipped)
 
 if __name__ ==  '__main__':
 
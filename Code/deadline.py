@@ -0,0 +1,68 @@
+"""
+This script:
+1. Tracks the time budget of one request (Deadline), started when the request arrives.
+2. Lets each stage ask how much time is left, cap its own timeouts to it, or give up early.
+
+Stages that every answer needs (embedding, DB fetch) raise DeadlineExceeded when the budget
+is already spent; optional stages (images, AI fallback) degrade instead and are reported
+in the response's "degraded" list.
+"""
+
+import math
+import time
+
+
+class DeadlineExceeded(Exception):
+    """
+        A required stage could not run (or finish) within the request budget.
+    """
+
+    def __init__(self, stage):
+        super().__init__(f"Request budget exhausted at the {stage} stage")
+        self.stage = stage
+
+
+class Deadline:
+    """
+        Time budget of one request. budget_ms <= 0 means no deadline.
+    """
+
+    def __init__(self, budget_ms=0):
+        self.budget = budget_ms / 1000.0 if budget_ms > 0 else None
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        """
+            Seconds left (inf without a deadline).
+        """
+        if self.budget is None:
+            return math.inf
+        return max(0.0, self.budget - self.elapsed())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows(self, seconds):
+        """
+            True if a stage expected to take `seconds` fits in the remaining budget.
+        """
+        return self.remaining() >= seconds
+
+    def timeout(self, cap=None):
+        """
+            Timeout for a blocking call: the remaining budget, at most cap. None = wait forever.
+        """
+        remaining = self.remaining()
+        if cap is not None:
+            remaining = min(remaining, cap)
+        return None if math.isinf(remaining) else remaining
+
+    def check(self, stage):
+        """
+            Raises DeadlineExceeded if a required stage is about to start with no budget left.
+        """
+        if self.expired():
+            raise DeadlineExceeded(stage)
@@ -0,0 +1,156 @@
+"""
+This script:
+1. Loads the sentence embedding model through the backend chosen in config.ini (embedding_backend):
+   torch      -> SentenceTransformer in full precision (default).
+   torch_int8 -> SentenceTransformer with Linear layers dynamically quantized to int8.
+   onnx       -> the ONNX export of the same model (export_onnx_model.py) run by onnxruntime,
+                 with the same tokenizer, mean pooling and normalization; needs no torch.
+2. Compares two encoders on the same texts (parity check).
+
+Every backend returns an object with the SentenceTransformer encode() signature, so
+callers only swap `SentenceTransformer(MODEL_NAME)` for `load_encoder(config_dict)`.
+Heavy libraries are imported by the backend that needs them.
+"""
+
+import json
+import os
+import numpy as np
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+BACKENDS = ("torch", "torch_int8", "onnx")
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+EMBEDDING_CONFIG_FILE = "embedding_config.json"
+
+# Ingredient queries for parity checks and benchmarks.
+SAMPLE_TEXTS = [
+    "chicken breast rice butter",
+    "tomato basil garlic olive oil",
+    "flour sugar egg milk butter vanilla",
+    "beef onion pepper",
+    "salmon lemon dill",
+    "chickpeas cumin coriander tahini lemon garlic",
+    "vodka cream tomato penne parmesan",
+    "egg",
+]
+
+
+class OnnxEncoder:
+    """
+        Runs the exported transformer with onnxruntime and reproduces the
+        sentence-transformers head: mean pooling over the attention mask, then L2 normalization.
+    """
+
+    def __init__(self, model_dir, quantized=True, threads=0):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, EMBEDDING_CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.model_name = self.config["model_name"]
+        self.normalize = self.config.get("normalize", True)
+
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        options = onnxruntime.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, model_file), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config.get("max_seq_length", 256))
+        self.tokenizer.enable_padding(pad_id=self.config.get("pad_token_id", 0),
+                                      pad_token=self.config.get("pad_token", "[PAD]"))
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dim"]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+
+        weights = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=64, convert_to_numpy=True, **kwargs):
+        """
+            Same contract as SentenceTransformer.encode: a string gives one vector, a list a matrix.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        # Batch texts of similar length together to keep padding small.
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._encode_batch([texts[i] for i in batch])
+
+        return embeddings[0] if single else embeddings
+
+
+# Load the torch model
+def load_torch_encoder(model_name=MODEL_NAME, quantized=False):
+    """
+        SentenceTransformer on CPU; quantized=True converts its Linear layers to dynamic int8.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    if quantized:
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+# Load the configured encoder
+def load_encoder(config_dict, model_name=MODEL_NAME, backend=None):
+    """
+        Returns the encoder for config.ini's embedding_backend (or the given backend).
+    """
+    backend = (backend or config_dict.get("embedding_backend", "torch")).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding_backend {backend!r}, use one of {', '.join(BACKENDS)}")
+
+    if backend == "onnx":
+        model_dir = os.path.join(config_dict.get("base_directory", ""), config_dict.get("onnx_model_dir", ""))
+        encoder = OnnxEncoder(model_dir,
+                              quantized=bool(int(config_dict.get("onnx_quantized", '1'))),
+                              threads=int(config_dict.get("onnx_threads", '0')))
+        if encoder.model_name != model_name:
+            raise ValueError(f"ONNX model in {model_dir} was exported from {encoder.model_name}, expected {model_name}")
+        return encoder
+
+    return load_torch_encoder(model_name, quantized=backend == "torch_int8")
+
+
+# Parity between two encoders
+def embedding_parity(reference, encoder, texts, batch_size=64):
+    """
+        Returns the max absolute difference and the min / mean cosine similarity
+        between the embeddings of two encoders on the same texts.
+    """
+    expected = np.asarray(reference.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    actual = np.asarray(encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+
+    cosine = np.einsum('ij,ij->i', expected, actual) / np.clip(
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1), 1e-12, None)
+    return {
+        "max_abs_diff": float(np.max(np.abs(expected - actual))),
+        "min_cosine": float(np.min(cosine)),
+        "mean_cosine": float(np.mean(cosine)),
+    }
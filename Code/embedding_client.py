@@ -0,0 +1,111 @@
+"""
+This script:
+1. Talks to the local embedding service (embedding_service.py) over HTTP.
+2. Reports the service as unavailable (returns None) on connection errors, timeouts and
+   5xx answers, so the caller can fall back to its in-process model and index.
+3. After a failure, skips the service for retry_after seconds instead of paying the
+   connect timeout on every request.
+4. Forwards the current trace (tracing.py) as a traceparent header, so the service's spans
+   join the API request's trace.
+"""
+
+import threading
+import time
+import numpy as np
+import requests
+from tracing import span, trace_headers
+
+
+class EmbeddingServiceClient:
+    """
+        Client for one embedding service URL, shared by the threads of an API worker.
+    """
+
+    def __init__(self, url, timeout=2.0, retry_after=10.0, admin_token=""):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.admin_token = admin_token
+        self.session = requests.Session()
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_dict):
+        """
+            None when embedding_service_url is empty (service off).
+        """
+        url = config_dict.get("embedding_service_url", "").strip()
+        if not url:
+            return None
+        return cls(url,
+                   timeout=float(config_dict.get("embedding_service_timeout", '2')),
+                   retry_after=float(config_dict.get("embedding_service_retry_after", '10')),
+                   admin_token=config_dict.get("admin_token", "").strip())
+
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def _mark_down(self, reason):
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_after
+        print(f"Embedding service at {self.url} unavailable ({reason}); in-process fallback for {self.retry_after:g}s")
+
+    def _request(self, method, path, **kwargs):
+        """
+            Returns the response, or None when the service is down (answers 5xx or not at all).
+        """
+        if not self.available():
+            return None
+        try:
+            with span(f"embedding_service {method} {path}") as call:
+                headers = {**(kwargs.pop("headers", None) or {}), **trace_headers()}
+                response = self.session.request(method, self.url + path, timeout=self.timeout,
+                                                headers=headers or None, **kwargs)
+                call.set("status_code", response.status_code)
+        except requests.RequestException as e:
+            self._mark_down(e)
+            return None
+        if response.status_code >= 500:
+            self._mark_down(f"HTTP {response.status_code}")
+            return None
+        return response
+
+    def ready(self):
+        response = self._request("GET", "/ready")
+        return response is not None and response.status_code == 200
+
+    def embed(self, texts):
+        """
+            Embeddings of texts as a float32 matrix, None when the service is down.
+        """
+        response = self._request("POST", "/embed", json={"texts": list(texts)})
+        if response is None or response.status_code != 200:
+            return None
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+    def retrieve(self, query_args):
+        """
+            Ranked recipe ids for /search query parameters (a werkzeug MultiDict or a list of pairs).
+            Returns the service's JSON for 200 and 400 answers, None otherwise (caller retrieves in process).
+        """
+        params = list(query_args.items(multi=True)) if hasattr(query_args, "items") else list(query_args)
+        response = self._request("GET", "/retrieve", params=params)
+        if response is None:
+            return None
+        if response.status_code not in (200, 400):
+            # e.g. 409: the service's index version cannot be ranked there.
+            self._mark_down(response.json().get("error", f"HTTP {response.status_code}"))
+            return None
+        return response.json()
+
+    def reload_index(self, version=None):
+        """
+            Asks the service to swap its index. Returns (status code, JSON) or None when it is down.
+        """
+        response = self._request("POST", "/admin/reload-index",
+                                 params={"version": version} if version else None,
+                                 headers={"X-Admin-Token": self.admin_token} if self.admin_token else None)
+        if response is None:
+            return None
+        return response.status_code, response.json()
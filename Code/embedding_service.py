@@ -0,0 +1,250 @@
+"""
+This script:
+1. Runs a local embedding + retrieval service that owns the embedding model and the FAISS index
+   (with its ranking, inverted, BM25 and metadata artifacts), so API workers do not each load them.
+2. Micro-batches embedding requests: texts arriving from concurrent requests are encoded
+   together (up to batch_max_size texts, waiting at most batch_max_wait_ms for a batch to fill).
+3. Serves, on 127.0.0.1:embedding_service_port:
+   GET  /ready                -> 200 once loaded, with load times and batching stats
+   POST /embed                -> {"texts": [...]} -> {"embeddings": [[...]]}
+   GET  /retrieve             -> same query parameters as /search ->
+                                 {"recipe_ids", "weak", "search_stages", "filtered_out", "index_version"}
+   POST /admin/reload-index   -> swaps in Index/CURRENT (or ?version=), like api.py
+   GET  /metrics              -> Prometheus metrics of retrieval in this process (metrics.py)
+4. Continues the caller's trace (traceparent header, see tracing.py) on /embed and /retrieve.
+
+api.py uses it when embedding_service_url is set (see embedding_client.py) and falls back to
+its own model and index while the service is down.
+
+Usage:
+    python embedding_service.py
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from flask import Flask, Response, g, request, jsonify
+from config_reader import fetch_config_dict
+from embedding_backend import MODEL_NAME, load_encoder
+from index_store import IndexHolder, UnknownVersion, check_version
+from metrics import INDEX_VECTORS, render_metrics, track_stage
+from recipe_metadata import RecipeFilter
+from retrieval import INDEX_EXTENSIONS, RetrievalSettings, filter_mask, prepare_query, search_recipes
+import tracing
+
+
+class MicroBatcher:
+    """
+        Encodes texts submitted by many threads in shared batches on one worker thread.
+    """
+
+    def __init__(self, encoder, max_batch=64, max_wait_ms=5):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self._run, name="micro-batcher", daemon=True).start()
+
+    def encode(self, texts, timeout=None):
+        """
+            Blocks until the texts are encoded; returns a float32 matrix in input order.
+        """
+        futures = []
+        for text in texts:
+            future = Future()
+            self.queue.put((text, future))
+            futures.append(future)
+        return np.vstack([future.result(timeout) for future in futures]).astype(np.float32)
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                embeddings = self.encoder.encode([text for text, _ in batch], batch_size=self.max_batch,
+                                                 convert_to_numpy=True)
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches += 1
+            self.texts += len(batch)
+
+    def stats(self):
+        return {"batches": self.batches, "texts": self.texts,
+                "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0}
+
+
+# Initialize Flask app
+app = Flask(__name__)
+
+# Load configuration
+config_dict = fetch_config_dict()
+index_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('index_directory', ''))
+retrieval_settings = RetrievalSettings.from_config(config_dict)
+tracing.configure(config_dict, "recipe-embedding-service")
+
+# Load the model and the index once for every API worker.
+load_times = {}
+started = time.perf_counter()
+model = load_encoder(config_dict)
+model.encode("warm up")
+load_times["embedding_model"] = time.perf_counter() - started
+
+index_holder = IndexHolder(index_path,
+                           model_name=MODEL_NAME,
+                           verify=bool(int(config_dict.get("verify_index_checksums", '1'))),
+                           extensions=INDEX_EXTENSIONS)
+load_times.update(index_holder.get().load_times)
+index_holder.start_watcher(float(config_dict.get("index_watch_interval", '0')))
+
+batcher = MicroBatcher(model,
+                       max_batch=int(config_dict.get("batch_max_size", '64')),
+                       max_wait_ms=float(config_dict.get("batch_max_wait_ms", '5')))
+
+print(f"Embedding service ready with index version {index_holder.get().version}.")
+
+
+# Preprocess user input
+def preprocess_ingredients(ingredients):
+    """
+    Preprocesses a list of ingredients by lowercasing, removing punctuation, and stripping whitespace.
+    Same as api.preprocess_ingredients, so both produce the same embedding text.
+    """
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+
+    if isinstance(ingredients, list):
+        return [re.sub(r'[^\w\s]', '', ingredient.lower()).strip() for ingredient in ingredients if ingredient.strip()]
+    return []
+
+
+# Continue the caller's trace
+@app.before_request
+def start_request_trace():
+    if request.endpoint in ("embed", "retrieve"):
+        g.trace = tracing.start_trace(f"{request.method} {request.path}",
+                                      traceparent=request.headers.get("traceparent"))
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        trace.set("http.status_code", response.status_code)
+        trace.end()
+    return response
+
+
+# Readiness
+@app.route('/ready', methods=['GET'])
+def ready():
+    return jsonify({
+        "ready": True,
+        "index_version": index_holder.get().version,
+        "load_times": {name: round(seconds, 4) for name, seconds in load_times.items()},
+        "batching": batcher.stats()
+    }), 200
+
+# Embed texts
+@app.route('/embed', methods=['POST'])
+def embed():
+    texts = (request.get_json(silent=True) or {}).get("texts")
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return jsonify({"error": "Expected {\"texts\": [str, ...]}"}), 400
+    if not texts:
+        return jsonify({"embeddings": []}), 200
+    return jsonify({"embeddings": batcher.encode(texts).tolist()}), 200
+
+# Ranked recipe ids for /search parameters
+@app.route('/retrieve', methods=['GET'])
+def retrieve():
+    try:
+        user_input = request.args.getlist('ingredients')
+        if not user_input:
+            return jsonify({"error": "No ingredients provided"}), 400
+
+        snapshot = index_holder.get()
+        if snapshot.extras.get("ranking") is None:
+            return jsonify({"error": f"Index version {snapshot.version} has no ingredient tokens; rebuild it."}), 409
+
+        try:
+            mask = filter_mask(snapshot, RecipeFilter.from_args(request.args))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        body = {"recipe_ids": [], "weak": False, "search_stages": [], "filtered_out": False,
+                "index_version": snapshot.version}
+        if mask is not None and not mask.any():
+            body["filtered_out"] = True
+            return jsonify(body), 200
+
+        with track_stage("preprocess"):
+            text = " ".join(preprocess_ingredients(user_input))
+        with track_stage("encode"):
+            user_embedding = prepare_query(snapshot.faiss_index, batcher.encode([text])[0])
+        result = search_recipes(snapshot, user_embedding, user_input, retrieval_settings, mask)
+        body.update(recipe_ids=result.recipe_ids, weak=result.weak, search_stages=result.stages)
+        return jsonify(body), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Prometheus metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    INDEX_VECTORS.set(index_holder.get().faiss_index.ntotal)
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+# Reload the index
+@app.route('/admin/reload-index', methods=['POST'])
+def reload_index():
+    """
+        Same contract as api.py's /admin/reload-index.
+    """
+    admin_token = config_dict.get("admin_token", "").strip()
+    authorized = request.headers.get("X-Admin-Token", "") == admin_token if admin_token \
+        else request.remote_addr in ("127.0.0.1", "::1")
+    if not authorized:
+        return jsonify({"error": "Forbidden"}), 403
+    version = request.args.get("version")
+    if version is not None:
+        try:
+            check_version(index_path, version)
+        except UnknownVersion as e:
+            return jsonify({"error": str(e)}), 400
+    try:
+        version, swapped = index_holder.reload(version)
+        snapshot = index_holder.get()
+        return jsonify({
+            "version": version,
+            "swapped": swapped,
+            "row_count": int(snapshot.faiss_index.ntotal),
+            "manifest": snapshot.manifest
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e), "version": index_holder.get().version}), 500
+
+
+# Run the service (local only: API workers on this host are its clients)
+if __name__ == "__main__":
+    app.run(host="127.0.0.1", port=int(config_dict.get("embedding_service_port", '5001')), threaded=True)
@@ -0,0 +1,125 @@
+"""
+This script:
+1. Loads the SentenceTransformer model used for the index (MODEL_NAME).
+2. Exports its transformer to ONNX (model.onnx) with dynamic batch and sequence axes.
+3. Writes a dynamically int8-quantized copy (model_int8.onnx).
+4. Saves the tokenizer and the pooling settings (embedding_config.json) next to them.
+5. Runs a parity check of both ONNX models against the torch model.
+
+The output folder is onnx_model_dir in config.ini; set embedding_backend = onnx to use it.
+Needs torch, onnx and onnxruntime (export time only; serving needs onnxruntime and tokenizers).
+
+Usage:
+    python export_onnx_model.py [output_dir]
+"""
+
+import json
+import os
+import sys
+import torch
+from sentence_transformers import SentenceTransformer
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from config_reader import fetch_config_dict
+from embedding_backend import (MODEL_NAME, ONNX_MODEL_FILE, ONNX_INT8_MODEL_FILE, EMBEDDING_CONFIG_FILE,
+                               SAMPLE_TEXTS, OnnxEncoder, embedding_parity)
+
+# Embeddings of the ONNX models must stay this close to the torch model.
+PARITY_MIN_COSINE = {ONNX_MODEL_FILE: 0.9999, ONNX_INT8_MODEL_FILE: 0.98}
+
+
+class TransformerOutput(torch.nn.Module):
+    """
+        Wraps the Hugging Face model so the export has a single last_hidden_state output.
+    """
+
+    def __init__(self, transformer):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.transformer(input_ids=input_ids, attention_mask=attention_mask,
+                                token_type_ids=token_type_ids).last_hidden_state
+
+
+# Pooling settings of the sentence-transformers head
+def embedding_config(model):
+    """
+        Reads max_seq_length, pooling and normalization from the model's modules.
+        Only mean pooling is reproduced by OnnxEncoder.
+    """
+    modules = {type(module).__name__: module for module in model}
+    pooling = modules.get("Pooling")
+    if pooling is None or pooling.get_pooling_mode_str() != "mean":
+        raise ValueError(f"{MODEL_NAME} does not use mean pooling; the ONNX backend cannot reproduce it.")
+
+    tokenizer = model.tokenizer
+    return {
+        "model_name": MODEL_NAME,
+        "dim": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "pooling": "mean",
+        "normalize": "Normalize" in modules,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+    }
+
+
+# Export to ONNX
+def export_model(model, output_dir):
+    """
+        Writes model.onnx, model_int8.onnx, the tokenizer and embedding_config.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model.tokenizer.save_pretrained(output_dir)
+
+    wrapper = TransformerOutput(model[0].auto_model.eval())
+    sample = model.tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors="pt")
+    token_type_ids = sample.get("token_type_ids", torch.zeros_like(sample["input_ids"]))
+    axes = {0: "batch", 1: "sequence"}
+
+    onnx_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(wrapper,
+                          (sample["input_ids"], sample["attention_mask"], token_type_ids),
+                          onnx_path,
+                          input_names=["input_ids", "attention_mask", "token_type_ids"],
+                          output_names=["last_hidden_state"],
+                          dynamic_axes={"input_ids": axes, "attention_mask": axes,
+                                        "token_type_ids": axes, "last_hidden_state": axes},
+                          opset_version=17)
+    print(f"Exported {onnx_path}")
+
+    quantize_dynamic(onnx_path, os.path.join(output_dir, ONNX_INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+    print(f"Quantized {ONNX_INT8_MODEL_FILE}")
+
+    with open(os.path.join(output_dir, EMBEDDING_CONFIG_FILE), "w") as f:
+        json.dump(embedding_config(model), f, indent=2)
+
+
+# Check the exported models
+def check_parity(model, output_dir):
+    """
+        Compares both ONNX models with the torch model. Raises if one drifts past PARITY_MIN_COSINE.
+    """
+    report = {}
+    for model_file, min_cosine in PARITY_MIN_COSINE.items():
+        encoder = OnnxEncoder(output_dir, quantized=model_file == ONNX_INT8_MODEL_FILE)
+        report[model_file] = embedding_parity(model, encoder, SAMPLE_TEXTS)
+        print(f"{model_file}: {report[model_file]}")
+        if report[model_file]["min_cosine"] < min_cosine:
+            raise ValueError(f"{model_file} min cosine {report[model_file]['min_cosine']:.5f} is below {min_cosine}")
+    return report
+
+
+def main(output_dir=None):
+    config_dict = fetch_config_dict()
+    if output_dir is None:
+        output_dir = os.path.join(config_dict.get("base_directory", ""), config_dict.get("onnx_model_dir", ""))
+
+    model = SentenceTransformer(MODEL_NAME, device="cpu")
+    export_model(model, output_dir)
+    return check_parity(model, output_dir)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -3,16 +3,38 @@
     1. Fetches image URL from unsplash.
     2. Downloads them to a local folder.
     3. Pushes image URL to DB.
+    4. Lookups of the same query in flight at once share one Unsplash call (singleflight.py).
 
 """
 
 import requests
 from config_reader import fetch_config_dict
+from metrics import UNSPLASH_CALLS
+from singleflight import SingleFlight
+from tracing import span
 import json
 import re
 
-config_dict = fetch_config_dict()
-ACCESS_KEY = config_dict.get("unsplash_access_key", '')
+# Read from config.ini on first use, so importing this module stays cheap.
+_access_key = None
+_unsplash_url = None
+
+# Concurrent lookups of the same query share one Unsplash call.
+_image_flights = SingleFlight("images")
+
+# Unsplash access key
+def access_key():
+    global _access_key
+    if _access_key is None:
+        _access_key = fetch_config_dict().get("unsplash_access_key", '')
+    return _access_key
+
+# Unsplash API base URL (a local stand-in for load tests)
+def unsplash_url():
+    global _unsplash_url
+    if _unsplash_url is None:
+        _unsplash_url = fetch_config_dict().get("unsplash_url", "https://api.unsplash.com").rstrip("/")
+    return _unsplash_url
 
 # Preprocess query
 def preprocess_query(query):
@@ -36,10 +58,11 @@ def preprocess_query(query):
 
 
 
-def search_image(query):
-    url = f"https://api.unsplash.com/search/photos?page=1&query={query};client_id={ACCESS_KEY};orientation=landscape;per_page=1"
-    response = requests.get(url)
-    photo = response.json()
+def search_url(query):
+    return f"{unsplash_url()}/search/photos?page=1&query={query};client_id={access_key()};orientation=landscape;per_page=1"
+
+
+def image_url_from_response(photo):
     # print(json.dumps(photo, indent=4))
     fetched_url_list = photo.get("results", [])
     
@@ -51,13 +74,48 @@ def search_image(query):
     return final_url
 
 
+def search_image(query, timeout=None):
+    try:
+        # Request errors quote the URL, which carries the access key.
+        with span("unsplash.search", error_detail=False, query=query) as call:
+            response = requests.get(search_url(query), timeout=timeout)
+            image_url = image_url_from_response(response.json())
+            call.set("status_code", response.status_code).set("image_found", bool(image_url))
+    except Exception:
+        UNSPLASH_CALLS.labels("error").inc()
+        raise
+    UNSPLASH_CALLS.labels("ok").inc()
+    return image_url
+
+
+# Async variant (api_async.py); client is an httpx.AsyncClient
+async def search_image_async(client, query):
+    try:
+        with span("unsplash.search", error_detail=False, query=query) as call:
+            response = await client.get(search_url(query))
+            image_url = image_url_from_response(response.json())
+            call.set("status_code", response.status_code).set("image_found", bool(image_url))
+    except Exception:
+        UNSPLASH_CALLS.labels("error").inc()
+        raise
+    UNSPLASH_CALLS.labels("ok").inc()
+    return image_url
+
+
+
 
 
+def main(query = '', timeout = None):
+
+    query = preprocess_query(query)
+    image_url, _ = _image_flights.do(query, search_image, query, timeout, timeout=timeout)
+    return image_url
+
 
-def main(query = ''):
+async def main_async(client, query = ''):
 
     query = preprocess_query(query)
-    image_url = search_image(query)
+    image_url = await search_image_async(client, query)
     return image_url
 
 
@@ -0,0 +1,321 @@
+"""
+This script:
+1. Writes each FAISS build into its own version folder (index + ids + manifest.json).
+2. Publishes a build by atomically replacing the CURRENT pointer file.
+3. Loads the current version and hot-swaps it inside a running process.
+
+Layout:
+    Index/
+        CURRENT                     -> "20250101-120000"
+        versions/20250101-120000/
+            recipe_index.faiss
+            recipe_ids.npy
+            manifest.json           -> model name, dim, row count, metric, sha256 per file
+
+An Index folder without CURRENT (the old flat layout) is loaded as version "legacy".
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+import faiss
+
+INDEX_FILE = "recipe_index.faiss"
+IDS_FILE = "recipe_ids.npy"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+LEGACY_VERSION = "legacy"
+
+
+# Checksum a file
+def file_checksum(path, block_size=1 << 20):
+    """
+        Returns the sha256 hex digest of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Start a new version
+def begin_version(index_root):
+    """
+        Creates a temporary folder for a new build and returns (version, path).
+        Nothing is visible to readers until publish_version is called.
+    """
+    version = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    versions_path = os.path.join(index_root, VERSIONS_DIR)
+    os.makedirs(versions_path, exist_ok=True)
+
+    # Two builds in the same second get a suffix.
+    suffix = 0
+    candidate = version
+    while os.path.exists(os.path.join(versions_path, candidate)) or \
+            os.path.exists(os.path.join(versions_path, "." + candidate)):
+        suffix += 1
+        candidate = f"{version}-{suffix}"
+
+    tmp_path = os.path.join(versions_path, "." + candidate)
+    os.makedirs(tmp_path)
+    return candidate, tmp_path
+
+
+# Publish a version
+def publish_version(index_root, version, tmp_path, model_name, dim, row_count, keep_versions=3, **manifest_fields):
+    """
+        Writes manifest.json for a finished build, moves it into place and
+        atomically points CURRENT at it. Older versions beyond keep_versions are removed.
+    """
+    manifest = {
+        "version": version,
+        "model_name": model_name,
+        "dim": int(dim),
+        "row_count": int(row_count),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "checksums": {
+            name: file_checksum(os.path.join(tmp_path, name))
+            for name in sorted(os.listdir(tmp_path))
+        },
+    }
+    manifest.update(manifest_fields)
+
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    version_path = os.path.join(index_root, VERSIONS_DIR, version)
+    os.rename(tmp_path, version_path)
+    set_current(index_root, version)
+    print(f"Published index version {version}")
+
+    prune_versions(index_root, keep_versions)
+    return version_path
+
+
+# Point CURRENT at a version
+def set_current(index_root, version):
+    """
+        Atomically replaces the CURRENT pointer (write temp file + os.replace).
+    """
+    tmp_pointer = os.path.join(index_root, CURRENT_FILE + ".tmp")
+    with open(tmp_pointer, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, os.path.join(index_root, CURRENT_FILE))
+
+
+# Read CURRENT
+def read_current(index_root):
+    """
+        Returns the current version name, or None for the legacy flat layout.
+    """
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class UnknownVersion(ValueError):
+    """
+        A requested version is not a published version folder under versions/.
+    """
+
+
+# List published versions
+def list_versions(index_root):
+    """
+        Returns the published version names, oldest first by the manifest's created_at
+        (names alone do not sort: "...-10" comes before "...-2").
+    """
+    versions_path = os.path.join(index_root, VERSIONS_DIR)
+    try:
+        names = os.listdir(versions_path)
+    except FileNotFoundError:
+        return []
+    created = {}
+    for name in names:
+        path = os.path.join(versions_path, name)
+        if name.startswith(".") or not os.path.isdir(path):
+            continue
+        try:
+            with open(os.path.join(path, MANIFEST_FILE)) as f:
+                created[name] = json.load(f).get("created_at") or ""
+        except (OSError, ValueError):
+            # Incomplete folder: oldest
+            created[name] = ""
+    return sorted(created, key=lambda name: (created[name], name))
+
+
+# Validate a requested version
+def check_version(index_root, version):
+    """
+        Raises UnknownVersion unless version is a plain name of a published version (or "legacy"
+        when the flat pre-versioning files exist), so a version taken from a request can never
+        point outside versions/.
+    """
+    if version == LEGACY_VERSION:
+        if os.path.exists(os.path.join(index_root, INDEX_FILE)):
+            return
+        raise UnknownVersion(f"No legacy index files in {index_root}")
+    if not version or os.path.basename(version) != version or version not in list_versions(index_root):
+        raise UnknownVersion(f"Unknown index version {version!r}")
+
+
+# Remove old versions
+def prune_versions(index_root, keep_versions):
+    """
+        Deletes the oldest version folders, never the current one.
+    """
+    if keep_versions <= 0:
+        return
+    versions_path = os.path.join(index_root, VERSIONS_DIR)
+    current = read_current(index_root)
+    versions = list_versions(index_root)
+    for version in versions[:-keep_versions]:
+        if version != current:
+            shutil.rmtree(os.path.join(versions_path, version), ignore_errors=True)
+
+
+class IndexSnapshot:
+    """
+        One loaded index version. Never mutated after loading, so a request
+        holding a snapshot keeps working while a newer one is swapped in.
+    """
+
+    def __init__(self, version, path, faiss_index, recipe_ids, manifest):
+        self.version = version
+        self.path = path
+        self.faiss_index = faiss_index
+        self.recipe_ids = recipe_ids
+        self.manifest = manifest
+        # Artifacts built alongside the index (ranking tokens, ...), see IndexHolder extensions.
+        self.extras = {}
+        # Seconds spent loading each component (faiss_index, then one entry per extension).
+        self.load_times = {}
+
+
+# Load a version
+def load_index_version(index_root, version=None, verify=True):
+    """
+        Loads the given version (default: CURRENT) into an IndexSnapshot.
+        Falls back to the legacy flat files when there is no CURRENT pointer.
+        With verify=True, file checksums must match the manifest.
+        Raises UnknownVersion for a version that is not published under versions/.
+    """
+    if version is None:
+        version = read_current(index_root) or LEGACY_VERSION
+    else:
+        check_version(index_root, version)
+
+    if version == LEGACY_VERSION:
+        path = index_root
+        manifest = {}
+    else:
+        path = os.path.join(index_root, VERSIONS_DIR, version)
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        if verify:
+            for name, expected in manifest.get("checksums", {}).items():
+                if file_checksum(os.path.join(path, name)) != expected:
+                    raise ValueError(f"Checksum mismatch for {name} in index version {version}")
+
+    started = time.perf_counter()
+    faiss_index = faiss.read_index(os.path.join(path, INDEX_FILE))
+    recipe_ids = np.load(os.path.join(path, IDS_FILE))
+
+    if faiss_index.ntotal != len(recipe_ids):
+        raise ValueError(f"Index version {version} has {faiss_index.ntotal} vectors but {len(recipe_ids)} ids")
+
+    snapshot = IndexSnapshot(version, path, faiss_index, recipe_ids, manifest)
+    snapshot.load_times["faiss_index"] = time.perf_counter() - started
+    return snapshot
+
+
+class IndexHolder:
+    """
+        Holds the live IndexSnapshot for a server process.
+
+        get() is a plain attribute read, so queries never wait on a reload.
+        reload() builds the new snapshot next to the old one and swaps the reference.
+        extensions maps a name to fn(snapshot) whose result is stored in snapshot.extras[name],
+        so artifacts shipped with a version are loaded and swapped together with it.
+    """
+
+    def __init__(self, index_root, model_name=None, verify=True, extensions=None):
+        self.index_root = index_root
+        self.model_name = model_name
+        self.verify = verify
+        self.extensions = extensions or {}
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._snapshot = self._load(None)
+
+    def _load(self, version):
+        snapshot = load_index_version(self.index_root, version, verify=self.verify)
+        manifest_model = snapshot.manifest.get("model_name")
+        if self.model_name and manifest_model and manifest_model != self.model_name:
+            raise ValueError(f"Index version {snapshot.version} was built with {manifest_model}, "
+                             f"server uses {self.model_name}")
+        for name, loader in self.extensions.items():
+            started = time.perf_counter()
+            snapshot.extras[name] = loader(snapshot)
+            snapshot.load_times[name] = time.perf_counter() - started
+        return snapshot
+
+    def get(self):
+        return self._snapshot
+
+    def reload(self, version=None):
+        """
+            Loads `version` (default: CURRENT) if it differs from the live one.
+            Returns (version, swapped).
+        """
+        with self._reload_lock:
+            target = version or read_current(self.index_root) or LEGACY_VERSION
+            if target == self._snapshot.version:
+                return target, False
+
+            started = time.perf_counter()
+            snapshot = self._load(target)
+            self._snapshot = snapshot
+            print(f"Swapped to index version {snapshot.version} "
+                  f"({snapshot.faiss_index.ntotal} vectors, {time.perf_counter() - started:.2f}s)")
+            return snapshot.version, True
+
+    def start_watcher(self, interval_sec):
+        """
+            Polls CURRENT every interval_sec seconds in a daemon thread and reloads on change.
+            A CURRENT value that failed to load is not retried until CURRENT changes again.
+            Threads do not survive fork, so a forked worker calls this again to restart it.
+        """
+        if (self._watcher is not None and self._watcher.is_alive()) or interval_sec <= 0:
+            return
+
+        def watch():
+            failed = None
+            while True:
+                time.sleep(interval_sec)
+                current = None
+                try:
+                    current = read_current(self.index_root) or LEGACY_VERSION
+                    if current == failed:
+                        continue
+                    self.reload(current)
+                    failed = None
+                except Exception as e:
+                    failed = current
+                    print(f"Index reload of {current} failed, keeping version {self._snapshot.version} "
+                          f"until CURRENT changes: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="index-watcher", daemon=True)
+        self._watcher.start()
@@ -0,0 +1,180 @@
+"""
+This script:
+1. Builds an inverted index: normalized ingredient token -> sorted FAISS positions.
+2. Saves it next to the FAISS index (ingredient_postings.npz) as three compact arrays
+   (vocab, offsets, postings), CSR style.
+3. Answers AND / OR ingredient queries so /search can add exact-match candidates
+   that dense retrieval missed.
+
+A user ingredient matches a token when it is a substring of it ("chicken" matches
+"chickenbreast"), the same rule ranking.py uses. Substring lookups bisect a sorted list of
+every vocab token's suffixes instead of scanning the vocabulary.
+"""
+
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import reduce
+import numpy as np
+from metrics import cache_lookup
+from ranking import normalize_ingredient, normalize_terms
+
+POSTINGS_FILE = "ingredient_postings.npz"
+# Looked-up terms kept per index (least recently used dropped first)
+TERM_CACHE_SIZE = 4096
+
+
+class InvertedIndex:
+    """
+        token -> sorted int32 array of FAISS positions.
+    """
+
+    def __init__(self, vocab, offsets, postings, row_count):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.postings = postings
+        self.row_count = row_count
+        self._token_ids = {token: i for i, token in enumerate(vocab)}
+        # (suffix, token id) of every token, sorted: the tokens containing a term are the
+        # ones with a suffix starting with it, a contiguous range.
+        suffixes = sorted((token[start:], i) for i, token in enumerate(vocab) for start in range(len(token)))
+        self._suffixes = [suffix for suffix, _ in suffixes]
+        self._suffix_ids = np.array([i for _, i in suffixes], dtype=np.int32)
+        self._term_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def token_postings(self, token_id):
+        return self.postings[self.offsets[token_id]:self.offsets[token_id + 1]]
+
+    def matching_tokens(self, term):
+        """
+            Ids of the vocab tokens containing the term.
+        """
+        if not term:
+            return list(range(len(self.vocab)))
+        start = bisect_left(self._suffixes, term)
+        # Every string starting with term sorts below term + the largest code point.
+        end = bisect_left(self._suffixes, term + chr(0x10FFFF), start)
+        if end - start == 1:
+            return [int(self._suffix_ids[start])]
+        return np.unique(self._suffix_ids[start:end]).tolist()
+
+    def lookup(self, term):
+        """
+            Positions of recipes with a token containing the (normalized) term.
+        """
+        with self._cache_lock:
+            cached = self._term_cache.get(term)
+            if cached is not None:
+                self._term_cache.move_to_end(term)
+        cache_lookup("inverted_terms", cached is not None)
+        if cached is not None:
+            return cached
+
+        token_ids = self.matching_tokens(term)
+        if not token_ids:
+            result = np.empty(0, dtype=np.int32)
+        elif len(token_ids) == 1:
+            result = self.token_postings(token_ids[0])
+        else:
+            result = np.unique(np.concatenate([self.token_postings(i) for i in token_ids]))
+
+        # Bounded cache; user vocab is small compared to the request volume.
+        with self._cache_lock:
+            self._term_cache[term] = result
+            while len(self._term_cache) > TERM_CACHE_SIZE:
+                self._term_cache.popitem(last=False)
+        return result
+
+    def match_all(self, user_input):
+        """
+            AND: positions containing every user ingredient.
+        """
+        lists = sorted((self.lookup(term) for term in normalize_terms(user_input)), key=len)
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        return reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), lists)
+
+    def match_any(self, user_input):
+        """
+            OR: positions containing at least one user ingredient.
+        """
+        lists = [self.lookup(term) for term in normalize_terms(user_input)]
+        lists = [postings for postings in lists if len(postings)]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        return reduce(np.union1d, lists)
+
+    def candidates(self, user_input, limit=100, mask=None):
+        """
+            Up to `limit` positions with the most user ingredients: all-ingredient
+            matches first, then recipes matching the most terms.
+            With a boolean mask (metadata filters) only positions where it is True are returned.
+        """
+        lists = [self.lookup(term) for term in normalize_terms(user_input)]
+        if mask is not None:
+            lists = [postings[mask[postings]] for postings in lists]
+        lists = [postings for postings in lists if len(postings)]
+        if not lists or limit <= 0:
+            return np.empty(0, dtype=np.int32)
+
+        if len(lists) == 1:
+            return lists[0][:limit]
+
+        all_match = reduce(lambda a, b: np.intersect1d(a, b, assume_unique=True), sorted(lists, key=len))
+        if len(all_match) >= limit:
+            return all_match[:limit]
+
+        counts = np.bincount(np.concatenate(lists), minlength=self.row_count)
+        matched = np.flatnonzero(counts)
+        if len(matched) > limit:
+            top = np.argpartition(-counts[matched], limit - 1)[:limit]
+            matched = matched[top]
+        return np.sort(matched).astype(np.int32)
+
+
+class InvertedIndexWriter:
+    """
+        Collects postings while the index is built and saves them next to it.
+    """
+
+    def __init__(self):
+        self.token_positions = {}
+        self.row_count = 0
+
+    def add(self, chunk):
+        for ingredients in chunk['ingredients_tokenized']:
+            position = self.row_count
+            for token in {normalize_ingredient(ingredient) for ingredient in (ingredients or [])}:
+                if token:
+                    self.token_positions.setdefault(token, array('i')).append(position)
+            self.row_count += 1
+
+    def save(self, index_path):
+        vocab = sorted(self.token_positions)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.token_positions[token]) for token in vocab])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        for i, token in enumerate(vocab):
+            postings[offsets[i]:offsets[i + 1]] = self.token_positions[token]
+
+        np.savez(os.path.join(index_path, POSTINGS_FILE),
+                 vocab=np.array(vocab, dtype=str),
+                 offsets=offsets,
+                 postings=postings,
+                 row_count=np.int64(self.row_count))
+        print(f"Saved inverted index ({len(vocab)} tokens, {len(postings)} postings).")
+
+
+# Load the inverted index for an index version
+def load_inverted_index(index_path):
+    """
+        Loads ingredient_postings.npz from an index folder, None if the version has none.
+    """
+    path = os.path.join(index_path, POSTINGS_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return InvertedIndex(data["vocab"].tolist(), data["offsets"], data["postings"], int(data["row_count"]))
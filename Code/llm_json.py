@@ -0,0 +1,160 @@
+"""
+This script:
+1. Parses the JSON object in an LLM answer (loads): well-formed JSON with the C decoder, anything
+   else in one left-to-right scan that tolerates what small models write around and inside it:
+   - text before the first "{" (markdown fences, "Here is your recipe:") and after the object,
+   - smart quotes (“key”: “value”) and single-quoted (Python literal) strings,
+   - trailing commas before } or ], and missing commas between values,
+   - raw newlines inside strings, True / False / None,
+   - a list of "key": "value" pairs where an object belongs (e.g. "nutrition": ["calories": "200"]),
+   - output cut off before the closing brackets (e.g. by num_predict): open strings, lists and
+     objects are closed.
+2. Parses a single value the same way (parse_value), for the streaming parser (recipe_stream.py).
+
+Raises ValueError when the text holds no object.
+"""
+
+import json
+import re
+
+_SPACE = re.compile(r"[ \t\r\n]*")
+_BARE = re.compile(r"[^ \t\r\n,:\]}]*")
+# Where a string may end (or an escape starts), by opening quote
+_STRING_STOPS = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]"),
+                 "“": re.compile(r'[”"\\]'), "”": re.compile(r'[”"\\]')}
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+# Well-formed output (the usual case, always with constrained output) is decoded by the C parser.
+_DECODER = json.JSONDecoder(strict=False)
+
+
+class _Scanner:
+    def __init__(self, text, pos=0):
+        self.text = text
+        self.pos = pos
+
+    def skip_space(self):
+        self.pos = _SPACE.match(self.text, self.pos).end()
+
+    def peek(self):
+        self.skip_space()
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def value(self):
+        c = self.peek()
+        if c == "{":
+            return self.container("}")
+        if c == "[":
+            return self.container("]")
+        if c in _STRING_STOPS:
+            return self.string()
+        if not c:
+            raise ValueError("Unexpected end of model output")
+        return self.bare()
+
+    def container(self, close):
+        """
+            An object or list. A list turns into an object as soon as one of its elements is
+            followed by ":"; missing closing brackets at the end of the text are tolerated.
+        """
+        self.pos += 1
+        is_object = close == "}"
+        items, pairs = [], {}
+        key = None
+        while True:
+            c = self.peek()
+            if not c or c in "}]":
+                self.pos += 1 if c else 0
+                break
+            if c == ",":
+                self.pos += 1
+                continue
+            if c == ":":
+                # The value before it was a key.
+                self.pos += 1
+                if not is_object:
+                    is_object = True
+                    for index in range(0, len(items) - 1, 2):
+                        pairs[str(items[index])] = items[index + 1]
+                    key = items[-1] if len(items) % 2 else None
+                    items = []
+                continue
+            item = self.value()
+            if is_object:
+                if key is None:
+                    key = item
+                else:
+                    pairs[str(key)] = item
+                    key = None
+            else:
+                items.append(item)
+        return pairs if is_object else items
+
+    def string(self):
+        text = self.text
+        stops = _STRING_STOPS[text[self.pos]]
+        self.pos += 1
+        parts = []
+        while True:
+            found = stops.search(text, self.pos)
+            if found is None:
+                # Cut off inside the string
+                parts.append(text[self.pos:])
+                self.pos = len(text)
+                return "".join(parts)
+            end = found.start()
+            parts.append(text[self.pos:end])
+            if text[end] != "\\":
+                self.pos = end + 1
+                return "".join(parts)
+            escaped = text[end + 1:end + 2]
+            if escaped == "u":
+                try:
+                    parts.append(chr(int(text[end + 2:end + 6], 16)))
+                    self.pos = end + 6
+                    continue
+                except ValueError:
+                    pass
+            parts.append(_ESCAPES.get(escaped, escaped))
+            self.pos = end + 2
+
+    def bare(self):
+        """
+            Number, literal, or an unquoted word (kept as a string).
+        """
+        end = _BARE.match(self.text, self.pos).end()
+        token = self.text[self.pos:end]
+        # Anything else that cannot start a value is skipped.
+        self.pos = max(end, self.pos + 1)
+        if token in _LITERALS:
+            return _LITERALS[token]
+        try:
+            return int(token)
+        except ValueError:
+            pass
+        try:
+            return float(token)
+        except ValueError:
+            return token
+
+
+# JSON object in LLM output
+def loads(text):
+    """
+        The first JSON object in text (see the module docstring for what is tolerated).
+    """
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object found in model output.")
+    try:
+        return _DECODER.raw_decode(text, start)[0]
+    except ValueError:
+        return _Scanner(text, start).value()
+
+
+# One JSON value
+def parse_value(text):
+    try:
+        return _DECODER.decode(text)
+    except ValueError:
+        return _Scanner(text.strip()).value()
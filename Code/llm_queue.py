@@ -0,0 +1,124 @@
+"""
+This script:
+1. Bounds the LLM work of an API worker: at most `concurrency` generations (Ollama runs) at
+   once, and at most `max_queue` callers waiting for a slot. A caller arriving at a full queue,
+   or waiting longer than its timeout, gets LlmBusy at once instead of piling up more
+   inferences that slow down every request on the machine.
+2. Deduplicates identical in-flight prompts (singleflight.py): a caller whose key is already
+   being generated (or waiting for a slot) waits for that result instead of starting another
+   run. Each caller gets its own copy of the result.
+3. Reports queue depth, running generations, wait time and outcomes (metrics.py).
+
+Usage:
+    llm_queue = LlmQueue.from_config(config_dict)
+    recipe = llm_queue.run(("recipe", key), generate_recipe, timeout=10, ingredients=[...])
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from metrics import LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT_SECONDS, LLM_REQUESTS
+from singleflight import FlightTimeout, SingleFlight
+
+
+class LlmBusy(Exception):
+    """
+        The LLM queue is full, or no slot (or shared result) came within the caller's timeout.
+    """
+
+    def __init__(self, reason):
+        super().__init__(f"LLM is busy ({reason}), try again shortly")
+        self.reason = reason
+
+
+class LlmQueue:
+    """
+        Concurrency limit, bounded wait queue and in-flight deduplication for LLM calls.
+    """
+
+    def __init__(self, concurrency=2, max_queue=8, timeout=30.0):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout if timeout > 0 else None
+        self._slots = threading.Semaphore(self.concurrency)
+        self._waiting = 0
+        self._running = 0
+        self._flights = SingleFlight("llm", copy_result=True)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_dict):
+        return cls(concurrency=int(config_dict.get("llm_concurrency", '2')),
+                   max_queue=int(config_dict.get("llm_queue_size", '8')),
+                   timeout=float(config_dict.get("llm_queue_timeout_ms", '30000')) / 1000.0)
+
+    def stats(self):
+        with self._lock:
+            return {"concurrency": self.concurrency, "max_queue": self.max_queue,
+                    "running": self._running, "waiting": self._waiting,
+                    "in_flight_keys": self._flights.in_flight()}
+
+    def run(self, key, function, *args, timeout=None, **kwargs):
+        """
+            function(*args, **kwargs) within the concurrency limit, shared with concurrent callers
+            of the same key. timeout (seconds, default the configured one) bounds the wait for a
+            slot or for the shared result; the generation itself is not interrupted.
+            Raises LlmBusy when saturated; exceptions of function reach every caller of the key.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            result, shared = self._flights.do(key, self._run_limited, function, args, kwargs, timeout,
+                                              timeout=timeout)
+        except FlightTimeout:
+            LLM_REQUESTS.labels("timeout").inc()
+            raise LlmBusy("timeout")
+        if shared:
+            LLM_REQUESTS.labels("deduplicated").inc()
+        return result
+
+    def _run_limited(self, function, args, kwargs, timeout):
+        with self.slot(timeout):
+            return function(*args, **kwargs)
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """
+            Holds one of the concurrency slots for the block, without deduplication (e.g. for a
+            streamed generation, which cannot be shared). Raises LlmBusy like run().
+        """
+        timeout = self.timeout if timeout is None else timeout
+        self._acquire_slot(timeout)
+
+        LLM_REQUESTS.labels("run").inc()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+                LLM_IN_FLIGHT.dec()
+            self._slots.release()
+
+    def _acquire_slot(self, timeout):
+        started = time.perf_counter()
+        with self._lock:
+            # Checked and counted under one lock hold, so concurrent callers cannot all pass the
+            # check: a caller that would have to wait is refused while max_queue others already do.
+            if self._running >= self.concurrency and self._waiting >= self.max_queue:
+                LLM_REQUESTS.labels("rejected").inc()
+                raise LlmBusy("queue_full")
+            self._waiting += 1
+            LLM_QUEUE_DEPTH.inc()
+        acquired = False
+        try:
+            acquired = self._slots.acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                LLM_QUEUE_DEPTH.dec()
+                if acquired:
+                    self._running += 1
+                    LLM_IN_FLIGHT.inc()
+            LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - started)
+        if not acquired:
+            LLM_REQUESTS.labels("timeout").inc()
+            raise LlmBusy("timeout")
@@ -0,0 +1,389 @@
+"""
+This script:
+1. Runs local stand-ins for the external services behind /search and /surprise: a fake Ollama
+   HTTP API (POST /api/generate, also streamed) and a fake Unsplash API (GET /search/photos), each with a
+   configurable mean latency and failure rate, plus an `ollama` CLI shim
+   (`python load_test.py ollama-shim run <model> <prompt>`) for api.py, which runs the CLI.
+2. Starts the real Flask app (api.py) in a subprocess pointed at them through a generated config
+   file (RECIPE_CONFIG, see config_reader.py), or drives a server that is already running.
+3. Steps through the load_concurrency levels with closed-loop clients (each sends its next request
+   when the previous one is answered) for load_level_seconds each, and reports per level:
+   throughput, p50/p95/p99 latency, error rate and status codes, overall and per endpoint.
+4. Reports the saturation point: the first level whose p99 exceeds load_p99_slo_ms, whose error
+   rate exceeds load_max_error_rate, or whose throughput grows less than 10% over the level before.
+5. Writes the report as JSON to benchmark_directory/results/.
+
+The app still uses the configured database and index; only Ollama and Unsplash are stubbed.
+
+Usage:
+    python load_test.py                 -> fakes + api.py on a free port + all levels
+    python load_test.py <base url>      -> drive a running server (point its config at the fakes first)
+    python load_test.py fakes           -> only run the fake Ollama / Unsplash servers
+    python load_test.py ollama-shim run <model> <prompt>
+"""
+
+import configparser
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+from config_reader import CONFIG_FILE_PATH, fetch_config_dict
+
+SEARCH_INGREDIENTS = [
+    ["chicken breast", "salt", "garlic"], ["tomato", "basil", "olive oil"], ["egg", "flour", "sugar", "butter"],
+    ["rice", "soy sauce", "ginger"], ["beef", "onion", "potato"], ["pasta", "parmesan cheese"],
+    ["salmon", "lemon", "dill"], ["black beans", "corn", "lime", "cilantro"], ["milk", "chocolate"],
+    ["spinach", "mushroom", "cream"], ["chickpeas", "cumin", "yogurt"], ["banana", "honey", "oats"],
+]
+UNKNOWN_INGREDIENTS = ["dragon fruit", "yuzu kosho", "black garlic", "sumac", "saffron threads"]
+SURPRISE_THEMES = ["rainy day comfort", "the pyramids of Giza", "a picnic in Kyoto", "midnight snack"]
+
+FAKE_RECIPE = {
+    "generic_name": "Load Test Skillet",
+    "description": "A stand-in recipe returned by the fake Ollama.",
+    "tags": ["fake", "load-test", "quick", "dinner", "easy"],
+    "nutrition": {"calories": "420", "total_fat": "12", "sugar": "6", "sodium": "18", "protein": "30",
+                  "saturated_fat": "4"},
+    "ingredient": ["ingredient1", "ingredient2", "ingredient3", "ingredient4", "ingredient5"],
+    "steps": ["Prep.", "Cook.", "Season.", "Plate.", "Serve."],
+    "cuisine": "test",
+    "prep_time": "20 min",
+}
+
+
+# Stand-in latency
+def fake_delay(mean_ms):
+    """
+        Sleeps a log-normal time with the given mean (a long right tail, like real services).
+    """
+    if mean_ms <= 0:
+        return
+    sigma = 0.5
+    time.sleep(random.lognormvariate(math.log(mean_ms / 1000.0) - sigma ** 2 / 2, sigma))
+
+
+# Recipe text for a prompt
+def fake_recipe_text(prompt):
+    recipe = dict(FAKE_RECIPE)
+    match = re.search(r"Ingredients \(may contain typos\): (.*)", prompt)
+    if match:
+        recipe["ingredient"] = [item.strip() for item in match.group(1).split(",") if item.strip()]
+    return json.dumps(recipe)
+
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    """
+        Base of the fake services: answers after fake_delay, or 503 at failure_rate.
+    """
+    latency_ms = 0.0
+    failure_rate = 0.0
+
+    def send_json(self, body):
+        fake_delay(self.latency_ms)
+        if random.random() < self.failure_rate:
+            status, body = 503, {"error": "injected failure"}
+        else:
+            status = 200
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOllamaHandler(FakeServiceHandler):
+    def do_POST(self):
+        if self.path.rstrip("/") != "/api/generate":
+            self.send_error(404)
+            return
+        request_body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        text = fake_recipe_text(request_body.get("prompt", ""))
+        if request_body.get("stream"):
+            self.send_stream(request_body.get("model", ""), text)
+            return
+        self.send_json({"model": request_body.get("model", ""), "done": True, "response": text})
+
+    def send_stream(self, model, text, pieces=40):
+        """
+            NDJSON like Ollama's streamed /api/generate: the text in pieces over the fake latency.
+        """
+        if random.random() < self.failure_rate:
+            self.send_json({"error": "injected failure"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        size = max(1, -(-len(text) // pieces))
+        for start in range(0, len(text), size):
+            fake_delay(self.latency_ms / pieces)
+            self.wfile.write((json.dumps({"model": model, "response": text[start:start + size], "done": False}) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        done = {"model": model, "response": "", "done": True, "eval_count": -(-len(text) // size)}
+        self.wfile.write((json.dumps(done) + "\n").encode("utf-8"))
+
+
+class FakeUnsplashHandler(FakeServiceHandler):
+    def do_GET(self):
+        if not self.path.startswith("/search/photos"):
+            self.send_error(404)
+            return
+        photo_id = random.randrange(10 ** 6)
+        self.send_json({"total": 1, "results": [{"urls": {"full": f"http://{self.headers.get('Host')}/photos/{photo_id}.jpg"}}]})
+
+
+# Start a fake service
+def start_fake(handler_class, latency_ms, failure_rate):
+    """
+        Serves handler_class on a free local port in a daemon thread. Returns (server, base url).
+    """
+    handler = type(handler_class.__name__, (handler_class,), {"latency_ms": latency_ms, "failure_rate": failure_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler_class.__name__, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_fakes(config_dict):
+    """
+        Returns {"ollama_url": ..., "unsplash_url": ...} of the running stand-ins.
+    """
+    _, ollama_url = start_fake(FakeOllamaHandler, float(config_dict.get("fake_llm_latency_ms", '800')),
+                               float(config_dict.get("fake_llm_failure_rate", '0.02')))
+    _, unsplash_url = start_fake(FakeUnsplashHandler, float(config_dict.get("fake_image_latency_ms", '150')),
+                                 float(config_dict.get("fake_image_failure_rate", '0.01')))
+    return {"ollama_url": ollama_url, "unsplash_url": unsplash_url}
+
+
+# `ollama run [--format json] <model> <prompt>` stand-in
+def ollama_shim(args):
+    """
+        Prints a fake recipe for the prompt after the fake LLM latency; exits 1 at the failure rate.
+        Latency and failure rate come from FAKE_LLM_LATENCY_MS / FAKE_LLM_FAILURE_RATE, else config.ini.
+    """
+    if args[1:2] == ["--format"]:
+        args = args[:1] + args[3:]
+    if len(args) < 3 or args[0] != "run":
+        print("usage: load_test.py ollama-shim run [--format json] <model> <prompt>", file=sys.stderr)
+        return 2
+    config_dict = fetch_config_dict()
+    latency_ms = float(os.environ.get("FAKE_LLM_LATENCY_MS", config_dict.get("fake_llm_latency_ms", '800')))
+    failure_rate = float(os.environ.get("FAKE_LLM_FAILURE_RATE", config_dict.get("fake_llm_failure_rate", '0.02')))
+    fake_delay(latency_ms)
+    if random.random() < failure_rate:
+        print("Error: injected failure", file=sys.stderr)
+        return 1
+    print(fake_recipe_text(args[2]))
+    return 0
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Config pointing the app at the stand-ins
+def write_stub_config(fake_urls):
+    """
+        Copy of config.ini with the Ollama and Unsplash endpoints replaced. Returns its path.
+    """
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE_PATH)
+    overrides = {
+        "ollama_url": fake_urls["ollama_url"],
+        "unsplash_url": fake_urls["unsplash_url"],
+        "ollama_command": f'"{sys.executable}" "{os.path.abspath(__file__)}" ollama-shim',
+        "embedding_service_url": "",
+    }
+    for key, value in overrides.items():
+        section = next((name for name in config.sections() if config.has_option(name, key)), None)
+        if section is None:
+            section = "LOADTEST"
+            if not config.has_section(section):
+                config.add_section(section)
+        config.set(section, key, value)
+
+    handle, path = tempfile.mkstemp(prefix="load_test_", suffix=".ini")
+    with os.fdopen(handle, "w") as f:
+        config.write(f)
+    return path
+
+
+def start_api(config_dict, fake_urls, ready_timeout=600):
+    """
+        Runs api.py's app in a subprocess on a free port and waits for /ready.
+        Returns (process, base url, config path).
+    """
+    config_path = write_stub_config(fake_urls)
+    port = free_port()
+    env = dict(os.environ,
+               RECIPE_CONFIG=config_path,
+               FAKE_LLM_LATENCY_MS=config_dict.get("fake_llm_latency_ms", '800'),
+               FAKE_LLM_FAILURE_RATE=config_dict.get("fake_llm_failure_rate", '0.02'))
+    process = subprocess.Popen(
+        [sys.executable, "-c", f"from api import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"api.py exited with {process.returncode} during start-up")
+        try:
+            if requests.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return process, base_url, config_path
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"api.py not ready after {ready_timeout}s")
+
+
+# Request mix
+def next_request(rng, surprise_share, unknown_share):
+    """
+        Returns (endpoint, query params).
+    """
+    if rng.random() < surprise_share:
+        return "/surprise", [("ingredients", rng.choice(SURPRISE_THEMES))]
+    ingredients = list(rng.choice(SEARCH_INGREDIENTS))
+    if rng.random() < unknown_share:
+        ingredients.append(rng.choice(UNKNOWN_INGREDIENTS))
+    return "/search", [("ingredients", ingredient) for ingredient in ingredients]
+
+
+# Closed-loop client
+def client_loop(base_url, stop_at, seed, surprise_share, unknown_share, timeout, samples):
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.monotonic() < stop_at:
+        endpoint, params = next_request(rng, surprise_share, unknown_share)
+        started = time.perf_counter()
+        try:
+            status = session.get(base_url + endpoint, params=params, timeout=timeout).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        samples.append((endpoint, status, time.perf_counter() - started))
+
+
+def summarize(samples, seconds):
+    latencies = np.asarray([latency for _, _, latency in samples]) * 1000
+    errors = sum(1 for _, status, _ in samples if not (isinstance(status, int) and status < 400))
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(samples) else None,
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(samples) else None,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1) if len(samples) else None,
+        "error_rate": round(errors / len(samples), 4) if samples else None,
+        "statuses": dict(Counter(str(status) for _, status, _ in samples)),
+    }
+
+
+# One concurrency level
+def run_level(base_url, concurrency, seconds, surprise_share, unknown_share, timeout=120):
+    samples = []  # list.append is atomic, clients share it
+    stop_at = time.monotonic() + seconds
+    started = time.monotonic()
+    clients = [threading.Thread(target=client_loop,
+                                args=(base_url, stop_at, concurrency * 1000 + i, surprise_share, unknown_share,
+                                      timeout, samples), daemon=True)
+               for i in range(concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - started
+
+    level = {"concurrency": concurrency, **summarize(samples, elapsed)}
+    level["endpoints"] = {endpoint: summarize([sample for sample in samples if sample[0] == endpoint], elapsed)
+                          for endpoint in sorted({sample[0] for sample in samples})}
+    return level
+
+
+# First saturated level
+def saturation_point(levels, p99_slo_ms, max_error_rate, min_gain=0.10):
+    """
+        Returns (concurrency, reason) of the first saturated level, or (None, None).
+    """
+    previous = None
+    for level in levels:
+        if level["requests"] == 0:
+            return level["concurrency"], "no request completed"
+        if level["p99_ms"] > p99_slo_ms:
+            return level["concurrency"], f"p99 {level['p99_ms']} ms > {p99_slo_ms:g} ms"
+        if level["error_rate"] > max_error_rate:
+            return level["concurrency"], f"error rate {level['error_rate']} > {max_error_rate:g}"
+        if previous is not None and level["throughput_rps"] < previous["throughput_rps"] * (1 + min_gain):
+            return level["concurrency"], f"throughput gain < {min_gain:.0%}"
+        previous = level
+    return None, None
+
+
+def run(config_dict, base_url):
+    levels = []
+    for concurrency in [int(value) for value in config_dict.get("load_concurrency", '1,2,4,8,16,32').split(",")]:
+        level = run_level(base_url, concurrency,
+                          float(config_dict.get("load_level_seconds", '10')),
+                          float(config_dict.get("load_surprise_share", '0.05')),
+                          float(config_dict.get("load_unknown_share", '0.2')))
+        levels.append(level)
+        print(f"concurrency {concurrency:>3}: {level['throughput_rps']:>8} rps  p50 {level['p50_ms']} ms  "
+              f"p99 {level['p99_ms']} ms  errors {level['error_rate']}")
+
+    saturated_at, reason = saturation_point(levels, float(config_dict.get("load_p99_slo_ms", '1000')),
+                                            float(config_dict.get("load_max_error_rate", '0.01')))
+    return {"timestamp": datetime.now().isoformat(timespec="seconds"), "target": base_url,
+            "saturation": {"concurrency": saturated_at, "reason": reason}, "levels": levels}
+
+
+def main(target=None):
+    config_dict = fetch_config_dict()
+    process = config_path = None
+    if target is None:
+        fake_urls = start_fakes(config_dict)
+        print(f"Fake Ollama at {fake_urls['ollama_url']}, fake Unsplash at {fake_urls['unsplash_url']}")
+        process, target, config_path = start_api(config_dict, fake_urls)
+    try:
+        report = run(config_dict, target.rstrip("/"))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            os.remove(config_path)
+
+    results_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('benchmark_directory', 'Benchmarks'), "results")
+    os.makedirs(results_path, exist_ok=True)
+    output = os.path.join(results_path, f"load_{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["saturation"]))
+    print(f"Saved to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["ollama-shim"]:
+        sys.exit(ollama_shim(sys.argv[2:]))
+    elif sys.argv[1:2] == ["fakes"]:
+        urls = start_fakes(fetch_config_dict())
+        print(json.dumps(urls))
+        threading.Event().wait()
+    else:
+        main(*sys.argv[1:2])
@@ -0,0 +1,115 @@
+"""
+This script:
+1. Defines the Prometheus metrics of the search pipeline (prometheus_client).
+2. Times pipeline stages: `with track_stage("encode"): ...` observes one histogram labelled by stage
+   (preprocess, encode, faiss, rank, db_fetch, images, ai_fallback).
+3. Renders the /metrics page of api.py and embedding_service.py.
+
+Cache hit ratio, e.g. in PromQL:
+    sum by (cache) (rate(recipe_cache_requests_total{result="hit"}[5m]))
+      / sum by (cache) (rate(recipe_cache_requests_total[5m]))
+
+With several worker processes (gunicorn) set PROMETHEUS_MULTIPROC_DIR to an empty directory
+before the server starts; /metrics then adds up the samples of all workers.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from tracing import current_span, span
+
+STAGES = ("preprocess", "encode", "faiss", "rank", "db_fetch", "images", "ai_fallback")
+
+# From sub-millisecond index lookups to LLM calls of a minute or more
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+SEARCH_STAGE_SECONDS = Histogram("recipe_search_stage_seconds", "Time spent in each /search stage",
+                                 ["stage"], buckets=LATENCY_BUCKETS)
+SEARCH_SECONDS = Histogram("recipe_search_seconds", "End-to-end /search latency by HTTP status",
+                           ["status"], buckets=LATENCY_BUCKETS)
+AI_FALLBACKS = Counter("recipe_ai_fallbacks_total", "/search answers handed to the AI fallback",
+                       ["outcome"])
+UNSPLASH_CALLS = Counter("recipe_unsplash_calls_total", "Unsplash image lookups", ["outcome"])
+CACHE_REQUESTS = Counter("recipe_cache_requests_total", "Cache lookups", ["cache", "result"])
+INDEX_VECTORS = Gauge("recipe_index_vectors", "Vectors in the live FAISS index",
+                      multiprocess_mode="mostrecent")
+DB_POOL_SIZE = Gauge("recipe_db_pool_size", "Maximum connections in the DB pool",
+                     multiprocess_mode="livesum")
+DB_POOL_IN_USE = Gauge("recipe_db_pool_in_use", "DB pool connections checked out",
+                       multiprocess_mode="livesum")
+LLM_QUEUE_DEPTH = Gauge("recipe_llm_queue_depth", "LLM calls waiting for a slot (llm_queue.py)",
+                        multiprocess_mode="livesum")
+LLM_IN_FLIGHT = Gauge("recipe_llm_in_flight", "LLM generations running", multiprocess_mode="livesum")
+LLM_QUEUE_WAIT_SECONDS = Histogram("recipe_llm_queue_wait_seconds", "Time LLM calls waited for a slot",
+                                   buckets=LATENCY_BUCKETS)
+SINGLEFLIGHT_CALLS = Counter("recipe_singleflight_calls_total",
+                             "Calls that ran (leader) or joined an identical call in flight (follower)",
+                             ["group", "role"])
+LLM_REQUESTS = Counter("recipe_llm_requests_total", "LLM calls by outcome (run, deduplicated, rejected, timeout)",
+                       ["outcome"])
+
+# Label children resolved once; labels() takes a lock and a dict lookup on every call.
+_stage_timers = {stage: SEARCH_STAGE_SECONDS.labels(stage) for stage in STAGES}
+
+# Stage timings of the current request (see request_profiler.py), None when nobody collects them
+_request_stages = ContextVar("request_stages", default=None)
+
+
+# Time one stage
+@contextmanager
+def track_stage(stage, **attributes):
+    """
+        Observes the time spent in the block (also when it raises) under the stage label.
+        In a traced request the block is also a span (yielded, for attributes; see tracing.py).
+    """
+    started = time.perf_counter()
+    try:
+        with span(stage, **attributes) as stage_span:
+            yield stage_span
+    finally:
+        elapsed = time.perf_counter() - started
+        timer = _stage_timers.get(stage) or SEARCH_STAGE_SECONDS.labels(stage)
+        timer.observe(elapsed)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+# Collect stage timings of this request
+def collect_stages(stages):
+    """
+        Adds the seconds of every track_stage block in the current context to stages[stage]
+        until release_stages(token) with the returned token.
+    """
+    return _request_stages.set(stages)
+
+
+def release_stages(token):
+    _request_stages.reset(token)
+
+
+# Count a cache lookup
+def cache_lookup(cache, hit):
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.labels(cache, result).inc()
+    current = current_span()
+    if current.recording:
+        key = f"cache.{cache}.{result}"
+        current.set(key, current.attributes.get(key, 0) + 1)
+
+
+# Render /metrics
+def render_metrics():
+    """
+        Returns (body, content type) in the Prometheus text format.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
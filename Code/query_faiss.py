@@ -12,13 +12,14 @@
 import os
 from config_reader import fetch_config_dict
 import psycopg2
-from sentence_transformers import SentenceTransformer
-import numpy as np
-import faiss
 import re
+from embedding_backend import load_encoder
+from index_store import load_index_version
+from ranking import load_ranking_engine, rank_rows
+from retrieval import prepare_query, search_index, uses_inner_product
 
-# Initialize model to generate embeddings
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Initialize model to generate embeddings (torch, torch_int8 or onnx, see embedding_backend.py)
+model = load_encoder(fetch_config_dict())
 
 # Connect to Database
 def create_connection(config_dict):
@@ -41,15 +42,13 @@ def create_connection(config_dict):
 # Load index from file.
 def load_index(index_path):
     """
-        Loads index from path.
+        Loads the current index version (or the legacy flat files) from path.
+        The ranking engine is None when the version has no ingredient token file.
     """
-    # Load the FAISS index
-    faiss_index = faiss.read_index(os.path.join(index_path, "recipe_index.faiss"))
+    snapshot = load_index_version(index_path)
+    print(f"Loaded index version {snapshot.version}")
 
-    # Load the recipe IDs
-    recipe_ids = np.load(os.path.join(index_path,"recipe_ids.npy"))
-
-    return faiss_index, recipe_ids
+    return snapshot.faiss_index, snapshot.recipe_ids, load_ranking_engine(snapshot.path)
 
 #Preprocess user input
 def preprocess_ingredients(ingredients):
@@ -77,13 +76,11 @@ def query_faiss(user_embedding, index, recipe_ids, top_k=15):
     """
     Queries the FAISS index to find the top-k closest matches.
     """
-    
-    # Query the FAISS index
-    distances, indices = index.search(np.array([user_embedding]), k=top_k)
-    
+    positions, distances = search_index(user_embedding, index, top_k)
+
     # Map FAISS indices to recipe IDs
-    matching_recipe_ids = recipe_ids[indices.flatten()]
-    return matching_recipe_ids, distances.flatten()
+    matching_recipe_ids = recipe_ids[positions]
+    return matching_recipe_ids, distances
 
 def fetch_matching_recipes(recipe_ids, conn):
     """
@@ -116,25 +113,7 @@ def ranked_results(results, user_input):
     """
     The results are ranked based on how many user input ingredients appear as substrings in each recipe's ingredient list.
     """
-    # Preprocess user input: Remove spaces, hyphens, and convert to lowercase
-    user_input = [ingredient.lower().replace(" ", "").replace("-", "") for ingredient in user_input]
-
-    # Initialize a dictionary to store match counts
-    ranked_idx = {}
-    for idx, result in enumerate(results):
-        # Extract and preprocess the ingredient list from the result
-        ingredient_list = result[-2]  # Assuming ingredients are in the second-to-last column
-        ingredient_string = "".join(ingredient_list).lower().replace(" ", "").replace("-", "")
-        
-        # Count matches using substring search
-        match_counter = sum(1 for user_ingredient in user_input if user_ingredient in ingredient_string)
-        ranked_idx[idx] = match_counter
-
-    # Sort the results by match count in descending order
-    sorted_indices = sorted(ranked_idx.keys(), key=lambda x: ranked_idx[x], reverse=True)
-
-    # Return the sorted results
-    sorted_results = [results[i] for i in sorted_indices]
+    sorted_results, _ = rank_rows(results, user_input)
     return sorted_results
 
 def main(user_input):
@@ -147,21 +126,30 @@ def main(user_input):
 
     index_path = os.path.join(base_directory, index_folder)
 
-    faiss_index, recipe_ids = load_index(index_path)
+    faiss_index, recipe_ids, ranking_engine = load_index(index_path)
     print("Done.\nGenerating Embedding of User Input.")
 
     # Generate embedding for user input
-    user_embedding = generate_embedding(user_input)
+    user_embedding = prepare_query(faiss_index, generate_embedding(user_input))
     print("Done.\nQuerying FAISS.")
     # Query FAISS
-    matching_recipe_ids, distances = query_faiss(user_embedding, faiss_index, recipe_ids, top_k=25)
+    positions, distances = search_index(user_embedding, faiss_index, top_k=25)
+    matching_recipe_ids = recipe_ids[positions]
     print("Matching recipe IDs :", matching_recipe_ids)
 
     # Fetch results from DB
     conn = create_connection(config_dict)
-    results = fetch_matching_recipes(matching_recipe_ids, conn)
-    print("Results from DB : \n", results)
-    results = ranked_results(results, user_input)
+    if ranking_engine is not None:
+        # Rank on precomputed ingredient tokens, FAISS distance (or similarity) breaks ties.
+        ranked = ranking_engine.rank(positions, distances, user_input,
+                                     higher_is_better=uses_inner_product(faiss_index))
+        top_ids = [int(recipe_ids[candidate.position]) for candidate in ranked[:5]]
+        rows_by_id = {row[0]: row for row in fetch_matching_recipes(top_ids, conn)}
+        results = [rows_by_id[recipe_id] for recipe_id in top_ids if recipe_id in rows_by_id]
+    else:
+        results = fetch_matching_recipes(matching_recipe_ids, conn)
+        print("Results from DB : \n", results)
+        results = ranked_results(results, user_input)
     print("Ranked_results\n", results[:5])
 
 
@@ -0,0 +1,162 @@
+"""
+This script:
+1. Normalizes recipe ingredient tokens once at index build time (ingredient_tokens.txt).
+2. Ranks FAISS candidates by how many user ingredients they contain,
+   breaking ties with the FAISS distance.
+
+Each recipe is stored as one line "|tok1|tok2|...|" (lowercase, no spaces or hyphens),
+line number == FAISS position, and loaded as a frozenset of its tokens. A user ingredient
+matches exactly when it is one of the tokens, counted for all of them at once with one set
+intersection; an ingredient that is no token still matches when it is a substring of the line
+(same rule as the old ranked_results), checked only for those left over.
+"""
+
+import os
+import sys
+from collections import namedtuple
+import numpy as np
+
+TOKENS_FILE = "ingredient_tokens.txt"
+
+RankedCandidate = namedtuple("RankedCandidate", ["position", "matches", "exact_matches", "distance"])
+
+
+# Normalize an ingredient
+def normalize_ingredient(ingredient):
+    """
+        Lowercases and removes spaces and hyphens ("Chicken-Breast " -> "chickenbreast").
+    """
+    return (str(ingredient).lower()
+            .replace(" ", "").replace("-", "")
+            .replace("|", "").replace("\n", ""))
+
+
+# Normalize user input
+def normalize_terms(user_input):
+    """
+        Normalizes user ingredients and drops empty ones.
+    """
+    if isinstance(user_input, str):
+        user_input = [user_input]
+    terms = (normalize_ingredient(ingredient) for ingredient in user_input)
+    return [term for term in terms if term]
+
+
+# Build the line for one recipe
+def ingredient_line(ingredients):
+    """
+        ['Chicken Breast', 'salt'] -> "|chickenbreast|salt|"
+    """
+    tokens = [normalize_ingredient(ingredient) for ingredient in (ingredients or [])]
+    return "|" + "|".join(token for token in tokens if token) + "|"
+
+
+# Tokens of one recipe line
+def token_set(line):
+    """
+        "|chickenbreast|salt|" -> frozenset({"chickenbreast", "salt"}); tokens are interned, so
+        recipes share one string per distinct ingredient.
+    """
+    return frozenset(sys.intern(token) for token in line[1:-1].split("|") if token)
+
+
+# Count matches against one recipe's tokens
+def match_counts(line, tokens, query_tokens):
+    """
+        Returns (matches, exact token matches) of the query tokens (a frozenset) in a recipe.
+    """
+    exact = query_tokens & tokens
+    matches = len(exact)
+    if matches < len(query_tokens):
+        # Partial matches ("chicken" in "|chickenbreast|") for the tokens that are not exact.
+        matches += sum(1 for term in query_tokens - exact if term in line)
+    return matches, len(exact)
+
+
+# Count matches for one recipe line
+def count_matches(line, terms):
+    """
+        Returns (substring matches, exact token matches) of terms in a recipe line.
+    """
+    return match_counts(line, token_set(line), frozenset(terms))
+
+
+class RankingEngine:
+    """
+        Ranks FAISS candidates using the precomputed ingredient lines.
+    """
+
+    def __init__(self, lines, higher_is_better=False):
+        self.lines = lines
+        self.token_sets = [token_set(line) for line in lines]
+        self.higher_is_better = higher_is_better
+
+    def rank(self, positions, distances, user_input, higher_is_better=None):
+        """
+            Returns RankedCandidates sorted by matches, exact matches, then FAISS distance
+            (or any other score, with higher_is_better=True).
+        """
+        if higher_is_better is None:
+            higher_is_better = self.higher_is_better
+        query_tokens = frozenset(normalize_terms(user_input))
+        sign = -1.0 if higher_is_better else 1.0
+        lines = self.lines
+        token_sets = self.token_sets
+        scored = []
+        for position, distance in zip(np.asarray(positions).tolist(), np.asarray(distances).tolist()):
+            if position < 0:
+                continue
+            matches, exact_matches = match_counts(lines[position], token_sets[position], query_tokens)
+            scored.append((-matches, -exact_matches, sign * distance, position))
+
+        scored.sort()
+        return [RankedCandidate(position, -neg_matches, -neg_exact, sign * signed_distance)
+                for neg_matches, neg_exact, signed_distance, position in scored]
+
+
+class RankingTokenWriter:
+    """
+        Collects ingredient lines while the index is built and saves them next to it.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def add(self, chunk):
+        self.lines.extend(ingredient_line(ingredients) for ingredients in chunk['ingredients_tokenized'])
+
+    def save(self, index_path):
+        with open(os.path.join(index_path, TOKENS_FILE), "w", encoding="utf-8") as f:
+            for line in self.lines:
+                f.write(line[1:-1] + "\n")
+        print(f"Saved {len(self.lines)} ingredient token lines.")
+
+
+# Load the ranking engine for an index version
+def load_ranking_engine(index_path, higher_is_better=False):
+    """
+        Loads ingredient_tokens.txt from an index folder.
+        Returns None for indexes built before the token file existed.
+    """
+    path = os.path.join(index_path, TOKENS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        lines = ["|" + line.rstrip("\n") + "|" for line in f]
+    return RankingEngine(lines, higher_is_better)
+
+
+# Rank DB rows
+def rank_rows(results, user_input, ingredients_column=-2):
+    """
+        Ranks DB rows by user ingredient matches in their ingredients_tokenized column.
+        Used when the index has no token file. Returns (sorted rows, match counts).
+    """
+    terms = normalize_terms(user_input)
+    scored = []
+    for idx, result in enumerate(results):
+        matches, exact_matches = count_matches(ingredient_line(result[ingredients_column]), terms)
+        scored.append((matches, exact_matches, idx))
+
+    scored.sort(key=lambda s: (-s[0], -s[1], s[2]))
+    return [results[idx] for _, _, idx in scored], [matches for matches, _, _ in scored]
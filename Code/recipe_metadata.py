@@ -0,0 +1,205 @@
+"""
+This script:
+1. Builds columnar metadata arrays aligned with FAISS positions while the index is built:
+   total_time (minutes), parsed nutrition values and a tag bitset.
+2. Saves them next to the FAISS index (recipe_metadata.npz).
+3. Turns /search filter parameters into a boolean mask / FAISS id selector, so
+   filtering happens inside retrieval instead of after the top-k cut.
+
+Filters (query parameters):
+    max_time=30, tags=vegetarian (repeatable, all must match),
+    max_<nutrient>=500 / min_<nutrient>=10 for the nutrients in NUTRITION_FIELDS.
+Recipes with an unknown value never pass a numeric filter on that value.
+The tag bitset covers every tag of the corpus; a tag left out of a capped bitset (max_tags)
+is refused with ValueError (400) rather than matching nothing.
+"""
+
+import os
+import re
+from collections import Counter
+from array import array
+import numpy as np
+import faiss
+
+METADATA_FILE = "recipe_metadata.npz"
+
+# Same order api.clean_faiss_response uses to label the nutrition list.
+NUTRITION_FIELDS = ["calories", "protein", "saturated_fat", "sodium", "sugar", "total_fat"]
+
+# Tag bitsets of index versions built before the whole vocabulary was kept were capped at this.
+LEGACY_MAX_TAGS = 512
+
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+# Parse a number
+def parse_number(value):
+    """
+        "51.5" -> 51.5, "20 min" -> 20.0, None / "" -> nan
+    """
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_PATTERN.search(str(value))
+    return float(match.group(0)) if match else np.nan
+
+
+class RecipeMetadata:
+    """
+        Columnar metadata for one index version.
+    """
+
+    def __init__(self, total_time, nutrition, tag_vocab, tag_bits, tags_complete=True):
+        self.total_time = total_time
+        self.nutrition = nutrition
+        self.tag_ids = {tag: i for i, tag in enumerate(tag_vocab)}
+        self.tag_bits = tag_bits
+        self.tags_complete = tags_complete
+        self.row_count = len(total_time)
+
+    def tag_mask(self, tag):
+        """
+            Raises ValueError for a tag the bitset may have left out (see MetadataWriter).
+        """
+        tag_id = self.tag_ids.get(tag.strip().lower())
+        if tag_id is None:
+            if not self.tags_complete:
+                raise ValueError(f"Tag {tag!r} is not indexed for filtering; rebuild the index.")
+            # No recipe has this tag.
+            return np.zeros(self.row_count, dtype=bool)
+        byte, bit = divmod(tag_id, 8)
+        return (self.tag_bits[:, byte] >> bit) & 1 == 1
+
+    def mask(self, recipe_filter):
+        """
+            Boolean array over FAISS positions, True where the recipe passes the filter.
+        """
+        mask = np.ones(self.row_count, dtype=bool)
+        if recipe_filter.max_time is not None:
+            mask &= self.total_time <= recipe_filter.max_time
+        for field, (low, high) in recipe_filter.nutrition_bounds.items():
+            column = self.nutrition[:, NUTRITION_FIELDS.index(field)]
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        for tag in recipe_filter.tags:
+            mask &= self.tag_mask(tag)
+        return mask
+
+
+class RecipeFilter:
+    """
+        Filter parameters of one /search request.
+    """
+
+    def __init__(self, max_time=None, nutrition_bounds=None, tags=()):
+        self.max_time = max_time
+        self.nutrition_bounds = nutrition_bounds or {}
+        self.tags = [tag for tag in tags if tag.strip()]
+
+    @classmethod
+    def from_args(cls, args):
+        """
+            Builds a filter from request.args. Raises ValueError on a non-numeric bound.
+        """
+        def number(name):
+            value = args.get(name)
+            if value in (None, ""):
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                raise ValueError(f"Filter {name} must be a number, got {value!r}")
+
+        bounds = {}
+        for field in NUTRITION_FIELDS:
+            low, high = number(f"min_{field}"), number(f"max_{field}")
+            if low is not None or high is not None:
+                bounds[field] = (low, high)
+
+        return cls(max_time=number("max_time"), nutrition_bounds=bounds, tags=args.getlist("tags"))
+
+    def is_empty(self):
+        return self.max_time is None and not self.nutrition_bounds and not self.tags
+
+    def key(self):
+        """
+            Hashable form, for caching / deduplicating identical filtered requests.
+        """
+        return (self.max_time, tuple(sorted(self.nutrition_bounds.items())), tuple(sorted(self.tags)))
+
+
+# FAISS selector from a mask
+def id_selector(mask):
+    """
+        Returns (selector, bits). Keep `bits` alive for as long as the selector is used.
+    """
+    bits = np.packbits(mask, bitorder="little")
+    return faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits)), bits
+
+
+class MetadataWriter:
+    """
+        Collects metadata columns while the index is built and saves them next to it.
+    """
+
+    def __init__(self, max_tags=None):
+        self.max_tags = max_tags
+        self.total_time = array('f')
+        self.nutrition = array('f')
+        self.tags = []
+
+    def add(self, chunk):
+        size = len(chunk['ingredients_tokenized'])
+        times = chunk.get('total_time') or [None] * size
+        nutrition = chunk.get('nutrition') or [None] * size
+        tags = chunk.get('tags') or [None] * size
+
+        for total_time, values, recipe_tags in zip(times, nutrition, tags):
+            self.total_time.append(parse_number(total_time))
+            values = list(values) if isinstance(values, (list, tuple, np.ndarray)) else []
+            for i in range(len(NUTRITION_FIELDS)):
+                self.nutrition.append(parse_number(values[i]) if i < len(values) else np.nan)
+            self.tags.append([str(tag).strip().lower() for tag in recipe_tags]
+                             if isinstance(recipe_tags, (list, tuple, np.ndarray)) else [])
+
+    def save(self, index_path):
+        row_count = len(self.total_time)
+        counts = Counter(tag for recipe_tags in self.tags for tag in set(recipe_tags))
+        # Every tag by default; max_tags keeps only the most common ones.
+        tag_vocab = [tag for tag, _ in counts.most_common(self.max_tags)]
+        tag_ids = {tag: i for i, tag in enumerate(tag_vocab)}
+
+        tag_bits = np.zeros((row_count, (len(tag_vocab) + 7) // 8), dtype=np.uint8)
+        for position, recipe_tags in enumerate(self.tags):
+            for tag in recipe_tags:
+                tag_id = tag_ids.get(tag)
+                if tag_id is not None:
+                    tag_bits[position, tag_id // 8] |= 1 << (tag_id % 8)
+
+        np.savez(os.path.join(index_path, METADATA_FILE),
+                 total_time=np.frombuffer(self.total_time, dtype=np.float32),
+                 nutrition=np.frombuffer(self.nutrition, dtype=np.float32).reshape(row_count, len(NUTRITION_FIELDS)),
+                 tag_vocab=np.array(tag_vocab, dtype=str),
+                 tag_bits=tag_bits,
+                 tags_complete=len(tag_vocab) == len(counts))
+        print(f"Saved recipe metadata ({row_count} rows, {len(tag_vocab)} tags).")
+
+
+# Load metadata for an index version
+def load_recipe_metadata(index_path):
+    """
+        Loads recipe_metadata.npz from an index folder, None if the version has none.
+    """
+    path = os.path.join(index_path, METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        tag_vocab = data["tag_vocab"].tolist()
+        if "tags_complete" in data.files:
+            tags_complete = bool(data["tags_complete"])
+        else:
+            tags_complete = len(tag_vocab) < LEGACY_MAX_TAGS
+        return RecipeMetadata(data["total_time"], data["nutrition"], tag_vocab, data["tag_bits"], tags_complete)
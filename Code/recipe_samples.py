@@ -0,0 +1,99 @@
+"""
+This script:
+1. Samples indexed recipes (FAISS positions) with their raw ingredient lists, read from the
+   recipes table or, for an index built with index_source = files, from the preprocessed files.
+2. Builds the text /search encodes from an ingredient list (query_text).
+
+The retrieval benchmarks (compare_retrieval.py, calibrate_similarity.py, benchmark_embeddings.py)
+build their queries from these samples, so they encode what users send ("olive oil"),
+not the normalized ranking tokens ("oliveoil").
+"""
+
+import os
+import random
+import re
+from db_push import create_connection, stream_data_from_files
+from ranking import normalize_ingredient
+
+# Positions drawn per wanted recipe; bounds the search for recipes with enough ingredients.
+OVERSAMPLE = 4
+
+
+# Preprocess ingredients
+def preprocess_ingredients(ingredients):
+    """
+    Same as api.preprocess_ingredients, so queries get the same embedding text as /search.
+    """
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+
+    if isinstance(ingredients, list):
+        return [re.sub(r'[^\w\s]', '', ingredient.lower()).strip() for ingredient in ingredients if ingredient.strip()]
+    return []
+
+
+def query_text(ingredients):
+    return " ".join(preprocess_ingredients(ingredients))
+
+
+# Raw ingredients of index positions
+def fetch_ingredients(config_dict, snapshot, positions):
+    """
+        Returns {position: [ingredients]} for FAISS positions of the snapshot.
+    """
+    wanted = set(positions)
+    found = {}
+    if snapshot.manifest.get("index_source") == "files":
+        data_path = os.path.join(config_dict.get('base_directory', ''), config_dict.get('data_dir', ''))
+        position = 0
+        for chunk in stream_data_from_files(data_path, start_id=int(config_dict.get('start_id', '1'))):
+            for ingredients in chunk['ingredients_tokenized']:
+                if position in wanted:
+                    found[position] = list(ingredients or [])
+                position += 1
+            if len(found) == len(wanted):
+                break
+        return found
+
+    position_by_id = {int(snapshot.recipe_ids[position]): position for position in wanted}
+    conn = create_connection(config_dict)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, ingredients_tokenized FROM recipes WHERE id = ANY(%s);", (list(position_by_id),))
+            for recipe_id, ingredients in cur.fetchall():
+                found[position_by_id[recipe_id]] = list(ingredients or [])
+    finally:
+        conn.close()
+    return found
+
+
+# Random indexed recipes
+def sample_recipes(config_dict, snapshot, count, min_ingredients=1, seed=7):
+    """
+        Returns [(position, [raw ingredients])] for up to `count` random indexed recipes with at
+        least min_ingredients ingredients that stay distinct once normalized (ranking tokens).
+        At most OVERSAMPLE * count positions are drawn; ValueError when none of them qualifies.
+    """
+    rng = random.Random(seed)
+    total = snapshot.faiss_index.ntotal
+    positions = rng.sample(range(total), min(total, count * OVERSAMPLE))
+    ingredients_by_position = fetch_ingredients(config_dict, snapshot, positions)
+
+    recipes = []
+    for position in positions:
+        distinct = {}
+        for ingredient in ingredients_by_position.get(position, []):
+            token = normalize_ingredient(ingredient or "")
+            if token and token not in distinct:
+                distinct[token] = ingredient.strip()
+        ingredients = list(distinct.values())
+        if len(ingredients) >= min_ingredients:
+            recipes.append((position, ingredients))
+            if len(recipes) == count:
+                break
+
+    if not recipes:
+        raise ValueError(f"None of {len(positions)} sampled recipes has {min_ingredients} or more ingredients.")
+    if len(recipes) < count:
+        print(f"Only {len(recipes)} of {count} sampled recipes have {min_ingredients} or more ingredients.")
+    return recipes
@@ -0,0 +1,143 @@
+"""
+This script:
+1. Parses a recipe JSON object incrementally while the LLM is still writing it
+   (RecipeStreamParser): text before the first "{" (e.g. a markdown fence) is skipped, and an
+   event is emitted as soon as a top-level field is complete ("field") and, for list fields
+   such as ingredient and steps, as soon as each element is complete ("item").
+2. Formats the events of the streaming endpoints of api.py / api_async.py as NDJSON (one JSON
+   object per line, default) or Server-Sent Events (?format=sse).
+
+Events:
+    {"event": "item",    "key": "steps", "index": 0, "value": "Preheat the oven ..."}
+    {"event": "field",   "key": "generic_name", "value": "Sandstone Falafel"}
+    {"event": "results", ...}   final answer, same body as /search or /surprise
+    {"event": "error",   "error": "..."}
+
+A field value that does not parse on its own (e.g. an unusual nutrition block) is skipped; the
+final "results" event is always built from the whole output.
+"""
+
+import json
+import llm_json
+
+NDJSON = "application/x-ndjson"
+SSE = "text/event-stream"
+
+
+class RecipeStreamParser:
+    """
+        Incremental parser of one top-level JSON object fed in arbitrary text chunks.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+        self._item_start = None
+        self._items = 0
+
+    def feed(self, chunk):
+        """
+            Adds a chunk of model output; returns the events completed by it.
+        """
+        self.text += chunk
+        events = []
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            i = self._pos
+            c = text[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = _parse_value(text[self._key_start:i + 1])
+                        self._key_start = None
+                continue
+
+            if not self._stack:
+                # Before the object: only its opening brace matters.
+                if c == "{":
+                    self._stack.append("{")
+                    self._expect_key = True
+                continue
+
+            depth = len(self._stack)
+            if c == '"':
+                self._in_string = True
+                if depth == 1 and self._expect_key:
+                    self._key_start = i
+            elif c == ":" and depth == 1 and self._expect_key:
+                self._expect_key = False
+                self._value_start = i + 1
+            elif c in "{[":
+                self._stack.append(c)
+                if depth == 1 and c == "[":
+                    # A list field: its elements are reported one by one.
+                    self._item_start = i + 1
+                    self._items = 0
+            elif c in "}]":
+                if depth == 2 and self._stack[-1] == "[":
+                    self._emit_item(text[self._item_start:i], events)
+                self._stack.pop()
+                if not self._stack:
+                    self._emit_field(text[self._value_start:i] if self._value_start is not None else "", events)
+                    self.done = True
+            elif c == ",":
+                if depth == 1:
+                    self._emit_field(text[self._value_start:i], events)
+                    self._expect_key = True
+                elif depth == 2 and self._stack[-1] == "[":
+                    self._emit_item(text[self._item_start:i], events)
+                    self._item_start = i + 1
+        return events
+
+    def _emit_field(self, raw, events):
+        key, self._key, self._value_start = self._key, None, None
+        if key is None or not raw.strip():
+            return
+        value = _parse_value(raw)
+        if value is not _UNPARSED:
+            events.append({"event": "field", "key": key, "value": value})
+
+    def _emit_item(self, raw, events):
+        if not raw.strip():
+            return
+        value = _parse_value(raw)
+        if value is not _UNPARSED:
+            events.append({"event": "item", "key": self._key, "index": self._items, "value": value})
+            self._items += 1
+
+
+_UNPARSED = object()
+
+
+# One JSON value from the stream
+def _parse_value(raw):
+    try:
+        return llm_json.parse_value(raw)
+    except ValueError:
+        return _UNPARSED
+
+
+# Format one event
+def format_event(event, sse=False):
+    """
+        One NDJSON line, or one SSE message named after the event.
+    """
+    data = json.dumps(event, default=str)
+    if sse:
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
@@ -0,0 +1,175 @@
+"""
+This script:
+1. Profiles API requests with a statistical stack sampler: one daemon thread reads the stacks of
+   in-flight request threads (sys._current_frames) every interval_ms and counts them as folded
+   stacks ("root;caller;callee" -> samples), the input format of flamegraph.pl and speedscope.
+2. Samples a share of requests (sample_rate, e.g. 0.01) from start to end, and captures any
+   request running longer than slow_ms from that point on, so the slow part is on the stack dump.
+3. Keeps finished profiles (path, status, duration, stage timings from metrics.track_stage,
+   stacks) in two bounded ring buffers, "slow" and "sampled", for the admin endpoints.
+
+Requests that are neither sampled nor slow cost a dict insert and delete; nothing runs
+while both sample_rate and slow_ms are 0.
+"""
+
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from metrics import collect_stages, release_stages
+
+
+# Frame label in a folded stack
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# Folded stack of a frame
+def fold_stack(frame, max_depth=128):
+    """
+        "outermost;...;innermost" for the stack ending at frame.
+    """
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class RequestProfile:
+    """
+        One request being profiled.
+    """
+
+    def __init__(self, profile_id, thread_id, method, path, query, sampled):
+        self.id = profile_id
+        self.thread_id = thread_id
+        self.method = method
+        self.path = path
+        self.query = query
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.stacks = Counter()
+        self.stages = {}
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "sampled": self.sampled,
+            "slow": self.slow,
+            "samples": sum(self.stacks.values()),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+        }
+
+
+class RequestProfiler:
+    """
+        Per-process profiler shared by the request threads of an API worker.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=0.0, interval_ms=5.0, buffer_size=50):
+        self.sample_rate = sample_rate
+        self.slow_after = slow_ms / 1000.0 if slow_ms > 0 else None
+        self.interval = interval_ms / 1000.0
+        self.buffers = {"slow": deque(maxlen=buffer_size), "sampled": deque(maxlen=buffer_size)}
+        self._active = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    @classmethod
+    def from_config(cls, config_dict):
+        return cls(sample_rate=float(config_dict.get("profile_sample_rate", '0')),
+                   slow_ms=float(config_dict.get("profile_slow_ms", '0')),
+                   interval_ms=float(config_dict.get("profile_interval_ms", '5')),
+                   buffer_size=int(config_dict.get("profile_buffer_size", '50')))
+
+    def enabled(self):
+        return self.sample_rate > 0 or self.slow_after is not None
+
+    def _ensure_sampler(self):
+        # Started on first use, so a forked worker starts its own.
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+            self._sampler.start()
+
+    def start(self, method, path, query):
+        """
+            Registers the calling thread's request. Returns a token for finish(), None when off.
+        """
+        if not self.enabled():
+            return None
+        profile = RequestProfile(next(self._ids), threading.get_ident(), method, path, query,
+                                 sampled=random.random() < self.sample_rate)
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            self._ensure_sampler()
+        return profile, collect_stages(profile.stages)
+
+    def finish(self, token, status):
+        """
+            Stores the profile when the request was sampled or slow.
+        """
+        if token is None:
+            return
+        profile, stage_token = token
+        release_stages(stage_token)
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+        profile.duration = time.perf_counter() - profile.started
+        profile.status = status
+        profile.slow = self.slow_after is not None and profile.duration >= self.slow_after
+        if profile.slow:
+            self.buffers["slow"].append(profile)
+        elif profile.sampled:
+            self.buffers["sampled"].append(profile)
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                watched = [profile for profile in self._active.values()
+                           if profile.sampled or (self.slow_after is not None and now - profile.started >= self.slow_after)]
+            if not watched:
+                continue
+            frames = sys._current_frames()
+            for profile in watched:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.stacks[fold_stack(frame)] += 1
+
+    def profiles(self, kind=None):
+        """
+            Summaries of the stored profiles, newest first.
+        """
+        kinds = [kind] if kind else list(self.buffers)
+        found = [profile for name in kinds for profile in list(self.buffers.get(name, ()))]
+        return [profile.summary() for profile in sorted(found, key=lambda profile: -profile.id)]
+
+    def get(self, profile_id):
+        for buffer in self.buffers.values():
+            for profile in list(buffer):
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def folded(self, profiles):
+        """
+            Folded-stack text (one "stack count" line per stack) of one or more profiles.
+        """
+        merged = Counter()
+        for profile in profiles:
+            merged.update(profile.stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in merged.most_common())
@@ -0,0 +1,283 @@
+"""
+This script:
+1. Finds candidate recipes for a query embedding in an index snapshot.
+2. Adds exact ingredient matches (inverted index) and, in hybrid mode, BM25 results
+   fused with the dense results by reciprocal rank fusion.
+3. Ranks the candidates on the precomputed ingredient tokens.
+4. Widens the FAISS depth stage by stage (top_k_stages) while the best match is weak,
+   instead of handing a miss to the much slower LLM fallback.
+
+Cosine indexes (index_metric = cosine) hold L2-normalized vectors searched by inner
+product: queries go through prepare_query and scores are similarities (higher is better),
+comparable across queries, so similarity_threshold can tell a weak retrieval apart.
+
+Metadata filters arrive as a boolean mask over FAISS positions and are applied inside
+every retrieval path, so a filtered query still returns up to top_k results.
+
+Shared by api.py, embedding_service.py and the retrieval benchmarks; nothing here touches the DB.
+"""
+
+import copy
+import time
+from collections import namedtuple
+import numpy as np
+import faiss
+from sparse_index import reciprocal_rank_fusion, load_bm25_index
+from recipe_metadata import id_selector, load_recipe_metadata
+from ranking import normalize_terms, load_ranking_engine
+from ingredient_index import load_inverted_index
+from metrics import track_stage
+
+# Filters selecting at most this many recipes are scored directly instead of scanning the index.
+BRUTE_FORCE_LIMIT = 4096
+
+# positions -> FAISS positions, scores -> L2 distance / cosine similarity (dense) or fused score (hybrid)
+Candidates = namedtuple("Candidates", ["positions", "scores", "higher_is_better"])
+
+# recipe_ids -> best first, weak -> the AI should answer instead, stages -> retrieve_adaptive report
+SearchResult = namedtuple("SearchResult", ["recipe_ids", "weak", "stages"])
+
+# Artifacts loaded and swapped with every index version (IndexHolder extensions).
+INDEX_EXTENSIONS = {
+    "ranking": lambda snapshot: load_ranking_engine(snapshot.path),
+    "inverted": lambda snapshot: load_inverted_index(snapshot.path),
+    "bm25": lambda snapshot: load_bm25_index(snapshot.path),
+    "metadata": lambda snapshot: load_recipe_metadata(snapshot.path),
+}
+
+
+class RetrievalSettings:
+    """
+        Retrieval knobs read from config.ini.
+    """
+
+    def __init__(self, top_k=25, exact_match_candidates=100, mode="dense", bm25_candidates=50, rrf_k=60,
+                 top_k_stages=None, min_match_ratio=1.0, similarity_threshold=0.0):
+        self.top_k = top_k
+        self.exact_match_candidates = exact_match_candidates
+        self.mode = mode
+        self.bm25_candidates = bm25_candidates
+        self.rrf_k = rrf_k
+        self.top_k_stages = top_k_stages or [top_k]
+        self.min_match_ratio = min_match_ratio
+        self.similarity_threshold = similarity_threshold
+
+    @classmethod
+    def from_config(cls, config_dict):
+        top_k = int(config_dict.get("top_k", '25'))
+        stages = [int(k) for k in config_dict.get("top_k_stages", str(top_k)).split(",") if k.strip()]
+        return cls(top_k=top_k,
+                   exact_match_candidates=int(config_dict.get("exact_match_candidates", '100')),
+                   mode=config_dict.get("retrieval_mode", 'dense').strip().lower(),
+                   bm25_candidates=int(config_dict.get("bm25_candidates", '50')),
+                   rrf_k=int(config_dict.get("rrf_k", '60')),
+                   top_k_stages=sorted(stages),
+                   min_match_ratio=float(config_dict.get("min_match_ratio", '1.0')),
+                   similarity_threshold=float(config_dict.get("similarity_threshold", '0')))
+
+    def similar_enough(self, similarity):
+        """
+            False only when a threshold is set and a cosine index scored the results below it.
+        """
+        return similarity is None or self.similarity_threshold <= 0 or similarity >= self.similarity_threshold
+
+
+# Metric of an index
+def uses_inner_product(index):
+    return index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+# Query vector for an index
+def prepare_query(index, user_embedding):
+    """
+    Returns the embedding as float32, L2-normalized for inner-product (cosine) indexes.
+    """
+    query = np.asarray(user_embedding, dtype='float32')
+    if uses_inner_product(index):
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+    return query
+
+
+# Search FAISS positions
+def search_index(user_embedding, index, top_k=15, mask=None):
+    """
+    Returns the FAISS positions and scores of the top-k matches, best first (empty slots dropped).
+    Scores are L2 distances, or similarities for inner-product indexes.
+    With a mask, only positions where it is True are searched.
+    """
+    query = np.array([user_embedding], dtype='float32')
+    if mask is None:
+        distances, indices = index.search(query, k=top_k)
+    else:
+        selected = np.flatnonzero(mask)
+        if len(selected) <= BRUTE_FORCE_LIMIT:
+            # Few recipes pass the filter: score them directly.
+            selected_distances = candidate_distances(index, selected, user_embedding)
+            sort_keys = -selected_distances if uses_inner_product(index) else selected_distances
+            order = np.argsort(sort_keys, kind="stable")[:top_k]
+            return selected[order], selected_distances[order]
+        selector, bits = id_selector(mask)  # bits backs the selector; keep it referenced until search returns
+        distances, indices = index.search(query, k=top_k, params=faiss.SearchParameters(sel=selector))
+    positions = indices.flatten()
+    keep = positions >= 0
+    return positions[keep], distances.flatten()[keep]
+
+# Distances for candidates FAISS did not return
+def candidate_distances(index, positions, user_embedding):
+    """
+    Computes the index's score from the query to stored vectors: squared L2 distance
+    (same scale as IndexFlatL2) or inner product for inner-product indexes.
+    """
+    inner_product = uses_inner_product(index)
+    try:
+        vectors = index.reconstruct_batch(np.asarray(positions, dtype='int64'))
+    except RuntimeError:
+        # Index type that cannot reconstruct: rank these after FAISS hits with equal matches.
+        return np.full(len(positions), -np.inf if inner_product else np.inf, dtype='float32')
+    if inner_product:
+        return vectors @ np.asarray(user_embedding, dtype='float32')
+    diff = vectors - np.asarray(user_embedding, dtype='float32')
+    return np.einsum('ij,ij->i', diff, diff)
+
+# Union exact-match candidates with FAISS candidates
+def add_exact_candidates(snapshot, positions, distances, user_embedding, user_input, limit, mask=None):
+    """
+    Adds recipes that contain the user's ingredients (inverted index) to the FAISS candidates,
+    so semantic misses do not end in an AI fallback.
+    """
+    inverted = snapshot.extras.get("inverted")
+    if inverted is None:
+        return positions, distances
+
+    extra = np.setdiff1d(inverted.candidates(user_input, limit, mask), positions)
+    if len(extra) == 0:
+        return positions, distances
+
+    extra_distances = candidate_distances(snapshot.faiss_index, extra, user_embedding)
+    return np.concatenate([positions, extra]), np.concatenate([distances, extra_distances])
+
+# Dense candidates
+def retrieve_dense(snapshot, user_embedding, user_input, settings, mask=None):
+    """
+    FAISS top_k plus exact ingredient matches, scored by L2 distance or cosine similarity.
+    """
+    positions, distances = search_index(user_embedding, snapshot.faiss_index, settings.top_k, mask)
+    positions, distances = add_exact_candidates(snapshot, positions, distances, user_embedding,
+                                                user_input, settings.exact_match_candidates, mask)
+    return Candidates(positions, distances, uses_inner_product(snapshot.faiss_index))
+
+# Hybrid candidates
+def retrieve_hybrid(snapshot, user_embedding, user_input, settings, mask=None):
+    """
+    FAISS top_k and BM25 top bm25_candidates fused with RRF. Exact ingredient matches
+    missing from both lists are appended with a fused score of 0.
+    """
+    bm25 = snapshot.extras.get("bm25")
+    if bm25 is None:
+        return retrieve_dense(snapshot, user_embedding, user_input, settings, mask)
+
+    dense_positions, _ = search_index(user_embedding, snapshot.faiss_index, settings.top_k, mask)
+    sparse_positions, _ = bm25.search(user_input, settings.bm25_candidates, mask)
+    positions, scores = reciprocal_rank_fusion([dense_positions, sparse_positions], settings.rrf_k)
+
+    inverted = snapshot.extras.get("inverted")
+    if inverted is not None:
+        extra = np.setdiff1d(inverted.candidates(user_input, settings.exact_match_candidates, mask), positions)
+        positions = np.concatenate([positions, extra])
+        scores = np.concatenate([scores, np.zeros(len(extra), dtype=np.float32)])
+
+    return Candidates(positions, scores, True)
+
+# Retrieve candidates
+def retrieve(snapshot, user_embedding, user_input, settings, mask=None):
+    """
+    Candidates for the configured retrieval mode (dense or hybrid).
+    """
+    if settings.mode == "hybrid":
+        return retrieve_hybrid(snapshot, user_embedding, user_input, settings, mask)
+    return retrieve_dense(snapshot, user_embedding, user_input, settings, mask)
+
+# Rank candidates
+def rank(snapshot, candidates, user_input):
+    """
+    Ranks candidates on the snapshot's ingredient tokens (see ranking.RankingEngine).
+    """
+    return snapshot.extras["ranking"].rank(candidates.positions, candidates.scores, user_input,
+                                           higher_is_better=candidates.higher_is_better)
+
+# Similarity of the results
+def top_similarity(snapshot, ranked, user_embedding, count=5):
+    """
+    Best cosine similarity among the first `count` ranked candidates, None for L2 indexes.
+    """
+    if not ranked or not uses_inner_product(snapshot.faiss_index):
+        return None
+    positions = [candidate.position for candidate in ranked[:count]]
+    return float(np.max(candidate_distances(snapshot.faiss_index, positions, user_embedding)))
+
+# Adaptive retrieval
+def retrieve_adaptive(snapshot, user_embedding, user_input, settings, mask=None):
+    """
+    Retrieves and ranks at each depth in settings.top_k_stages (e.g. 25 -> 100 -> 500) until
+    the best candidate holds min_match_ratio of the user ingredients (and, on cosine indexes, the
+    top results reach similarity_threshold). The last stage is the cap.
+    Returns (ranked candidates, per-stage report).
+    """
+    num_terms = max(len(set(normalize_terms(user_input))), 1)
+    searchable = snapshot.faiss_index.ntotal if mask is None else int(mask.sum())
+    ranked = []
+    stages = []
+
+    for top_k in settings.top_k_stages:
+        started = time.perf_counter()
+        stage_settings = copy.copy(settings)
+        stage_settings.top_k = min(top_k, searchable)
+
+        with track_stage("faiss", top_k=stage_settings.top_k, mode=settings.mode) as stage_span:
+            candidates = retrieve(snapshot, user_embedding, user_input, stage_settings, mask)
+            stage_span.set("candidates", len(candidates.positions))
+        with track_stage("rank") as stage_span:
+            ranked = rank(snapshot, candidates, user_input)
+            stage_span.set("best_matches", ranked[0].matches if ranked else 0)
+        best_ratio = ranked[0].matches / num_terms if ranked else 0.0
+        similarity = top_similarity(snapshot, ranked, user_embedding)
+
+        stages.append({
+            "top_k": stage_settings.top_k,
+            "candidates": len(ranked),
+            "best_match_ratio": round(best_ratio, 3),
+            "top_similarity": None if similarity is None else round(similarity, 4),
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+        })
+
+        # Good enough, or nothing deeper left to search.
+        good_enough = best_ratio >= settings.min_match_ratio and settings.similar_enough(similarity)
+        if good_enough or stage_settings.top_k >= searchable:
+            break
+
+    return ranked, stages
+
+# Mask for /search filters
+def filter_mask(snapshot, recipe_filter):
+    """
+    Boolean mask over FAISS positions for a RecipeFilter, None when the filter is empty.
+    Raises ValueError when the index version has no recipe metadata.
+    """
+    if recipe_filter.is_empty():
+        return None
+    metadata = snapshot.extras.get("metadata")
+    if metadata is None:
+        raise ValueError("Filters need an index built with recipe metadata; rebuild the index.")
+    return metadata.mask(recipe_filter)
+
+# Ranked recipe ids for a query
+def search_recipes(snapshot, user_embedding, user_input, settings, mask=None, limit=5):
+    """
+    Adaptive retrieval and ranking mapped to the top `limit` recipe ids. The result is weak when
+    no candidate has a user ingredient or the top similarity is below similarity_threshold.
+    """
+    ranked, stages = retrieve_adaptive(snapshot, user_embedding, user_input, settings, mask)
+    similarity = stages[-1]["top_similarity"] if stages else None
+    weak = not any(candidate.matches for candidate in ranked) or not settings.similar_enough(similarity)
+    return SearchResult([int(snapshot.recipe_ids[candidate.position]) for candidate in ranked[:limit]], weak, stages)
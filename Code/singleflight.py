@@ -0,0 +1,86 @@
+"""
+This script:
+1. Collapses concurrent identical calls: the first caller of a key (the leader) runs the
+   function, callers arriving with the same key while it runs (followers) wait for its result
+   instead of repeating the work. The key is forgotten as soon as the call returns, so nothing
+   is cached beyond the calls in flight.
+2. Hands every caller its own deep copy of the result when copy_result is set (for results the
+   callers go on to mutate); exceptions of the leader reach every caller of the key.
+3. Counts leaders and followers per group (metrics.py).
+
+Used by api.py for /search, by llm_queue.py for LLM prompts (/search fallback, /surprise themes)
+and by fetch_images.main for Unsplash lookups.
+
+Usage:
+    flights = SingleFlight("search", copy_result=True)
+    body, shared = flights.do(key, compute_body, query)
+"""
+
+import copy
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from metrics import SINGLEFLIGHT_CALLS
+from tracing import span
+
+
+class FlightTimeout(TimeoutError):
+    """
+        A follower's wait for the shared call ran out.
+    """
+
+
+class SingleFlight:
+    """
+        In-flight calls of one group, keyed by any hashable value.
+    """
+
+    def __init__(self, name, copy_result=False):
+        self.name = name
+        self.copy_result = copy_result
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._leader_calls = SINGLEFLIGHT_CALLS.labels(name, "leader")
+        self._follower_calls = SINGLEFLIGHT_CALLS.labels(name, "follower")
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, function, *args, timeout=None, **kwargs):
+        """
+            function(*args, **kwargs), shared with the concurrent callers of key.
+            Returns (result, shared): shared is True when this caller waited for another's call.
+            timeout (seconds) bounds a follower's wait: FlightTimeout when it runs out (the
+            leader's call goes on).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+
+        if not leader:
+            self._follower_calls.inc()
+            with span("singleflight.wait", group=self.name):
+                try:
+                    result = call.result(timeout=timeout)
+                except FutureTimeout:
+                    raise FlightTimeout(f"Shared {self.name} call still running after {timeout}s") from None
+            return self._copy(result), True
+
+        self._leader_calls.inc()
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return self._copy(result), False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def _copy(self, result):
+        return copy.deepcopy(result) if self.copy_result else result
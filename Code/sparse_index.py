@@ -0,0 +1,156 @@
+"""
+This script:
+1. Builds a BM25 index over recipe ingredients and names while the FAISS index is built.
+2. Saves it next to the FAISS index (bm25.npz + bm25_vocab.txt).
+3. Scores user ingredients against it and fuses the result with dense results
+   using reciprocal rank fusion (RRF).
+
+BM25 weights are precomputed per (recipe, term), so a query is just a sum of a few
+sparse columns of a CSC matrix (rows = FAISS positions, columns = terms).
+"""
+
+import os
+import re
+from array import array
+import numpy as np
+import scipy.sparse as sp
+from ranking import normalize_ingredient
+
+MATRIX_FILE = "bm25.npz"
+VOCAB_FILE = "bm25_vocab.txt"
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+# Analyze text into terms
+def analyze(ingredients, name=""):
+    """
+        Terms for BM25: every word of the ingredients and name, plus each whole
+        normalized ingredient ("chicken breast" -> chicken, breast, chickenbreast).
+    """
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    terms = []
+    for ingredient in ingredients or []:
+        words = WORD_PATTERN.findall(str(ingredient).lower())
+        terms.extend(words)
+        if len(words) > 1:
+            terms.append(normalize_ingredient(ingredient))
+    if isinstance(name, str):
+        terms.extend(WORD_PATTERN.findall(name.lower()))
+    return terms
+
+
+class BM25Index:
+    """
+        CSC matrix of BM25 weights (FAISS position x term).
+    """
+
+    def __init__(self, matrix, vocab):
+        self.matrix = matrix
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+
+    def scores(self, user_input, mask=None):
+        """
+            Returns (positions, scores) of every recipe sharing a term with the query
+            (and passing the boolean mask, if given).
+        """
+        columns = sorted({self.term_ids[term] for term in analyze(user_input) if term in self.term_ids})
+        if not columns:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        sub = self.matrix[:, columns].tocoo()
+        totals = np.bincount(sub.row, weights=sub.data, minlength=self.matrix.shape[0])
+        if mask is not None:
+            totals[~mask] = 0.0
+        positions = np.flatnonzero(totals)
+        return positions, totals[positions].astype(np.float32)
+
+    def search(self, user_input, top_k=50, mask=None):
+        """
+            Returns the top_k (positions, scores), best first.
+        """
+        positions, scores = self.scores(user_input, mask)
+        if len(positions) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            positions, scores = positions[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return positions[order], scores[order]
+
+
+class BM25Writer:
+    """
+        Collects term counts while the index is built and saves BM25 weights next to it.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_ids = {}
+        self.rows = array('i')
+        self.cols = array('i')
+        self.counts = array('f')
+        self.doc_lengths = array('i')
+
+    def add(self, chunk):
+        names = chunk.get('name') or [""] * len(chunk['ingredients_tokenized'])
+        for ingredients, name in zip(chunk['ingredients_tokenized'], names):
+            position = len(self.doc_lengths)
+            terms = analyze(ingredients, name)
+            term_counts = {}
+            for term in terms:
+                term_counts[term] = term_counts.get(term, 0) + 1
+            for term, count in term_counts.items():
+                self.rows.append(position)
+                self.cols.append(self.term_ids.setdefault(term, len(self.term_ids)))
+                self.counts.append(count)
+            self.doc_lengths.append(len(terms))
+
+    def save(self, index_path):
+        rows = np.frombuffer(self.rows, dtype=np.int32)
+        cols = np.frombuffer(self.cols, dtype=np.int32)
+        tf = np.frombuffer(self.counts, dtype=np.float32)
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32).astype(np.float32)
+        n_docs = len(doc_lengths)
+
+        avg_length = doc_lengths.mean() if n_docs else 0.0
+        doc_freq = np.bincount(cols, minlength=len(self.term_ids)).astype(np.float32)
+        idf = np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        norm = self.k1 * (1.0 - self.b + self.b * doc_lengths[rows] / max(avg_length, 1e-6))
+        weights = (idf[cols] * tf * (self.k1 + 1.0) / (tf + norm)).astype(np.float32)
+
+        matrix = sp.csc_matrix((weights, (rows, cols)), shape=(n_docs, len(self.term_ids)))
+        sp.save_npz(os.path.join(index_path, MATRIX_FILE), matrix)
+
+        vocab = sorted(self.term_ids, key=self.term_ids.get)
+        with open(os.path.join(index_path, VOCAB_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(vocab) + "\n")
+        print(f"Saved BM25 index ({len(vocab)} terms, {matrix.nnz} weights).")
+
+
+# Load the BM25 index for an index version
+def load_bm25_index(index_path):
+    """
+        Loads bm25.npz and its vocab from an index folder, None if the version has none.
+    """
+    matrix_path = os.path.join(index_path, MATRIX_FILE)
+    if not os.path.exists(matrix_path):
+        return None
+    with open(os.path.join(index_path, VOCAB_FILE), encoding="utf-8") as f:
+        vocab = [line.rstrip("\n") for line in f]
+    return BM25Index(sp.load_npz(matrix_path).tocsc(), vocab)
+
+
+# Reciprocal rank fusion
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """
+        Fuses lists of positions (best first): score = sum of 1 / (k + rank).
+        Returns (positions, fused scores), best first.
+    """
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, position in enumerate(np.asarray(ranked).tolist()):
+            fused[position] = fused.get(position, 0.0) + 1.0 / (k + rank + 1)
+
+    positions = sorted(fused, key=fused.get, reverse=True)
+    return np.array(positions, dtype=np.int64), np.array([fused[p] for p in positions], dtype=np.float32)
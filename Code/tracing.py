@@ -0,0 +1,309 @@
+"""
+This script:
+1. Records spans (trace id, span id, parent, name, start / end, attributes, error) for sampled
+   requests. The current span lives in a context variable, so nested calls (stages, DB, Ollama,
+   Unsplash) attach to the request's trace without passing it around.
+2. Propagates the trace with a W3C traceparent: as an HTTP header to the Ollama HTTP API and the
+   embedding service (which continues the trace), and as TRACEPARENT in the Ollama CLI's environment.
+3. Exports finished spans from a background thread, as JSON lines (trace_exporter = jsonl, to
+   trace_file) or OTLP/HTTP JSON to a local collector (trace_exporter = otlp, to otlp_endpoint).
+
+With trace_sample_rate = 0 (default) and no sampled incoming traceparent, span() is a context
+variable read returning a shared no-op span.
+
+Usage:
+    tracing.configure(config_dict, "recipe-api")
+    root = tracing.start_trace("GET /search", traceparent=request.headers.get("traceparent"))
+    with tracing.span("unsplash.search", query=query) as span:
+        span.set("status_code", 200)
+    root.end()
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import requests
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class NoopSpan:
+    """
+        Stands in for a span when the request is not traced.
+    """
+    recording = False
+    trace_id = None
+
+    def set(self, key, value):
+        return self
+
+    def set_error(self, error, detail=True):
+        return self
+
+    def traceparent(self):
+        return None
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Span:
+    recording = True
+
+    def __init__(self, tracer, name, trace_id, parent_id, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._token = _current_span.set(self)
+
+    def set(self, key, value):
+        self.attributes[key] = value
+        return self
+
+    def set_error(self, error, detail=True):
+        self.error = f"{type(error).__name__}: {error}" if detail else type(error).__name__
+        return self
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self):
+        """
+            Ends the span, makes its parent current again and queues it for export.
+        """
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended in another context (e.g. a thread it was handed to): leave that context alone.
+            pass
+        self.tracer.export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": self.tracer.service_name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+# W3C traceparent
+def parse_traceparent(value):
+    """
+        (trace id, parent span id, sampled) of a traceparent header, None when malformed.
+    """
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class JsonLinesExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+class OtlpJsonExporter:
+    """
+        OTLP/HTTP with JSON encoding (e.g. an OpenTelemetry Collector on :4318/v1/traces).
+    """
+
+    def __init__(self, endpoint, timeout=2.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    @staticmethod
+    def _value(value):
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _span(self, span):
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": self._value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    def export(self, spans):
+        by_service = {}
+        for span in spans:
+            by_service.setdefault(span.tracer.service_name, []).append(self._span(span))
+        body = {"resourceSpans": [
+            {"resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+             "scopeSpans": [{"scope": {"name": "recipe_generator"}, "spans": encoded}]}
+            for service, encoded in by_service.items()
+        ]}
+        self.session.post(self.endpoint, json=body, timeout=self.timeout).raise_for_status()
+
+
+class Tracer:
+    """
+        Sampling decision, span creation and the export thread of one process.
+    """
+
+    def __init__(self, service_name="recipe-generator", sample_rate=0.0, exporter=None,
+                 batch_size=256, flush_interval=1.0, max_queue=10000):
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def start_trace(self, name, traceparent=None, **attributes):
+        """
+            Root span of a request (or the continuation of the caller's trace), NOOP_SPAN when not sampled.
+        """
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = None, None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled or self.exporter is None:
+            return NOOP_SPAN
+        return Span(self, name, trace_id or os.urandom(16).hex(), parent_id, attributes)
+
+    def export(self, span):
+        with self._lock:
+            # Started on first use, so a forked worker starts its own.
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                self._worker.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                print(f"Trace export failed, dropped {len(batch)} spans: {e}")
+
+
+# Process-wide tracer (off until configure)
+tracer = Tracer()
+
+
+def configure(config_dict, service_name):
+    """
+        Sets up the process tracer from config.ini ([TRACING]).
+    """
+    tracer.service_name = service_name
+    tracer.sample_rate = float(config_dict.get("trace_sample_rate", '0'))
+    kind = config_dict.get("trace_exporter", 'jsonl').strip().lower()
+    if kind == "otlp":
+        tracer.exporter = OtlpJsonExporter(config_dict.get("otlp_endpoint", "http://localhost:4318/v1/traces"))
+    elif kind == "jsonl":
+        tracer.exporter = JsonLinesExporter(os.path.join(config_dict.get("base_directory", ""),
+                                                         config_dict.get("trace_file", "traces.jsonl")))
+    else:
+        raise ValueError(f"Unknown trace_exporter {kind!r}, use jsonl or otlp")
+    return tracer
+
+
+def start_trace(name, traceparent=None, **attributes):
+    return tracer.start_trace(name, traceparent, **attributes)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+# Child span of the current one
+@contextmanager
+def span(name, error_detail=True, **attributes):
+    """
+        Child of the current span for the block (NOOP_SPAN outside a traced request).
+        An exception leaving the block is recorded on the span (only its type with
+        error_detail=False, e.g. when the message holds a URL with credentials) and re-raised.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+    child = Span(parent.tracer, name, parent.trace_id, parent.span_id, attributes)
+    try:
+        yield child
+    except BaseException as e:
+        child.set_error(e, error_detail)
+        raise
+    finally:
+        child.end()
+
+
+def traceparent():
+    """
+        traceparent of the current span, None when not traced.
+    """
+    return current_span().traceparent()
+
+
+def trace_headers():
+    """
+        HTTP headers carrying the current trace to an internal service ({} when not traced).
+    """
+    value = traceparent()
+    return {"traceparent": value} if value else {}
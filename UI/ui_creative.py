@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import urllib.parse
+import json
 from uuid import uuid4
 import re
 import os
@@ -75,7 +76,7 @@ st.markdown(
 
 # ------------------ HELPERS ------------------ #
 @st.cache_data(show_spinner=False)
-def fetch_recipes(ingredients_list):
+def fetch_recipes_plain(ingredients_list):
     if not ingredients_list:
         return []
     base_url = "http://localhost:5000/search"
@@ -124,6 +125,87 @@ def fetch_surprise_recipe(ingredients):
         st.error(f"Couldn’t get a surprise recipe – {e}")
         return demo_recipes
 
+# ---------------STREAMED RECIPES -----------------#
+def render_partial_recipe(partial, placeholder):
+    """
+    Draw the recipe fields received so far into `placeholder`.
+    """
+    with placeholder.container():
+        st.subheader(partial.get("generic_name") or "Cooking up something special…")
+        if partial.get("description"):
+            st.caption(partial["description"])
+        if partial.get("ingredient"):
+            st.markdown("".join(f"<span class='badge'>{ing}</span>" for ing in partial["ingredient"]),
+                        unsafe_allow_html=True)
+        for idx, step in enumerate(partial.get("steps", []), 1):
+            st.markdown(f"<div class='step'><strong>Step {idx}:</strong> {step}</div>", unsafe_allow_html=True)
+
+
+def read_recipe_stream(url, placeholder):
+    """
+    Results of a streaming endpoint (/search/stream, /surprise/stream). Name, ingredients and
+    steps of an AI recipe show up in `placeholder` while the model writes them.
+    Raises when the stream fails or ends without results.
+    """
+    partial = {}
+    os.write(1, f"URL GENERATED : {url}\n".encode())
+    with requests.get(url, stream=True, timeout=(5, 180)) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["event"] == "item":
+                # list fields (ingredient, steps) grow element by element
+                partial.setdefault(event["key"], [])[event["index"]:] = [event["value"]]
+            elif event["event"] == "field":
+                partial[event["key"]] = event["value"]
+            elif event["event"] == "results":
+                return event.get("results", [])
+            elif event["event"] == "error":
+                raise RuntimeError(event["error"])
+            render_partial_recipe(partial, placeholder)
+    raise RuntimeError("stream ended without results")
+
+
+def stream_surprise_recipe(ingredients, placeholder):
+    """
+    Same as fetch_surprise_recipe, over /surprise/stream (see read_recipe_stream).
+    Falls back to fetch_surprise_recipe when the stream fails.
+    """
+    base = "http://localhost:5000/surprise/stream"
+    query = urllib.parse.urlencode([("ingredients", ing) for ing in ingredients])
+    url   = f"{base}?{query}" if query else base
+
+    try:
+        return read_recipe_stream(url, placeholder) or demo_recipes
+    except Exception as e:
+        os.write(1, f"Streaming failed, falling back: {e}\n".encode())
+    finally:
+        placeholder.empty()
+    return fetch_surprise_recipe(ingredients)
+
+
+def fetch_recipes(ingredients_list, placeholder):
+    """
+    Search over /search/stream: when the search falls back to an AI recipe, it shows up in
+    `placeholder` while the model writes it (see read_recipe_stream).
+    Falls back to fetch_recipes_plain (/search) when the stream fails.
+    """
+    if not ingredients_list:
+        return []
+    base_url = "http://localhost:5000/search/stream"
+    params = [("ingredients", ing) for ing in ingredients_list]
+    url = f"{base_url}?{urllib.parse.urlencode(params)}"
+
+    try:
+        return read_recipe_stream(url, placeholder) or demo_recipes  # Fall back to demo data
+    except Exception as e:
+        os.write(1, f"Streaming failed, falling back: {e}\n".encode())
+    finally:
+        placeholder.empty()
+    return fetch_recipes_plain(ingredients_list)
+
 def reset_selection():
     if "selected_recipe" in st.session_state:
         del st.session_state["selected_recipe"]
@@ -585,8 +667,7 @@ if surprise_click:
     )
 
     reset_selection()
-    with st.spinner("Cooking up something special…"):
-        results = fetch_surprise_recipe(ingredients)   # <- pass list here
+    results = stream_surprise_recipe(ingredients, st.empty())   # <- pass list here
     st.session_state["search_results"] = results
     st.session_state["search_ns"] = str(uuid4())
     # st.rerun()                            # show the new recipe immediately
@@ -601,7 +682,7 @@ if submitted and user_query:
         if " " in single:
             ingredients = [x.strip() for x in single.split(" ") if x.strip()]
     with st.spinner("Searching …"):
-        results = fetch_recipes(ingredients)
+        results = fetch_recipes(ingredients, st.empty())
 
     # 🔑 Persist the results **and** a stable namespace
     st.session_state["search_results"] = results